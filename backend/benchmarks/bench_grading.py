@@ -0,0 +1,273 @@
+# benchmarks/bench_grading.py - Offline end-to-end grading benchmark
+#
+# Runs the grading pipeline (prepare_submission in the CPU pool, then
+# perform_ocr_advanced and a deterministic stand-in for the GPT comparator)
+# over a directory of sheets and checks the answers against ground truth.
+# No Firestore or network access is needed.
+#
+# Ground truth JSON:
+#   {
+#     "regions": [{"type": "mcq", "x": .., "y": .., "width": .., "height": ..}, ...],
+#     "num_mcq": 20,
+#     "options_per_question": 5,
+#     "target_size": [1275, 1650],          (optional)
+#     "detect_paper": false,                (optional)
+#     "omr_config": {"fiducials": true},    (optional, align on corner markers;
+#                                            "bubbles" samples printed bubble centers)
+#     "sheets": {
+#       "sheet_001.jpg": {"mcq": {"1": "A", "2": "BLANK", ...}, "written": ["answer text", ...]},
+#       ...
+#     }
+#   }
+# A sheet may carry its own "regions" to override the shared ones.
+# utils/sheet_generator.py writes sheets together with a truth.json in this format.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_grading SHEETS_DIR --truth truth.json
+#       [--workers N] [--skip-ocr] [--output results.json] [--compare previous.json]
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from utils.cpu_pipeline import CPUStageExecutor
+from utils.grading_stages import prepare_submission
+from utils.metrics import collect_timings, span
+from utils.omr_calibration import CALIBRATION_MODE
+
+OCR_MODEL = "kazars24/trocr-base-handwritten-ru"
+DEFAULT_OMR = {'bubble_threshold': 0.70, 'min_bubble_area': 30}
+
+
+def levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def char_error_rate(predicted: str, expected: str) -> float:
+    expected = expected.strip()
+    if not expected:
+        return 0.0 if not predicted.strip() else 1.0
+    return levenshtein(predicted.strip(), expected) / len(expected)
+
+
+def stub_comparator(student_answer: str, correct_answer: str, question_text: str = "") -> float:
+    """Deterministic stand-in for compare_answers_with_gpt: 1 - CER, clipped"""
+    with span('comparator'):
+        return max(0.0, 1.0 - char_error_rate(student_answer, correct_answer))
+
+
+def load_ocr_model():
+    # OCR imports torch, so it is only loaded when OCR is enabled
+    import torch
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+    from utils.ocr_detection import initialize_ocr_model
+
+    processor = TrOCRProcessor.from_pretrained(OCR_MODEL)
+    model = VisionEncoderDecoderModel.from_pretrained(OCR_MODEL)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)
+    model.eval()
+    initialize_ocr_model(processor, model, device)
+
+
+def build_jobs(sheets_dir: str, truth: Dict) -> List[tuple]:
+    jobs = []
+    for name in sorted(truth['sheets']):
+        expected = truth['sheets'][name]
+        regions = expected.get('regions', truth['regions'])
+        jobs.append((name, ({
+            'submission_id': os.path.splitext(name)[0],
+            'image_path': os.path.join(sheets_dir, name),
+            'regions': regions,
+            'num_mcq': truth['num_mcq'],
+            'options_per_question': truth.get('options_per_question', 5),
+            'num_written': len(expected.get('written', [])),
+            'target_size': tuple(truth.get('target_size', (1275, 1650))),
+            'detect_paper': truth.get('detect_paper', False),
+            'fiducials': truth.get('omr_config', {}).get('fiducials', False),
+            'bubbles': truth.get('omr_config', {}).get('bubbles'),
+            'bubble_radius': truth.get('omr_config', {}).get('bubble_radius'),
+            'omr': truth.get('omr', DEFAULT_OMR),
+            # Per-sheet fits only: no exam threshold is carried between sheets here
+            'omr_calibration': {'mode': CALIBRATION_MODE},
+            'save_debug': False
+        },)))
+    return jobs
+
+
+def inference_stage(prepared: Dict, expected: Dict, skip_ocr: bool) -> Dict:
+    """OCR + comparison on the prepared crops; returns texts, similarities and timings"""
+    if not skip_ocr:
+        from utils.ocr_detection import perform_ocr_advanced
+    with collect_timings() as timings:
+        texts, similarities = [], []
+        for crop in prepared.get('written', []):
+            if skip_ocr:
+                continue
+            text = perform_ocr_advanced(Image.fromarray(crop['image']), batch_size=8, binary=crop['binary'])['text']
+            texts.append(text)
+            similarities.append(stub_comparator(text, expected['written'][crop['index']]))
+    return {'texts': texts, 'similarities': similarities, 'timings': timings}
+
+
+def score_sheet(name: str, prepared: Dict, inference: Dict, expected: Dict) -> Dict:
+    sheet = {'sheet': name}
+    if prepared.get('error'):
+        sheet['error'] = prepared['error']
+        return sheet
+
+    expected_mcq = expected.get('mcq') or {}
+    detected = (prepared.get('mcq') or {}).get('answers') or {}
+    if expected_mcq:
+        wrong = {q: {'expected': a, 'detected': detected.get(q, 'BLANK')}
+                 for q, a in expected_mcq.items() if detected.get(q, 'BLANK') != a}
+        sheet['mcq_correct'] = len(expected_mcq) - len(wrong)
+        sheet['mcq_total'] = len(expected_mcq)
+        sheet['mcq_errors'] = wrong
+
+    if inference['texts']:
+        sheet['cer'] = [round(char_error_rate(t, e), 4) for t, e in zip(inference['texts'], expected['written'])]
+    return sheet
+
+
+def summarize_timings(all_timings: List[Dict[str, List[float]]]) -> Dict:
+    merged: Dict[str, List[float]] = {}
+    for timings in all_timings:
+        for stage, values in (timings or {}).items():
+            merged.setdefault(stage, []).extend(values)
+    return {
+        stage: {
+            'count': len(values),
+            'p50_ms': round(float(np.percentile(values, 50)) * 1000, 2),
+            'p95_ms': round(float(np.percentile(values, 95)) * 1000, 2),
+            'total_s': round(sum(values), 3)
+        }
+        for stage, values in sorted(merged.items())
+    }
+
+
+def peak_rss_mb() -> Dict:
+    # ru_maxrss is in KiB on Linux; RUSAGE_CHILDREN covers the pool workers
+    return {
+        'main': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'largest_worker': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> Dict:
+    with open(args.truth) as f:
+        truth = json.load(f)
+    jobs = build_jobs(args.sheets_dir, truth)
+
+    if not args.skip_ocr:
+        load_ocr_model()
+
+    executor = CPUStageExecutor(max_workers=args.workers)
+    # Start the workers before the clock so spawn cost isn't counted as grading time
+    await asyncio.gather(*(executor.run(os.getpid) for _ in range(executor.max_workers)))
+
+    sheets, all_timings = [], []
+    start = time.perf_counter()
+    async for name, prepared, error in executor.stream(prepare_submission, jobs):
+        expected = truth['sheets'][name]
+        if error is not None:
+            sheets.append({'sheet': name, 'error': str(error)})
+            continue
+        inference = inference_stage(prepared, expected, args.skip_ocr)
+        all_timings += [prepared.get('timings'), inference['timings']]
+        sheets.append(score_sheet(name, prepared, inference, expected))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    mcq_correct = sum(s.get('mcq_correct', 0) for s in sheets)
+    mcq_total = sum(s.get('mcq_total', 0) for s in sheets)
+    cers = [c for s in sheets for c in s.get('cer', [])]
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {'sheets': len(jobs), 'workers': executor.max_workers, 'skip_ocr': args.skip_ocr},
+        'papers_per_sec': round(len(jobs) / elapsed, 3) if elapsed else None,
+        'elapsed_s': round(elapsed, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'accuracy': {
+            'mcq': round(mcq_correct / mcq_total, 4) if mcq_total else None,
+            'mcq_answers': mcq_total,
+            'written_mean_cer': round(float(np.mean(cers)), 4) if cers else None,
+            'errors': sum('error' in s for s in sheets)
+        },
+        'stages': summarize_timings(all_timings),
+        'sheets': sheets
+    }
+
+
+def print_report(result: Dict, previous: Dict = None):
+    def delta(now, before, lower_is_better=True):
+        if before in (None, 0) or now is None:
+            return ""
+        change = (now - before) / before * 100
+        better = change < 0 if lower_is_better else change > 0
+        return f"  ({change:+.1f}% {'better' if better else 'worse'} than {previous['commit']})"
+
+    prev_stages = (previous or {}).get('stages', {})
+    print(f"commit {result['commit']}: {result['config']['sheets']} sheets, "
+          f"{result['config']['workers']} workers")
+    print(f"papers/sec:   {result['papers_per_sec']}"
+          f"{delta(result['papers_per_sec'], (previous or {}).get('papers_per_sec'), lower_is_better=False)}")
+    print(f"peak RSS:     {result['peak_rss_mb']['main']} MB main, "
+          f"{result['peak_rss_mb']['largest_worker']} MB largest worker")
+    accuracy = result['accuracy']
+    print(f"MCQ accuracy: {accuracy['mcq']} over {accuracy['mcq_answers']} answers; "
+          f"written CER: {accuracy['written_mean_cer']}; sheet errors: {accuracy['errors']}")
+    print(f"{'stage':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage, s in result['stages'].items():
+        print(f"{stage:<18}{s['count']:>7}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}"
+              f"{delta(s['p95_ms'], prev_stages.get(stage, {}).get('p95_ms'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline grading speed and accuracy benchmark")
+    parser.add_argument("sheets_dir")
+    parser.add_argument("--truth", required=True, help="Ground-truth JSON (see module header)")
+    parser.add_argument("--workers", type=int, default=None, help="CPU stage processes (default: cores)")
+    parser.add_argument("--skip-ocr", action="store_true", help="Skip TrOCR (no model download)")
+    parser.add_argument("--output", default="bench_grading.json")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    print_report(result, previous)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# benchmarks/bench_health_under_upload.py - Event-loop responsiveness under upload load
+#
+# Drives the real app in-process (httpx ASGITransport, no model loading) with
+# concurrent phone-sized uploads to /api/exams/submit and /api/validate-paper
+# while a probe polls /health. If any handler blocks the event loop on disk or
+# image work, /health latency climbs with the upload load.
+#
+# Firestore is the in-memory fake and everything is written to a temporary
+# directory.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_health_under_upload [--clients 16] [--seconds 10]
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.load_submit_burst import make_photo
+
+
+def ms(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+async def probe_health(client, stop: asyncio.Event, interval: float = 0.02):
+    """
+    Poll /health on a fixed schedule. Latency counts from when the request was
+    due, not when the probe got to run: an in-process probe can't send while
+    the loop is blocked, but an external client would be waiting all along.
+    """
+    latencies = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        response = await client.get("/health")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - due)
+        due = max(due + interval, time.perf_counter())
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+    return latencies
+
+
+async def upload_client(client, client_id: int, exam_code: str, photo: bytes, stop: asyncio.Event, counts: dict):
+    n = 0
+    while not stop.is_set():
+        files = {"file": ("sheet.jpg", photo, "image/jpeg")}
+        response = await client.post("/api/validate-paper", files=files)
+        counts['validate'] += 1
+        counts['errors'] += response.status_code >= 500
+
+        # Each submit is a new student, so it's accepted rather than a duplicate
+        files = {"test_image": ("exam_answer.jpg", photo, "image/jpeg")}
+        response = await client.post(
+            "/api/exams/submit",
+            data={"exam_code": exam_code},
+            files=files,
+            headers={"X-Bench-Student": f"c{client_id}-{n}"}
+        )
+        counts['submit'] += 1
+        counts['errors'] += response.status_code >= 500
+        n += 1
+
+
+async def run(args):
+    import httpx
+    from fastapi import Request
+
+    import auth
+    import main
+    from routes import submission_routes
+    from utils.cpu_pipeline import get_cpu_executor
+    from utils.exam_codes import create_exam_with_code
+    from benchmarks.fake_firestore import FakeFirestore
+
+    db = FakeFirestore()
+    auth.db = db
+    _, exam_code = create_exam_with_code(db, {'title': 'Bench', 'is_active': True, 'total_points': 10})
+
+    def bench_student(request: Request):
+        uid = request.headers.get("X-Bench-Student", "bench")
+        return {'uid': uid, 'email': f"{uid}@example.com"}
+
+    main.app.dependency_overrides[auth.require_student] = bench_student
+    photo = make_photo(0)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        # Idle baseline
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, stop))
+        await asyncio.sleep(2)
+        stop.set()
+        idle = await probe
+
+        # Under load
+        counts = {'validate': 0, 'submit': 0, 'errors': 0}
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_health(client, stop))
+        uploaders = [
+            asyncio.create_task(upload_client(client, i, exam_code, photo, stop, counts))
+            for i in range(args.clients)
+        ]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        loaded = await probe
+        await asyncio.gather(*uploaders)
+
+    pipeline = submission_routes.get_ingest_pipeline()
+    await pipeline.drain()
+    await pipeline.stop()
+    get_cpu_executor().shutdown()
+
+    print(f"upload clients:        {args.clients} for {args.seconds:.0f} s ({len(photo) / 1e6:.1f} MB photos)")
+    print(f"requests completed:    {counts['validate']} validate-paper, {counts['submit']} submit, "
+          f"{counts['errors']} 5xx")
+    print(f"/health idle:          p50 {ms(idle, 50):.1f} ms, p99 {ms(idle, 99):.1f} ms")
+    print(f"/health under load:    p50 {ms(loaded, 50):.1f} ms, p99 {ms(loaded, 99):.1f} ms, "
+          f"max {max(loaded, default=0) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/health latency under concurrent uploads")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # main creates its upload directories relative to the working directory
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
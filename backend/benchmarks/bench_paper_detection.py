@@ -0,0 +1,70 @@
+# benchmarks/bench_paper_detection.py - Latency of paper corner detection per image
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_paper_detection [image_dir] [--repeat N]
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from utils.paper_detection import PaperDetector
+
+
+def time_call(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def legacy_find(detector: PaperDetector, img: np.ndarray):
+    """The previous path: 1500px search with a full sort, no refinement"""
+    small, scale = detector._downscale(img, detector.FULL_MAX_DIM)
+    return detector._find_paper_contour(small)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paper corner detection latency")
+    parser.add_argument("image_dir", nargs="?", default="uploads/submissions")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(
+        p for ext in ("*.jpg", "*.jpeg", "*.png")
+        for p in glob.glob(os.path.join(args.image_dir, ext))
+    )
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    detector = PaperDetector()
+    legacy_times, fast_times = [], []
+
+    print(f"{'image':<60} {'legacy ms':>10} {'fast ms':>10} {'found':>6}")
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+
+        legacy_ms = time_call(lambda: legacy_find(detector, img), args.repeat)
+        fast_ms = time_call(lambda: detector.find_paper_corners(img), args.repeat)
+        found = detector.find_paper_corners(img) is not None
+
+        legacy_times.append(legacy_ms)
+        fast_times.append(fast_ms)
+        print(f"{os.path.basename(path)[:60]:<60} {legacy_ms:>10.1f} {fast_ms:>10.1f} {str(found):>6}")
+
+    print()
+    for name, times in (("legacy", legacy_times), ("fast", fast_times)):
+        print(f"{name:<8} p50={np.percentile(times, 50):.1f} ms  p95={np.percentile(times, 95):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
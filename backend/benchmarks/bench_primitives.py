@@ -0,0 +1,173 @@
+# benchmarks/bench_primitives.py - Microbenchmarks for the OMR and segmentation hot paths
+#
+# Times OMRDetector.preprocess_image / detect_bubbles / _fit_grid / _group_into_rows,
+# detect_lines, detect_words, resize_for_model and
+# PaperDetector._find_paper_contour on synthetic inputs, parametrized by
+# question count, options per question, noise and resolution so scaling
+# behaviour shows up in the table. Each case is warmed up once, then run
+# for at least --min-rounds rounds and --min-time seconds (pytest-benchmark
+# style: min / median / mean / stddev).
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_primitives [--only detect_bubbles] [--quick] [--json out.json]
+
+import argparse
+import itertools
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from utils.image_ops import preprocess_image
+from utils.ocr_detection import detect_lines, detect_words, resize_for_model
+from utils.omr_detection import OMRDetector
+from utils.paper_detection import PaperDetector
+
+QUESTIONS = (20, 50, 100)
+OPTIONS = (4, 5)
+NOISE = (0.0, 0.08)
+SCALES = (0.5, 1.0, 2.0)
+
+
+# ---------- synthetic inputs ----------
+
+def _add_noise(img: np.ndarray, noise: float, rng) -> np.ndarray:
+    if noise <= 0:
+        return img
+    jitter = rng.normal(0, noise * 255, img.shape)
+    return np.clip(img.astype(np.float32) + jitter, 0, 255).astype(np.uint8)
+
+
+def synthetic_mcq_block(questions: int, options: int, noise: float, scale: float, seed: int = 0) -> np.ndarray:
+    """A bubble grid with one filled bubble per row"""
+    rng = np.random.default_rng(seed)
+    radius, dx, dy, margin = 12 * scale, 45 * scale, 38 * scale, 30 * scale
+    width = int(2 * margin + dx * (options - 1) + 2 * radius)
+    height = int(2 * margin + dy * (questions - 1) + 2 * radius)
+    img = np.full((height, width, 3), 245, dtype=np.uint8)
+    thickness = max(1, int(round(2 * scale)))
+    for q in range(questions):
+        filled = rng.integers(0, options)
+        for o in range(options):
+            center = (int(margin + radius + o * dx), int(margin + radius + q * dy))
+            cv2.circle(img, center, int(radius), (60, 60, 60), thickness)
+            if o == filled:
+                cv2.circle(img, center, int(radius * 0.85), (35, 35, 35), -1)
+    return _add_noise(img, noise, rng)
+
+
+def synthetic_written_block(lines: int, noise: float, scale: float, seed: int = 0) -> np.ndarray:
+    """Handwriting-like script text on ruled-free paper"""
+    rng = np.random.default_rng(seed)
+    width, line_height = int(800 * scale), int(60 * scale)
+    img = np.full((line_height * lines + int(20 * scale), width, 3), 245, dtype=np.uint8)
+    words = ["answer", "sheet", "grading", "testly", "exam", "word", "line", "mongol"]
+    for i in range(lines):
+        text = " ".join(rng.choice(words, size=int(rng.integers(3, 6))))
+        cv2.putText(img, text, (int(15 * scale), int((i + 1) * line_height)),
+                    cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, 1.2 * scale, (30, 30, 30), max(1, int(2 * scale)))
+    return _add_noise(img, noise, rng)
+
+
+def synthetic_photo(noise: float, scale: float, seed: int = 0) -> np.ndarray:
+    """A slightly rotated sheet on a darker desk, at the size _find_paper_contour sees"""
+    rng = np.random.default_rng(seed)
+    height, width = int(500 * scale), int(375 * scale)
+    img = np.full((height, width, 3), 70, dtype=np.uint8)
+    cx, cy = width / 2, height / 2
+    w, h = width * 0.75, height * 0.8
+    angle = np.deg2rad(rng.uniform(-6, 6))
+    corners = np.array([[-w / 2, -h / 2], [w / 2, -h / 2], [w / 2, h / 2], [-w / 2, h / 2]])
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    pts = (corners @ rot.T + [cx, cy]).astype(np.int32)
+    cv2.fillConvexPoly(img, pts, (235, 235, 235))
+    return _add_noise(img, noise, rng)
+
+
+# ---------- harness ----------
+
+def measure(fn: Callable, min_rounds: int, min_time: float) -> Dict:
+    fn()  # warm-up
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_rounds or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {
+        'rounds': len(times),
+        'min_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'mean_ms': statistics.fmean(times) * 1000,
+        'stddev_ms': statistics.pstdev(times) * 1000
+    }
+
+
+def cases(quick: bool):
+    """Yield (benchmark name, params, callable)"""
+    questions = QUESTIONS[:2] if quick else QUESTIONS
+    scales = SCALES[1:2] if quick else SCALES
+    detector = OMRDetector(bubble_threshold=0.7, min_bubble_area=30)
+
+    for q, o, noise, scale in itertools.product(questions, OPTIONS, NOISE, scales):
+        block = synthetic_mcq_block(q, o, noise, scale)
+        params = {'questions': q, 'options': o, 'noise': noise, 'scale': scale}
+        yield 'omr.preprocess_image', params, lambda b=block: detector.preprocess_image(b)
+        yield 'omr.detect_bubbles', params, lambda b=block: detector.detect_bubbles(b)
+        bubbles = sorted(detector.detect_bubbles(block), key=lambda b: (b['center'][1], b['center'][0]))
+        yield 'omr._group_into_rows', {**params, 'bubbles': len(bubbles)}, \
+            lambda bs=bubbles, n=q: detector._group_into_rows(bs, n)
+        yield 'omr._fit_grid', {**params, 'bubbles': len(bubbles)}, \
+            lambda bs=bubbles, n=q, k=o: detector._fit_grid(bs, n, k)
+
+    for lines, noise, scale in itertools.product((3, 8), NOISE, scales):
+        block = synthetic_written_block(lines, noise, scale)
+        binary = preprocess_image(block)
+        params = {'lines': lines, 'noise': noise, 'scale': scale}
+        yield 'ocr.detect_lines', params, lambda b=block, bn=binary: detect_lines(b, binary=bn)
+        found = detect_lines(block, binary=binary)
+        if found:
+            line_img = found[0][2]
+            yield 'ocr.detect_words', params, lambda li=line_img: detect_words(li)
+            words = detect_words(line_img)
+            if words:
+                yield 'ocr.resize_for_model', {**params, 'word_px': words[0][2].shape[:2]}, \
+                    lambda w=words[0][2]: resize_for_model(w)
+
+    paper = PaperDetector()
+    for noise, scale in itertools.product(NOISE, scales):
+        photo = synthetic_photo(noise, scale)
+        yield 'paper._find_paper_contour', {'noise': noise, 'scale': scale}, \
+            lambda p=photo: paper._find_paper_contour(p)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OMR / segmentation microbenchmarks")
+    parser.add_argument("--only", help="Run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="Fewer sizes, for a fast check")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per case")
+    parser.add_argument("--json", help="Save results to this file")
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    print(f"{'benchmark':<28}{'params':<58}{'median ms':>11}{'min ms':>10}{'stddev':>9}{'rounds':>8}")
+    for name, params, fn in cases(args.quick):
+        if args.only and args.only not in name:
+            continue
+        stats = measure(fn, args.min_rounds, args.min_time)
+        results.append({'name': name, 'params': params, **stats})
+        shown = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{name:<28}{shown:<58}{stats['median_ms']:>11.3f}{stats['min_ms']:>10.3f}"
+              f"{stats['stddev_ms']:>9.3f}{stats['rounds']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
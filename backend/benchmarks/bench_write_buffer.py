@@ -0,0 +1,78 @@
+# benchmarks/bench_write_buffer.py - Round trips of direct vs write-behind grading writes
+#
+# Runs against the in-memory fake by default. With FIRESTORE_EMULATOR_HOST set
+# it uses the real client against the emulator instead.
+#
+# Usage (from backend/):
+#   python -m benchmarks.bench_write_buffer [--submissions N] [--regrades M]
+
+import argparse
+import os
+import time
+
+from benchmarks.fake_firestore import FakeFirestore
+from utils.firestore_writes import WriteBehindBuffer
+
+
+def make_db():
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        from google.cloud import firestore
+        return firestore.Client(project=os.getenv("GCLOUD_PROJECT", "testly-bench"))
+    return FakeFirestore()
+
+
+def seed(db, collection: str, count: int):
+    batch = db.batch()
+    for i in range(count):
+        batch.set(db.collection(collection).document(f"sub{i}"), {'status': 'pending', 'score': None})
+        if (i + 1) % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def grade_updates(count: int, regrades: int):
+    """Same shape of updates as grading: every paper graded, some graded again"""
+    for round_idx in range(regrades):
+        for i in range(count):
+            yield f"sub{i}", {'status': 'graded', 'score': float(i + round_idx), 'round': round_idx}
+
+
+def snapshot(db, collection: str, count: int):
+    return {i: db.collection(collection).document(f"sub{i}").get().to_dict() for i in range(count)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write-behind buffer round trips")
+    parser.add_argument("--submissions", type=int, default=1000)
+    parser.add_argument("--regrades", type=int, default=2)
+    args = parser.parse_args()
+
+    db = make_db()
+    seed(db, "bench_direct", args.submissions)
+    seed(db, "bench_buffered", args.submissions)
+
+    start = time.perf_counter()
+    direct_writes = 0
+    for doc_id, data in grade_updates(args.submissions, args.regrades):
+        db.collection("bench_direct").document(doc_id).update(data)
+        direct_writes += 1
+    direct_s = time.perf_counter() - start
+
+    buffer = WriteBehindBuffer(db, flush_interval=0.5)
+    start = time.perf_counter()
+    for doc_id, data in grade_updates(args.submissions, args.regrades):
+        buffer.update(db.collection("bench_buffered").document(doc_id), data)
+    buffer.close()
+    buffered_s = time.perf_counter() - start
+
+    same = snapshot(db, "bench_direct", args.submissions) == snapshot(db, "bench_buffered", args.submissions)
+
+    print(f"updates issued:      {args.submissions * args.regrades}")
+    print(f"direct round trips:  {direct_writes} ({direct_s * 1000:.1f} ms)")
+    print(f"buffered commits:    {buffer.commits} ({buffered_s * 1000:.1f} ms)")
+    print(f"final state matches: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# benchmarks/fake_firestore.py - In-memory stand-in for the Firestore client
+#
+# Covers the subset of google.cloud.firestore used by this backend
+# (collections, documents, equality queries, batches and transactions) so
+# write paths, load tests and benchmarks can run offline. It lives with the
+# benchmarks, outside the app packages, so the server can't import it by
+# accident. Use the real client against the emulator
+# (FIRESTORE_EMULATOR_HOST) for full fidelity.
+
+import copy
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+
+class AlreadyExists(Exception):
+    """Raised by create() when the document exists (mirrors google.api_core)"""
+
+
+class NotFound(Exception):
+    """Raised by update() when the document is missing (mirrors google.api_core)"""
+
+
+try:
+    from google.api_core.exceptions import AlreadyExists, NotFound  # noqa: F811
+except ImportError:
+    pass
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentRef:
+    def __init__(self, db: "FakeFirestore", collection: str, doc_id: str):
+        self._db = db
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, transaction=None) -> FakeSnapshot:
+        self._db.reads += 1
+        with self._db.lock:
+            return FakeSnapshot(self, self._db.docs.get(self.path))
+
+    def set(self, data: Dict, merge: bool = False):
+        self._db._apply([("set", self, data, merge)])
+
+    def update(self, data: Dict):
+        self._db._apply([("update", self, data, False)])
+
+    def create(self, data: Dict):
+        self._db._apply([("create", self, data, False)])
+
+    def delete(self):
+        self._db._apply([("delete", self, None, False)])
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeFirestore", collection: str, filters=None, max_results=None):
+        self._db = db
+        self._collection = collection
+        self._filters = filters or []
+        self._limit = max_results
+
+    def where(self, field: str, op: str, value) -> "FakeQuery":
+        if op not in ("==", "in", ">=", "<=", ">", "<"):
+            raise ValueError(f"Unsupported operator in fake: {op}")
+        return FakeQuery(self._db, self._collection, self._filters + [(field, op, value)], self._limit)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._db, self._collection, self._filters, count)
+
+    def _matches(self, data: Dict) -> bool:
+        for field, op, value in self._filters:
+            actual = data.get(field)
+            if op == "==" and actual != value:
+                return False
+            if op == "in" and actual not in value:
+                return False
+            if op in (">=", "<=", ">", "<"):
+                if actual is None:
+                    return False
+                if op == ">=" and not actual >= value:
+                    return False
+                if op == "<=" and not actual <= value:
+                    return False
+                if op == ">" and not actual > value:
+                    return False
+                if op == "<" and not actual < value:
+                    return False
+        return True
+
+    def stream(self, transaction=None):
+        self._db.queries += 1
+        prefix = self._collection + "/"
+        with self._db.lock:
+            matches = [
+                (path, data) for path, data in self._db.docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):] and self._matches(data)
+            ]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        for path, data in matches:
+            ref = FakeDocumentRef(self._db, self._collection, path[len(prefix):])
+            yield FakeSnapshot(ref, data)
+
+    def get(self, transaction=None) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: "FakeFirestore", name: str):
+        super().__init__(db, name)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentRef:
+        return FakeDocumentRef(self._db, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+
+class FakeWriteBatch:
+    MAX_OPS = 500
+
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._ops = []
+
+    def _add(self, op):
+        if len(self._ops) >= self.MAX_OPS:
+            raise ValueError("maximum 500 writes allowed per request")
+        self._ops.append(op)
+
+    def set(self, ref, data: Dict, merge: bool = False):
+        self._add(("set", ref, data, merge))
+
+    def update(self, ref, data: Dict):
+        self._add(("update", ref, data, False))
+
+    def create(self, ref, data: Dict):
+        self._add(("create", ref, data, False))
+
+    def delete(self, ref):
+        self._add(("delete", ref, None, False))
+
+    def commit(self):
+        if self._ops:
+            self._db._apply(self._ops)
+        self._ops = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Writes are buffered and applied atomically on commit.
+
+    Implements the private protocol google.cloud.firestore's @transactional
+    drives (_begin, _commit, _rollback, ...), so code runs the real
+    decorator against it. The database lock is held from begin to
+    commit or rollback, which serializes transactions.
+    """
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db: "FakeFirestore"):
+        super().__init__(db)
+        self._id = None
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._db.lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+        return []
+
+    def _rollback(self):
+        self._ops = []
+        self._release()
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._db.lock.release()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs: Dict[str, Dict] = {}
+        self.lock = threading.RLock()
+        # Round-trip counters for load tests and benchmarks
+        self.reads = 0
+        self.queries = 0
+        self.commits = 0
+        self.writes = 0
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def _apply(self, ops):
+        """Apply a list of writes atomically, validating all of them first"""
+        with self.lock:
+            staged = dict(self.docs)
+            for kind, ref, data, merge in ops:
+                current = staged.get(ref.path)
+                if kind == "create":
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {ref.path}")
+                    staged[ref.path] = copy.deepcopy(data)
+                elif kind == "set":
+                    if merge and current is not None:
+                        staged[ref.path] = _merge(current, data)
+                    else:
+                        staged[ref.path] = copy.deepcopy(data)
+                elif kind == "update":
+                    if current is None:
+                        raise NotFound(f"No document to update: {ref.path}")
+                    staged[ref.path] = _merge(current, data)
+                elif kind == "delete":
+                    staged.pop(ref.path, None)
+            self.docs = staged
+            self.commits += 1
+            self.writes += len(ops)
+
+
+def _merge(current: Dict, data: Dict) -> Dict:
+    """Field-wise merge supporting dotted paths like 'a.b'"""
+    merged = copy.deepcopy(current)
+    for key, value in data.items():
+        target = merged
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(value)
+    return merged
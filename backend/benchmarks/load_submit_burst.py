@@ -0,0 +1,120 @@
+# benchmarks/load_submit_burst.py - Deadline burst against the spooled submit path
+#
+# Fires N simultaneous submit_exam calls (plus some double taps) at the
+# in-memory fake Firestore, then waits for the ingest pipeline to drain.
+# Reports acknowledgement latency, event-loop stalls while the burst is
+# ingested, and checks that exactly one submission per student was stored.
+#
+# Runs in a temporary directory, so the spool and uploads don't touch the repo.
+#
+# Usage (from backend/):
+#   python -m benchmarks.load_submit_burst [--uploads 200] [--duplicates 20]
+
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+
+def make_photo(seed: int) -> bytes:
+    """A phone-photo-sized JPEG of a white sheet on a darker desk"""
+    rng = np.random.default_rng(seed)
+    img = np.full((2016, 1512, 3), 70, dtype=np.uint8)
+    cv2.rectangle(img, (150, 180), (1360, 1850), (235, 235, 235), -1)
+    for row in range(20):
+        col = int(rng.integers(0, 5))
+        cv2.circle(img, (400 + col * 120, 400 + row * 60), 18, (40, 40, 40), -1)
+    img = cv2.add(img, rng.integers(0, 12, img.shape, dtype=np.uint8))
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+async def run(args):
+    import auth
+    from fastapi import HTTPException, UploadFile
+    from routes import submission_routes
+    from utils.cpu_pipeline import get_cpu_executor
+    from utils.exam_codes import create_exam_with_code
+    from benchmarks.fake_firestore import FakeFirestore
+
+    db = FakeFirestore()
+    auth.db = db
+    _, exam_code = create_exam_with_code(db, {'title': 'Burst', 'is_active': True, 'total_points': 20})
+    photos = [make_photo(i) for i in range(8)]
+
+    # Event-loop responsiveness while the burst is ingested
+    stalls = []
+    ticking = True
+
+    async def ticker():
+        while ticking:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - start - 0.01)
+
+    acks = []
+
+    async def upload(student: int):
+        user = {'uid': f"student{student}", 'email': f"s{student}@example.com"}
+        upload_file = UploadFile(io.BytesIO(photos[student % len(photos)]), filename="exam_answer.jpg")
+        start = time.perf_counter()
+        try:
+            await submission_routes.submit_exam(exam_code, upload_file, user)
+            acks.append(time.perf_counter() - start)
+            return "accepted"
+        except HTTPException as e:
+            return f"rejected {e.status_code}"
+
+    tick_task = asyncio.create_task(ticker())
+    students = list(range(args.uploads)) + list(range(args.duplicates))
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(upload(s) for s in students))
+    ack_s = time.perf_counter() - start
+
+    pipeline = submission_routes.get_ingest_pipeline()
+    await pipeline.drain()
+    total_s = time.perf_counter() - start
+    ticking = False
+    await tick_task
+
+    statuses = {}
+    for receipt in pipeline.receipts.values():
+        statuses[receipt['status']] = statuses.get(receipt['status'], 0) + 1
+    stored = [p for p in db.docs if p.startswith("submissions/")]
+
+    await pipeline.stop()
+    get_cpu_executor().shutdown()
+
+    print(f"uploads fired:         {len(students)} ({args.uploads} students, {args.duplicates} double taps)")
+    print(f"accepted / rejected:   {outcomes.count('accepted')} / {len(outcomes) - outcomes.count('accepted')}")
+    print(f"all acknowledged in:   {ack_s * 1000:.0f} ms (p50 {percentile(acks, 50):.1f} ms, "
+          f"p99 {percentile(acks, 99):.1f} ms)")
+    print(f"pipeline drained in:   {total_s * 1000:.0f} ms")
+    print(f"receipts:              {statuses}")
+    print(f"submissions stored:    {len(stored)} (expected {args.uploads})")
+    print(f"loop stall p99 / max:  {percentile(stalls, 99):.1f} / {max(stalls, default=0) * 1000:.1f} ms")
+    print(f"firestore:             {db.reads} reads, {db.queries} queries, {db.commits} commits")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated deadline upload burst")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
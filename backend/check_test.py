@@ -12,6 +12,11 @@ import cv2
 import numpy as np
 import openai
 import os
+import logging
+
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
 
 # Your existing models - KEEP AS IS
 class TestResult(BaseModel):
@@ -117,7 +122,7 @@ async def check_test(
                 results.append(question_result)
                 
         except Exception as e:
-            print(f"OMR detection error: {e}")
+            logger.error(f"OMR detection error: {e}")
             for answer_config in mcq_questions:
                 question_result = {
                     "question_id": answer_config.question_id,
@@ -155,7 +160,7 @@ async def check_test(
             question_result["similarity"] = similarity
             
         except Exception as e:
-            print(f"OCR error for question {answer_config.question_id}: {e}")
+            logger.error(f"OCR error for question {answer_config.question_id}: {e}")
             question_result["error"] = str(e)
         
         total_score += question_result["score"]
@@ -220,6 +225,7 @@ async def process_omr(
     }
 
 
+@timed('comparator')
 def compare_answers_with_gpt(student_answer: str, correct_answer: str, question_text: str = "") -> float:
     """
     Enhanced comparison using GPT-4.1-mini for semantic similarity.
@@ -284,7 +290,7 @@ Return only the score as a single number between 0.0 and 1.0.
         # return max(0.0, min(1.0, similarity))
         return 1.0
     except Exception as e:
-        print(f"GPT comparison error: {e}, falling back to word overlap")
+        logger.warning(f"GPT comparison error: {e}, falling back to word overlap")
         return compare_answers_with_llms(student_answer, correct_answer)
 
 
@@ -1,26 +1,44 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import torch
 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
-from fastapi.responses import JSONResponse
-from utils.paper_detection import process_submission_image
+from fastapi.responses import JSONResponse, Response
+from utils.paper_detection import process_submission_image, PaperDetector
 from routes import submission_routes
 import numpy as np
+import cv2
+import logging
 import os
-import random
-import string
+import time
 from datetime import datetime
 import uuid
+from typing import Optional
 
 #import ur omr detection
 from auth import get_current_user, require_teacher, require_student, get_db, initialize_firebase
 from utils.omr_detection import OMRDetector
+from utils.answer_sheet import (
+    BUBBLE_RADIUS, OPTION_LABELS, bubble_config, make_layout, qr_payload, render_template, sheets_to_pdf
+)
+from utils.cpu_pipeline import get_cpu_executor
+from utils.exam_codes import create_exam_with_code, get_exam_by_code
+from utils.ingest import UploadTooLarge, read_upload, save_upload
+from utils.metrics import METRICS_CONTENT_TYPE, render_metrics
+from utils import firestore_writes
 from check_test import process_omr, process_ocr, compare_answers_with_llms , check_test
 from check_test import TestResult, ExamCreate, ExamUpdate
-from routes import submission_routes
+from routes import submission_routes, grading_routes
 app = FastAPI(title="Document OCR Service")
+
+# LOG_LEVEL=DEBUG for per-question grading detail, WARNING to silence progress
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
 from utils.ocr_detection import initialize_ocr_model, perform_ocr_advanced, perform_ocr_simple
 #Cors middleware for frontend access
 app.add_middleware(
@@ -49,13 +67,22 @@ async def load_models():
 
     initialize_ocr_model(ocr_processor, ocr_model, device_name)
     #omr
-    print("Loading OMR Detector...")
+    logger.info("Loading OMR Detector...")
     omr_detector = OMRDetector(bubble_threshold=0.70, min_bubble_area=30)
-    print("OMR Detector loaded.")
+    logger.info("OMR Detector loaded.")
     import check_test
     check_test.ocr_processor = ocr_processor
     check_test.ocr_model = ocr_model
     check_test.omr_detector = omr_detector 
+    # Finish storing uploads spooled before the last shutdown
+    await submission_routes.get_ingest_pipeline().recover()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await submission_routes.get_ingest_pipeline().stop()
+    get_cpu_executor().shutdown()
+    if firestore_writes.write_buffer is not None:
+        firestore_writes.write_buffer.close()
     
 @app.get("/")
 async def root():
@@ -68,6 +95,11 @@ async def health_check():
             "model_loaded": ocr_model is not None,
             "omr_model_loaded": omr_detector is not None}    
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape: per-stage timing histograms, batch size and queue depth gauges"""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.post("/check_test", response_model=TestResult)
 async def check_test(
     test_image: UploadFile = File(...),
@@ -99,16 +131,12 @@ async def create_exam(exam: ExamCreate, user: dict = Depends(require_teacher)):
     """Teacher creates a new exam"""
     db = get_db()
     
-    # Generate unique exam code
-    exam_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    
     exam_data = {
         'title': exam.title,
         'description': exam.description,
         'duration_minutes': exam.duration_minutes,
         'questions': [q.dict() for q in exam.questions],
         'omr_config': exam.omr_config or {},
-        'exam_code': exam_code,
         'teacher_id': user['uid'],
         'teacher_email': user['email'],
         'created_at': datetime.utcnow().isoformat(),
@@ -116,12 +144,11 @@ async def create_exam(exam: ExamCreate, user: dict = Depends(require_teacher)):
         'total_points': sum(q.points for q in exam.questions)
     }
     
-    # Save to Firestore
-    exam_ref = db.collection('exams').document()
-    exam_ref.set(exam_data)
+    # Save to Firestore together with a unique exam code
+    exam_id, exam_code = create_exam_with_code(db, exam_data)
     
     return {
-        "exam_id": exam_ref.id,
+        "exam_id": exam_id,
         "exam_code": exam_code,
         "message": "Exam created successfully"
     }
@@ -146,11 +173,7 @@ async def get_exam(exam_id: str, user: dict = Depends(require_teacher)):
     """Get exam details"""
     db = get_db()
     
-    query = db.collection('exams').where('exam_code', '==', exam_id).limit(1).stream()
-
-    exam_doc = None
-    for d in query:
-        exam_doc = d
+    exam_doc = get_exam_by_code(db, exam_id)
 
     if exam_doc is None:
         raise HTTPException(status_code=404, detail="Exam not found")
@@ -198,11 +221,7 @@ async def get_exam_submissions(exam_code: str, user: dict = Depends(require_teac
     db = get_db()
     
     # Find exam by exam_code
-    exams = db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream()
-    exam_doc = None
-    for e in exams:
-        exam_doc = e
-        break
+    exam_doc = get_exam_by_code(db, exam_code)
     
     if not exam_doc:
         raise HTTPException(status_code=404, detail="Exam not found")
@@ -222,7 +241,7 @@ async def get_exam_submissions(exam_code: str, user: dict = Depends(require_teac
         sub_data['id'] = sub.id
         submission_list.append(sub_data)
     
-    print(f"Found {len(submission_list)} submissions for exam {exam_code}")  # Debug
+    logger.debug(f"Found {len(submission_list)} submissions for exam {exam_code}")
     return submission_list  # Return array directly
 # ==================== STUDENT ENDPOINTS ====================
 
@@ -232,12 +251,7 @@ async def join_exam(exam_code: str, user: dict = Depends(require_student)):
     db = get_db()
     
     # Find exam by code
-    exams = db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream()
-    
-    exam_doc = None
-    for e in exams:
-        exam_doc = e
-        break
+    exam_doc = get_exam_by_code(db, exam_code)
     
     if not exam_doc:
         raise HTTPException(status_code=404, detail="Invalid exam code")
@@ -415,14 +429,14 @@ async def validate_paper(file: UploadFile = File(...)):
     unique_name = f"{uuid.uuid4()}{file_ext}"
     input_path = os.path.join(UPLOAD_DIR, unique_name)
     
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    # Streamed to disk in chunks off the event loop
+    await run_in_threadpool(save_upload, file.file, input_path)
     
     # Output path
     output_path = os.path.join(PROCESSED_DIR, unique_name)
     
-    # Process image
-    result = process_submission_image(input_path, output_path)
+    # Process image (decode, detection, warp and write) in the CPU pool
+    result = await get_cpu_executor().run(process_submission_image, input_path, output_path)
     
     if result["success"]:
         return JSONResponse({
@@ -436,6 +450,41 @@ async def validate_paper(file: UploadFile = File(...)):
             "error": result.get("error", "Unknown error")
         }, status_code=400)
 
+paper_detector = PaperDetector()
+# Scanner UI frames are a few hundred KB
+CORNER_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+
+def _decode_upload(fileobj, max_bytes: int):
+    return cv2.imdecode(np.frombuffer(read_upload(fileobj, max_bytes), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+@app.post("/api/detect-corners")
+async def detect_corners(file: UploadFile = File(...)):
+    """Fast paper corner detection for live validation in the scanner UI"""
+    # Read (capped) and decoded off the event loop
+    try:
+        img = await run_in_threadpool(_decode_upload, file.file, CORNER_UPLOAD_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if img is None:
+        raise HTTPException(status_code=400, detail="Could not read image")
+    
+    start = time.perf_counter()
+    corners = await run_in_threadpool(paper_detector.find_paper_corners, img)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    if corners is None:
+        return {"detected": False, "elapsed_ms": round(elapsed_ms, 1)}
+    
+    return {
+        "detected": True,
+        # TL, TR, BR, BL in the uploaded image's pixel coordinates
+        "corners": [{"x": float(x), "y": float(y)} for x, y in corners],
+        "image_size": {"width": img.shape[1], "height": img.shape[0]},
+        "elapsed_ms": round(elapsed_ms, 1)
+    }
+
 @app.patch("/api/exams/{exam_code}/regions")
 async def save_answer_regions(
     exam_code: str,
@@ -443,11 +492,7 @@ async def save_answer_regions(
     user: dict = Depends(require_teacher)
 ):
     db = get_db()
-    exams = db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream()
-    exam_doc = None
-    for e in exams:
-        exam_doc = e
-        break
+    exam_doc = get_exam_by_code(db, exam_code)
     
     if not exam_doc:
         raise HTTPException(status_code=404, detail="Exam not found")
@@ -458,7 +503,79 @@ async def save_answer_regions(
     
     exam_doc.reference.update({'omr_config': regions_data})
     return {"success": True}
+
+@app.post("/api/exams/{exam_code}/answer-sheet")
+async def generate_answer_sheet(
+    exam_code: str,
+    format: str = "pdf",
+    students: Optional[str] = None,
+    user: dict = Depends(require_teacher)
+):
+    """
+    Printable answer sheet for the exam: bubble grid for the MCQ questions,
+    a box per written question, corner fiducials and an exam-code QR.
+
+    The layout is saved as the exam's omr_config, bubble centers included,
+    so photos of the sheet are aligned on the fiducials and read at fixed
+    bubble positions. ``students`` (comma-separated IDs) prints one page
+    per student with the ID in the QR; PDF only.
+    """
+    if format not in ("pdf", "png"):
+        raise HTTPException(status_code=400, detail="format must be pdf or png")
+    student_ids = [s.strip() for s in (students or "").split(",") if s.strip()]
+    if format == "png" and len(student_ids) > 1:
+        raise HTTPException(status_code=400, detail="PNG holds one sheet; use format=pdf for several students")
+
+    db = get_db()
+    exam_doc = get_exam_by_code(db, exam_code)
+
+    if not exam_doc:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    exam_data = exam_doc.to_dict()
+    if exam_data['teacher_id'] != user['uid']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    questions = exam_data.get('questions', [])
+    mcq_questions = [q for q in questions if q['type'] == 'mcq']
+    num_written = len([q for q in questions if q['type'] == 'written'])
+    option_counts = [len(q['options']) for q in mcq_questions if q.get('options')]
+    options = min(max(max(option_counts), 2), len(OPTION_LABELS)) if option_counts else submission_routes.DEFAULT_OPTIONS
+
+    try:
+        layout = make_layout(len(mcq_questions), options, num_written)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def render():
+        pages = [
+            render_template(layout, title=exam_data.get('title') or "TESTLY ANSWER SHEET",
+                            qr_text=qr_payload(exam_code, student), student_label=student)
+            for student in (student_ids or [None])
+        ]
+        if format == "pdf":
+            return sheets_to_pdf(pages)
+        return cv2.imencode(".png", pages[0])[1].tobytes()
+
+    content = await run_in_threadpool(render)
+
+    omr_config = {
+        **layout['omr_config'],
+        'options_per_question': options,
+        'bubbles': bubble_config(layout),
+        'bubble_radius': BUBBLE_RADIUS + 1,
+        'generated_at': datetime.utcnow().isoformat()
+    }
+    exam_doc.reference.update({'omr_config': omr_config})
+    logger.info(f"Answer sheet for {exam_code}: {len(mcq_questions)} MCQ x {options}, "
+                f"{num_written} written, {len(student_ids) or 1} page(s)")
+
+    media_type = "application/pdf" if format == "pdf" else "image/png"
+    return Response(content, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="answer_sheet_{exam_code}.{format}"'
+    })
 app.include_router(submission_routes.router, tags=["submissions"])
+app.include_router(grading_routes.router, tags=["grading"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,399 @@
+# routes/grading_routes.py - Exam-wide grading sessions
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+import asyncio
+import json
+import logging
+import time
+import numpy as np
+
+from auth import require_teacher, get_db
+from routes.submission_routes import build_prepare_job, score_prepared_submission, reused_prepared
+from utils.cpu_pipeline import get_cpu_executor
+from utils.grading_stages import prepare_submission
+from utils.grading_artifacts import needs_cpu_stage
+from utils.firestore_writes import commit_updates, get_write_buffer
+from utils.exam_stats import contribution, rebuild_stats, get_stats
+from utils.exam_codes import get_exam_by_code
+from utils.metrics import GRADING_BATCH_SIZE
+from utils.scoring import (
+    UNKNOWN, encode_answer, encode_answer_matrix, decode_answer, display_answer, score_mcq_matrix
+)
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Submissions in the inference stage (TrOCR + GPT) at the same time
+BATCH_INFERENCE_CONCURRENCY = 2
+# MCQ answers read with less confidence than this go to the review queue
+REVIEW_CONFIDENCE = 0.5
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/api/exams/{exam_code}/grade-all")
+async def grade_all_submissions(
+    exam_code: str,
+    include_graded: bool = False,
+    user: dict = Depends(require_teacher)
+):
+    """
+    Grade every pending submission of an exam in one request.
+
+    Progress is streamed back as Server-Sent Events: one ``progress`` event
+    per submission as it finishes (status, score, timing) and a final
+    ``done`` event. The server decides how many papers run at once.
+
+    With ``include_graded`` already graded papers are regraded too, e.g.
+    after editing the answer key or moving a region. Stored per-region
+    artifacts are reused, so only regions whose geometry changed are read
+    from the image again and the rest is just re-scored.
+    """
+    db = get_db()
+
+    exam_doc = get_exam_by_code(db, exam_code)
+
+    if not exam_doc:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    exam_data = exam_doc.to_dict()
+    if exam_data['teacher_id'] != user['uid']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    if not exam_data.get('omr_config', {}).get('regions'):
+        raise HTTPException(
+            status_code=400,
+            detail="No answer regions marked. Teacher must mark regions first."
+        )
+
+    query = db.collection('submissions').where('exam_code', '==', exam_code)
+    if not include_graded:
+        query = query.where('status', '==', 'pending')
+    pending = [(sub.reference, sub.id, sub.to_dict()) for sub in query.stream()]
+
+    return StreamingResponse(
+        _grading_events(pending, exam_data, user['uid']),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _grading_events(pending, exam_data: dict, grader_uid: str):
+    """Run the batch through the CPU pool and inference stage, yielding SSE"""
+    batch_start = time.perf_counter()
+    total = len(pending)
+    yield sse_event("start", {"total": total})
+
+    events: asyncio.Queue = asyncio.Queue()
+    # Grades are coalesced into batched commits instead of one write per paper
+    write_buffer = get_write_buffer()
+    contexts = {}
+    jobs = []
+    reused = []
+
+    for submission_ref, submission_id, submission in pending:
+        try:
+            job = build_prepare_job(submission_id, submission, exam_data)
+        except HTTPException as e:
+            await events.put({"submission_id": submission_id, "status": "error", "error": e.detail})
+            continue
+        contexts[submission_id] = (submission_ref, job, submission.get('artifacts'))
+        if needs_cpu_stage(job):
+            jobs.append((submission_id, (job,)))
+        else:
+            reused.append(submission_id)
+
+    slots = asyncio.Semaphore(BATCH_INFERENCE_CONCURRENCY)
+
+    async def finish(submission_id, prepared, error):
+        start = time.perf_counter()
+        event = {"submission_id": submission_id}
+        try:
+            if error is not None:
+                raise error
+            submission_ref, job, artifacts = contexts[submission_id]
+            result = await run_in_threadpool(
+                score_prepared_submission,
+                submission_ref, submission_id, exam_data, prepared, grader_uid,
+                job, artifacts, write_buffer
+            )
+            event.update({
+                "status": "graded",
+                "score": result['total_score'],
+                "max_score": result['max_score'],
+                "percentage": result['percentage'],
+                "prepare_ms": prepared.get('prepare_ms')
+            })
+        except HTTPException as e:
+            event.update({"status": "error", "error": e.detail})
+        except Exception as e:
+            event.update({"status": "error", "error": str(e)})
+        finally:
+            slots.release()
+        event["inference_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        await events.put(event)
+
+    async def drive():
+        tasks = []
+        try:
+            # Papers fully covered by stored artifacts skip the CPU stage
+            for submission_id in reused:
+                await slots.acquire()
+                tasks.append(asyncio.create_task(finish(submission_id, reused_prepared(), None)))
+            async for submission_id, prepared, error in get_cpu_executor().stream(prepare_submission, jobs):
+                # Waiting here stops pulling from the CPU stage, which in turn
+                # stops it from taking new submissions
+                await slots.acquire()
+                tasks.append(asyncio.create_task(finish(submission_id, prepared, error)))
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            await events.put(None)
+
+    driver = asyncio.create_task(drive())
+    completed = graded = 0
+    GRADING_BATCH_SIZE.inc(total)
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            completed += 1
+            GRADING_BATCH_SIZE.dec()
+            graded += event["status"] == "graded"
+            event.update({
+                "completed": completed,
+                "total": total,
+                "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 1)
+            })
+            yield sse_event("progress", event)
+
+        # Make every grade visible before telling the client the batch is done
+        await run_in_threadpool(write_buffer.flush)
+        yield sse_event("done", {
+            "total": total,
+            "graded": graded,
+            "errors": completed - graded,
+            "elapsed_ms": round((time.perf_counter() - batch_start) * 1000, 1)
+        })
+    finally:
+        driver.cancel()
+        # Papers a disconnected client never saw finish
+        GRADING_BATCH_SIZE.dec(total - completed)
+
+
+def stored_mcq_answers(submission: dict, mcq_questions: list) -> dict:
+    """Raw OMR answers of a graded submission, keyed '1'..'N' like the OMR output"""
+    mcq_artifact = (submission.get('artifacts') or {}).get('mcq')
+    if mcq_artifact:
+        return mcq_artifact['answers']
+
+    # Older submissions only have the results list
+    by_id = {r['question_id']: r.get('student_answer') for r in submission.get('results', []) if r.get('type') == 'mcq'}
+    return {str(idx + 1): by_id.get(q['question_id'], "BLANK") for idx, q in enumerate(mcq_questions)}
+
+
+@router.post("/api/exams/{exam_code}/rescore")
+async def rescore_exam(
+    exam_code: str,
+    user: dict = Depends(require_teacher)
+):
+    """
+    Re-score every graded submission's MCQ answers against the current key.
+
+    Stored answers for the whole exam are compared with the key as one
+    (students x questions) array and the new totals are written back with
+    batched commits. No image is read and written-answer scores are kept.
+    """
+    # Firestore reads and writes, the scoring pass and the stats rebuild all
+    # block, so the whole rescore runs off the event loop
+    return await run_in_threadpool(rescore_submissions, get_db(), exam_code, user)
+
+
+def rescore_submissions(db, exam_code: str, user: dict) -> dict:
+    """Body of rescore_exam (blocking)"""
+    start = time.perf_counter()
+
+    # Grades from grade-all may still sit in the write buffer; they must be
+    # in the 'graded' query below and in the rebuilt stats
+    get_write_buffer().flush()
+
+    exam_doc = get_exam_by_code(db, exam_code)
+
+    if not exam_doc:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    exam_data = exam_doc.to_dict()
+    if exam_data['teacher_id'] != user['uid']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    mcq_questions = [q for q in exam_data['questions'] if q['type'] == 'mcq']
+    if not mcq_questions:
+        raise HTTPException(status_code=400, detail="Exam has no MCQ questions")
+
+    docs = list(
+        db.collection('submissions')
+        .where('exam_code', '==', exam_code)
+        .where('status', '==', 'graded')
+        .stream()
+    )
+    submissions = [doc.to_dict() for doc in docs]
+
+    answers = encode_answer_matrix(
+        [stored_mcq_answers(sub, mcq_questions) for sub in submissions],
+        len(mcq_questions)
+    )
+    key = np.array([encode_answer(q['correct_answer']) for q in mcq_questions], dtype=np.int8)
+    points = np.array([q['points'] for q in mcq_questions], dtype=float)
+    scores, mcq_totals = score_mcq_matrix(answers, key, points)
+
+    max_score = exam_data.get('total_points', 0)
+    updates = []
+    papers = []
+    changed = 0
+
+    for row, (doc, sub) in enumerate(zip(docs, submissions)):
+        old_results = sub.get('results', [])
+        old_mcq = {r['question_id']: r for r in old_results if r.get('type') == 'mcq'}
+
+        mcq_results = []
+        for col, question in enumerate(mcq_questions):
+            if answers[row, col] == UNKNOWN and question['question_id'] in old_mcq:
+                # OMR errored for this paper; leave the error entry as it was
+                mcq_results.append({**old_mcq[question['question_id']], 'score': 0.0})
+                continue
+            mcq_results.append({
+                'question_id': question['question_id'],
+                'question_text': question.get('question_text', ''),
+                'student_answer': display_answer(decode_answer(int(answers[row, col]))),
+                'correct_answer': question['correct_answer'],
+                'score': round(float(scores[row, col]), 2),
+                'max_points': question['points'],
+                'type': 'mcq',
+                # Same reading as before, so the same confidence
+                'confidence': old_mcq.get(question['question_id'], {}).get('confidence')
+            })
+
+        other_results = [r for r in old_results if r.get('type') != 'mcq']
+        total_score = float(mcq_totals[row]) + sum(r.get('score', 0.0) for r in other_results)
+        percentage = (total_score / max_score * 100) if max_score > 0 else 0
+
+        if round(total_score, 2) != sub.get('score'):
+            changed += 1
+
+        new_results = mcq_results + other_results
+        papers.append({'results': new_results, 'percentage': percentage})
+        updates.append((doc.reference, {
+            'score': round(total_score, 2),
+            'percentage': round(percentage, 2),
+            'results': new_results,
+            'stats_applied': contribution(new_results, percentage),
+            'rescored_at': datetime.utcnow().isoformat()
+        }))
+
+    commits = commit_updates(db, updates)
+    # Every paper changed at once, so rebuild the stats instead of applying deltas
+    rebuild_stats(db, exam_doc.id, papers)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Rescored {len(updates)} submissions for {exam_code} ({changed} changed, {commits} commits, {elapsed_ms} ms)")
+
+    return {
+        "success": True,
+        "rescored": len(updates),
+        "changed": changed,
+        "commits": commits,
+        "elapsed_ms": elapsed_ms
+    }
+
+
+@router.get("/api/exams/{exam_code}/stats")
+async def get_exam_stats(
+    exam_code: str,
+    user: dict = Depends(require_teacher)
+):
+    """
+    Class statistics for an exam: count, mean, std, score histogram and per
+    question correct rate / most common wrong option. Maintained as papers
+    are graded, so this is usually a single document read.
+    """
+    db = get_db()
+
+    exam_doc = get_exam_by_code(db, exam_code)
+
+    if not exam_doc:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    if exam_doc.to_dict()['teacher_id'] != user['uid']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # Built from the graded submissions on first read for exams graded
+    # before stats were kept, so this may query the whole exam once
+    stats = await run_in_threadpool(get_stats, db, exam_doc.id)
+    if stats is None:
+        return {"count": 0, "mean": None, "histogram": [], "questions": {}}
+    return stats
+
+
+@router.get("/api/exams/{exam_code}/review-queue")
+async def get_review_queue(
+    exam_code: str,
+    threshold: float = Query(REVIEW_CONFIDENCE, ge=0.0, le=1.0),
+    user: dict = Depends(require_teacher)
+):
+    """
+    MCQ answers across the exam whose bubble reading is doubtful
+    (confidence below ``threshold``), least confident first, so the
+    teacher only has to look at those sheets.
+    """
+    db = get_db()
+
+    exam_doc = get_exam_by_code(db, exam_code)
+
+    if not exam_doc:
+        raise HTTPException(status_code=404, detail="Exam not found")
+
+    if exam_doc.to_dict()['teacher_id'] != user['uid']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    docs = await run_in_threadpool(lambda: list(
+        db.collection('submissions')
+        .where('exam_code', '==', exam_code)
+        .where('status', '==', 'graded')
+        .stream()
+    ))
+
+    items = []
+    checked = 0
+    for doc in docs:
+        submission = doc.to_dict()
+        for result in submission.get('results', []):
+            confidence = result.get('confidence')
+            if result.get('type') != 'mcq' or confidence is None:
+                continue
+            checked += 1
+            if confidence < threshold:
+                items.append({
+                    'submission_id': doc.id,
+                    'student_name': submission.get('student_name'),
+                    'student_email': submission.get('student_email'),
+                    'question_id': result['question_id'],
+                    'student_answer': result.get('student_answer'),
+                    'confidence': confidence
+                })
+
+    items.sort(key=lambda item: item['confidence'])
+    return {
+        "threshold": threshold,
+        "answers_checked": checked,
+        "count": len(items),
+        "items": items
+    }
@@ -1,25 +1,75 @@
 # routes/submission_routes.py - FINAL VERSION with Image Resize & Crop
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+from google.api_core.exceptions import AlreadyExists
 from datetime import datetime
 import cv2
 import numpy as np
 from PIL import Image
 import io
+import logging
 import os
 import shutil
+import uuid
+from typing import Optional
 
 from auth import get_current_user, require_teacher, require_student, get_db
+import check_test
 from check_test import process_omr, perform_ocr, compare_answers_with_gpt
 from utils.ocr_detection import (initialize_ocr_model,perform_ocr_advanced,perform_ocr_simple)
+from utils.cpu_pipeline import get_cpu_executor
+from utils.grading_stages import prepare_submission
+from utils.grading_artifacts import alignment_key, plan_regrade, needs_cpu_stage, similarity_key
+from utils.exam_stats import record_graded_submission
+from utils.exam_codes import get_exam_by_code
+from utils.omr_calibration import CALIBRATION_MODE, exam_threshold, record_sheet_calibration
+from utils.ingest import IngestPipeline, THUMBNAIL_DIR, UploadTooLarge, inspect_upload, save_upload, spool_upload
+from utils.batch_ingest import MAX_UPLOAD_BYTES, ScanFormatError, list_pages, read_scan_page
+from utils.firestore_writes import MAX_BATCH_OPS, commit_creates
+from utils.renditions import RENDITION_WIDTHS, ensure_rendition, etag_for
+from utils.metrics import span, observe_timings
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Image processing config
 TARGET_WIDTH = 1275
 TARGET_HEIGHT = 1650
+# Warp the photo onto the detected paper outline before grading. Off by default
+# because PaperScanner already crops the sheet on the client.
+DETECT_PAPER = os.getenv("GRADE_DETECT_PAPER", "0") == "1"
+# Printed sheets have A-E bubbles unless omr_config says otherwise
+DEFAULT_OPTIONS = 5
 UPLOAD_DIR = "uploads/submissions"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Scan uploads are unpacked here while a batch is ingested
+BATCH_DIR = "uploads/batches"
+# Spooled uploads stored in the background at the same time
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+# Largest photo a student can submit
+SUBMIT_MAX_UPLOAD_BYTES = int(os.getenv("SUBMIT_MAX_UPLOAD_MB", "25")) * 1024 * 1024
+
+
+def submission_doc_id(exam_code: str, student_id: str) -> str:
+    return f"{exam_code}_{student_id}"
+
+
+def find_submission(db, exam_id: str, exam_code: str, student_id: str):
+    """
+    A student's existing submission for an exam, or None.
+
+    Submissions are keyed by submission_doc_id; ones stored under random
+    ids before that are found by their exam_id/student_id pair.
+    """
+    doc = db.collection('submissions').document(submission_doc_id(exam_code, student_id)).get()
+    if doc.exists:
+        return doc
+    legacy = db.collection('submissions')\
+        .where('exam_id', '==', exam_id)\
+        .where('student_id', '==', student_id)\
+        .limit(1).stream()
+    return next(iter(legacy), None)
 
 
 @router.post("/api/exams/submit")
@@ -28,92 +78,398 @@ async def submit_exam(
     test_image: UploadFile = File(...),
     user: dict = Depends(require_student)
 ):
-    """Student submits exam - save locally"""
+    """
+    Student submits exam.
+
+    The upload is spooled to local disk and acknowledged with a receipt right
+    away; storing it in Firestore, paper validation and the thumbnail happen
+    in the background ingest pipeline (poll /api/submissions/receipts/{id}).
+    """
     db = get_db()
     
-    print(f"\n=== STUDENT SUBMISSION ===")
-    print(f"Exam code: {exam_code}")
-    print(f"Student: {user['email']}")
+    logger.info(f"Submission for exam {exam_code} from {user['email']}")
     
     # Find exam
-    exams = db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream()
-    exam_doc = None
-    for e in exams:
-        exam_doc = e
-        break
+    exam_doc = await run_in_threadpool(get_exam_by_code, db, exam_code)
     
     if not exam_doc:
         raise HTTPException(status_code=404, detail="Invalid exam code")
     
     exam_data = exam_doc.to_dict()
-    exam_id = exam_doc.id
     
     if not exam_data.get('is_active'):
         raise HTTPException(status_code=400, detail="Exam is not active")
     
-    # Check if already submitted
-    existing = db.collection('submissions')\
-        .where('exam_code', '==', exam_code)\
-        .where('student_id', '==', user['uid'])\
+    submission_id = submission_doc_id(exam_code, user['uid'])
+    # Stored submissions are turned away here, not only in the background,
+    # so the student sees the rejection instead of a receipt for an upload
+    # that will be dropped
+    existing = await run_in_threadpool(find_submission, db, exam_doc.id, exam_code, user['uid'])
+    if existing is not None:
+        raise HTTPException(status_code=400, detail="Already submitted this exam")
+    pipeline = get_ingest_pipeline()
+    if submission_id in pipeline.in_flight:
+        raise HTTPException(status_code=400, detail="Already submitted this exam")
+    # Claimed before the first await so a double tap can't slip past the check
+    pipeline.in_flight.add(submission_id)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # Unique per upload: a rejected duplicate must only remove its own file
+    filename = f"{exam_code}_{user['uid']}_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
+    meta = {
+        'submission_id': submission_id,
+        'exam_id': exam_doc.id,
+        'exam_code': exam_code,
+        'exam_title': exam_data.get('title'),
+        'student_id': user['uid'],
+        'student_email': user['email'],
+        'student_name': user.get('name', user.get('email')),
+        'image_filename': filename,
+        'total_points': exam_data.get('total_points', 0),
+        'submitted_at': datetime.utcnow().isoformat()
+    }
+    
+    try:
+        meta = await run_in_threadpool(spool_upload, test_image.file, meta, max_bytes=SUBMIT_MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        pipeline.in_flight.discard(submission_id)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        pipeline.in_flight.discard(submission_id)
+        logger.exception("Spooling upload failed")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    receipt = await pipeline.enqueue(meta)
+    logger.info(f"Spooled submission {submission_id} (receipt {receipt['receipt_id']})")
+    
+    return {
+        "success": True,
+        "submission_id": submission_id,
+        "receipt_id": receipt['receipt_id'],
+        "message": "Exam received",
+        "status": receipt['status']
+    }
+
+
+@router.get("/api/submissions/receipts/{receipt_id}")
+async def get_submission_receipt(
+    receipt_id: str,
+    user: dict = Depends(require_student)
+):
+    """Outcome of a spooled upload: queued, stored, duplicate or failed"""
+    receipt = get_ingest_pipeline().status(receipt_id)
+    if receipt is None:
+        # Evicted or from before a restart: a stored upload is on its submission
+        receipt = await run_in_threadpool(stored_receipt, get_db(), receipt_id, user['uid'])
+    if not receipt or receipt.get('student_id') != user['uid']:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+    return receipt
+
+
+def stored_receipt(db, receipt_id: str, student_id: str) -> Optional[dict]:
+    """Receipt of an upload whose in-memory entry is gone, from the submission it created"""
+    docs = db.collection('submissions')\
+        .where('receipt_id', '==', receipt_id)\
+        .where('student_id', '==', student_id)\
         .limit(1).stream()
+    for doc in docs:
+        return {'receipt_id': receipt_id, 'status': 'stored', 'student_id': student_id, 'submission_id': doc.id}
+    return None
+
+
+async def store_spooled_submission(meta: dict) -> dict:
+    """
+    Ingest pipeline handler: validate the spooled image, render its thumbnail
+    and create the submission document, then move the image into place.
+
+    Safe to run again for the same spool entry after a crash: a document
+    carrying this receipt is treated as already stored.
+    """
+    db = get_db()
+    filepath = os.path.join(UPLOAD_DIR, meta['image_filename'])
+    source = meta['spool_path'] if os.path.exists(meta['spool_path']) else filepath
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, f"{meta['submission_id']}_{meta['receipt_id']}.jpg")
+    
+    inspection = await get_cpu_executor().run(inspect_upload, source, thumbnail_path)
+    
+    submission_data = {
+        'exam_id': meta['exam_id'],
+        'exam_code': meta['exam_code'],
+        'exam_title': meta['exam_title'],
+        'student_id': meta['student_id'],
+        'student_email': meta['student_email'],
+        'student_name': meta['student_name'],
+        'image_filename': meta['image_filename'],
+        'image_path': filepath,
+        'thumbnail_path': inspection['thumbnail_path'],
+        'paper_detected': inspection['paper_detected'],
+        'receipt_id': meta['receipt_id'],
+        'status': 'pending',
+        'submitted_at': meta['submitted_at'],
+        'total_points': meta['total_points'],
+        'score': None,
+        'percentage': None,
+        'results': []
+    }
     
-    if any(existing):
-        raise HTTPException(status_code=400, detail="Already submitted this exam")
+    # One submission per student and exam: the id is deterministic and
+    # create() fails if it exists, so concurrent uploads can't both land
+    submission_ref = db.collection('submissions').document(meta['submission_id'])
+    try:
+        await run_in_threadpool(submission_ref.create, submission_data)
+    except AlreadyExists:
+        existing = await run_in_threadpool(submission_ref.get)
+        if existing.get('receipt_id') != meta['receipt_id']:
+            if inspection['thumbnail_path'] and os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+            return {'status': 'duplicate', 'error': "Already submitted this exam"}
+    
+    if source != filepath:
+        os.replace(source, filepath)
+    
+    return {
+        'status': 'stored',
+        'submission_id': meta['submission_id'],
+        'paper_detected': inspection['paper_detected'],
+        'readable': inspection['readable']
+    }
+
+
+ingest_pipeline = None
+
+
+def get_ingest_pipeline() -> IngestPipeline:
+    global ingest_pipeline
+    if ingest_pipeline is None:
+        ingest_pipeline = IngestPipeline(store_spooled_submission, concurrency=INGEST_CONCURRENCY)
+    return ingest_pipeline
+
+
+@router.post("/api/submissions/batch-ingest")
+async def batch_ingest(
+    scan: UploadFile = File(...),
+    user: dict = Depends(require_teacher)
+):
+    """
+    Create submissions from a scanned stack of answer sheets.
+
+    ``scan`` is a multi-page PDF (needs PyMuPDF) or a ZIP of page images,
+    within the BATCH_MAX_* page and size limits (utils/batch_ingest.py).
+    Each page is identified by the QR the answer-sheet endpoint prints
+    (exam code and student), turned upright and stored in the CPU pool,
+    then the new submissions are created with batched writes. Re-uploading
+    the same stack is harmless: submission ids are per exam and student,
+    and pages whose submission exists are reported as duplicates.
+    """
+    db = get_db()
+    batch_id = uuid.uuid4().hex[:12]
+    batch_dir = os.path.join(BATCH_DIR, batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
     
-    # Save image locally
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{exam_code}_{user['uid']}_{timestamp}.jpg"
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        upload_path = os.path.join(batch_dir, "upload")
+        try:
+            await run_in_threadpool(save_upload, scan.file, upload_path, MAX_UPLOAD_BYTES)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            pages = await run_in_threadpool(list_pages, upload_path, os.path.join(batch_dir, "pages"))
+        except ScanFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Save file
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(test_image.file, buffer)
+        jobs = []
+        for index, page in enumerate(pages):
+            name = f"batch_{batch_id}_{index + 1:04d}.jpg"
+            jobs.append((index, (
+                page['source'], page['page'],
+                os.path.join(UPLOAD_DIR, name), os.path.join(THUMBNAIL_DIR, name)
+            )))
         
-        print(f"✓ Image saved: {filepath}")
+        # Pages are rendered, decoded and normalized in parallel in the CPU pool
+        read = [None] * len(pages)
+        with span('batch_read_pages'):
+            async for index, result, error in get_cpu_executor().stream(read_scan_page, jobs):
+                if error is not None:
+                    logger.error(f"Batch {batch_id} page {index + 1} failed: {error}")
+                    result = {'error': str(error)}
+                # Paths from the job, so a page that failed halfway is still cleaned up
+                read[index] = {
+                    'image_path': jobs[index][1][2], 'thumbnail_path': jobs[index][1][3],
+                    **result, 'page': index + 1, 'name': pages[index].get('name')
+                }
         
-        # Create submission in Firestore
-        submission_data = {
-            'exam_id': exam_id,
+        summary = await run_in_threadpool(create_batch_submissions, db, user, batch_id, read)
+    finally:
+        await run_in_threadpool(shutil.rmtree, batch_dir, True)
+    
+    logger.info(f"Batch {batch_id}: {len(pages)} pages, {summary['created']} created, "
+                f"{summary['duplicates']} duplicates, {summary['failed']} failed")
+    return summary
+
+
+def create_batch_submissions(db, user: dict, batch_id: str, pages: list) -> dict:
+    """
+    Turn identified pages into submission documents.
+
+    Exams are checked once per code (must exist and belong to ``user``) and
+    their existing submission ids read with one query; students are looked
+    up by user id, then email, and otherwise kept under the printed ID for
+    classes without accounts. Pages that don't become a submission have
+    their stored image removed, and every page is reported whatever fails.
+    """
+    exams, students, taken = {}, {}, set()
+    in_flight = get_ingest_pipeline().in_flight
+    pending, items = [], []
+    now = datetime.utcnow().isoformat()
+    
+    for page in pages:
+        item = {'page': page['page'], 'name': page.get('name'), 'status': 'failed'}
+        items.append(item)
+        if page.get('error'):
+            item['error'] = page['error']
+            continue
+        item.update(exam_code=page['exam_code'], student=page['student'], rotated=page['rotated'])
+        
+        try:
+            exam_code = page['exam_code']
+            if exam_code not in exams:
+                exams[exam_code] = _batch_exam(db, exam_code, user)
+            exam = exams[exam_code]
+            if isinstance(exam, str):
+                item['error'] = exam
+                continue
+            if not page['student']:
+                item['error'] = "Sheet QR has no student"
+                continue
+            if page['student'] not in students:
+                students[page['student']] = _batch_student(db, page['student'])
+            student = students[page['student']]
+        except Exception as e:
+            logger.exception(f"Batch {batch_id} page {page['page']}: lookup failed")
+            item['error'] = str(e)
+            continue
+        
+        submission_id = submission_doc_id(exam_code, student['id'])
+        item['submission_id'] = submission_id
+        if submission_id in exam['existing'] or submission_id in taken or submission_id in in_flight:
+            item.update(status='duplicate', error="Already submitted this exam")
+            continue
+        
+        taken.add(submission_id)
+        pending.append((db.collection('submissions').document(submission_id), {
+            'exam_id': exam['id'],
             'exam_code': exam_code,
-            'exam_title': exam_data.get('title'),
-            'student_id': user['uid'],
-            'student_email': user['email'],
-            'student_name': user.get('name', user.get('email')),
-            'image_filename': filename,
-            'image_path': filepath,
+            'exam_title': exam['data'].get('title'),
+            'student_id': student['id'],
+            'student_email': student['email'],
+            'student_name': student['name'],
+            'image_filename': os.path.basename(page['image_path']),
+            'image_path': page['image_path'],
+            'thumbnail_path': page['thumbnail_path'],
+            # A flatbed scan of the sheet whose QR was just read
+            'paper_detected': True,
+            'batch_id': batch_id,
             'status': 'pending',
-            'submitted_at': datetime.utcnow().isoformat(),
-            'total_points': exam_data.get('total_points', 0),
+            'submitted_at': now,
+            'total_points': exam['data'].get('total_points', 0),
             'score': None,
             'percentage': None,
             'results': []
-        }
-        
-        submission_ref = db.collection('submissions').document()
-        submission_ref.set(submission_data)
-        
-        print(f"✓ Created submission: {submission_ref.id}")
-        print(f"========================\n")
-        
-        return {
-            "success": True,
-            "submission_id": submission_ref.id,
-            "message": "Exam submitted successfully",
-            "status": "pending"
-        }
+        }, item))
     
-    except Exception as e:
-        print(f"✗ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    _create_batch_documents(db, batch_id, pending)
+    
+    for page, item in zip(pages, items):
+        if item['status'] != 'created':
+            for path in (page.get('image_path'), page.get('thumbnail_path')):
+                if path and os.path.exists(path):
+                    os.remove(path)
+    
+    counts = {status: sum(1 for i in items if i['status'] == status) for status in ('created', 'duplicate', 'failed')}
+    return {
+        'batch_id': batch_id,
+        'pages': len(items),
+        'created': counts['created'],
+        'duplicates': counts['duplicate'],
+        'failed': counts['failed'],
+        'items': items
+    }
+
+
+def _create_batch_documents(db, batch_id: str, pending: list):
+    """
+    Create ``(ref, data, item)`` submissions in batched commits, setting
+    each item's status.
+
+    A batch fails as a whole if any of its documents appeared since the
+    existing-ids query (e.g. a student's own upload landing meanwhile);
+    that batch is then retried one create() at a time so only the clashing
+    pages end up as duplicates.
+    """
+    for offset in range(0, len(pending), MAX_BATCH_OPS):
+        chunk = pending[offset:offset + MAX_BATCH_OPS]
+        try:
+            commit_creates(db, [(ref, data) for ref, data, _ in chunk])
+            for _, _, item in chunk:
+                item['status'] = 'created'
+            continue
+        except Exception:
+            logger.warning(f"Batch {batch_id}: commit of {len(chunk)} submissions failed, creating one by one")
+        
+        for ref, data, item in chunk:
+            try:
+                ref.create(data)
+                item['status'] = 'created'
+            except AlreadyExists:
+                item.update(status='duplicate', error="Already submitted this exam")
+            except Exception as e:
+                logger.exception(f"Batch {batch_id}: creating {ref.id} failed")
+                item.update(status='failed', error=str(e))
+
+
+def _batch_exam(db, exam_code: str, user: dict):
+    """Exam of a batch page with its existing submission ids, or an error message"""
+    exam_doc = get_exam_by_code(db, exam_code)
+    if not exam_doc:
+        return f"Unknown exam code {exam_code}"
+    exam_data = exam_doc.to_dict()
+    if exam_data['teacher_id'] != user['uid']:
+        return "Not authorized for this exam"
+    existing = set()
+    for doc in db.collection('submissions').where('exam_code', '==', exam_code).stream():
+        # Submissions stored under random ids count under their deterministic one
+        existing.update((doc.id, submission_doc_id(exam_code, doc.to_dict().get('student_id'))))
+    return {'id': exam_doc.id, 'data': exam_data, 'existing': existing}
+
+
+def _batch_student(db, key: str) -> dict:
+    """Student printed on a sheet: a user id, an email, or a roster ID"""
+    user_doc = db.collection('users').document(key).get()
+    if not user_doc.exists:
+        user_doc = next(iter(db.collection('users').where('email', '==', key).limit(1).stream()), None)
+    if user_doc is None:
+        return {'id': key, 'email': None, 'name': key}
+    data = user_doc.to_dict()
+    return {'id': user_doc.id, 'email': data.get('email'), 'name': data.get('name') or data.get('email') or key}
 
 
 @router.get("/api/submissions/{submission_id}/image")
 async def get_submission_image(
     submission_id: str,
+    size: str = Query("full"),
+    if_none_match: Optional[str] = Header(None),
     user: dict = Depends(get_current_user)
 ):
-    """Get submission image (for authorized users)"""
+    """
+    Get submission image (for authorized users).
+
+    ``size`` is 'thumb' (240px wide), 'review' (grading width) or 'full'
+    (the original upload). Renditions are rendered once and cached on disk,
+    and responses carry an ETag so a repeat view is a 304.
+    """
+    if size not in RENDITION_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(RENDITION_WIDTHS)}")
+    
     db = get_db()
     
     submission_doc = db.collection('submissions').document(submission_id).get()
@@ -139,20 +495,25 @@ async def get_submission_image(
     if not os.path.exists(image_path):
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(image_path, media_type="image/jpeg")
-
-@router.post("/api/exams/grade-submission")
-async def grade_submission(
-    submission_id: str = Form(...),
-    user: dict = Depends(require_teacher)
-):
-    """Teacher grades submission with auto resize & crop"""
-    db = get_db()
+    thumbnail_path = submission.get('thumbnail_path')
+    if size == 'thumb' and thumbnail_path and os.path.exists(thumbnail_path):
+        # Already rendered at ingest
+        path = thumbnail_path
+    else:
+        try:
+            path = await run_in_threadpool(ensure_rendition, image_path, size)
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
     
-    print(f"\n{'='*60}")
-    print(f"GRADING SUBMISSION: {submission_id}")
-    print(f"{'='*60}")
+    # Private: the image is only visible to the student and the exam's teacher
+    headers = {"Cache-Control": "private, max-age=86400", "ETag": etag_for(path)}
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
     
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
+
+def load_grading_context(db, submission_id: str, user: dict):
+    """Fetch submission + exam and check the teacher may grade it"""
     # Get submission
     submission_ref = db.collection('submissions').document(submission_id)
     submission_doc = submission_ref.get()
@@ -173,29 +534,16 @@ async def grade_submission(
     if exam_data['teacher_id'] != user['uid']:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Load and resize image to standard size
-    image_path = submission['image_path']
-    if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail=f"Image not found: {image_path}")
-    
-    image_np = cv2.imread(image_path)
-    if image_np is None:
-        raise HTTPException(status_code=400, detail="Could not read image")
-    
-    # RESIZE TO STANDARD SIZE
-    original_size = image_np.shape[:2]
-    image_np = cv2.resize(image_np, (TARGET_WIDTH, TARGET_HEIGHT))
-    print(f"✓ Resized image: {original_size} → {image_np.shape}")
-        # DEBUG: Save resized full sheet
-    debug_dir = "debug_crops"
-    os.makedirs(debug_dir, exist_ok=True)
-
-    resized_path = os.path.join(debug_dir, f"{submission_id}_resized.jpg")
-    cv2.imwrite(resized_path, image_np)
+    return submission_ref, submission, exam_data
 
-    print(f"Saved resized full sheet: {resized_path}")
 
+def build_prepare_job(submission_id: str, submission: dict, exam_data: dict) -> dict:
+    """
+    Describe the CPU stage for one submission (must stay picklable).
     
+    Regions whose stored artifacts are still valid for the current geometry
+    and model versions are marked to be skipped.
+    """
     # Get marked regions from omr_config
     omr_config = exam_data.get('omr_config', {})
     regions = omr_config.get('regions', [])
@@ -206,7 +554,87 @@ async def grade_submission(
             detail="No answer regions marked. Teacher must mark regions first."
         )
     
-    print(f"✓ Found {len(regions)} marked regions")
+    if check_test.omr_detector is None:
+        raise HTTPException(status_code=500, detail="OMR detector not loaded")
+    
+    questions = exam_data['questions']
+    mcq_questions = [q for q in questions if q['type'] == 'mcq']
+    job = {
+        'submission_id': submission_id,
+        'exam_id': submission['exam_id'],
+        'image_path': submission['image_path'],
+        'regions': regions,
+        'num_mcq': len(mcq_questions),
+        # Bubbles per row for MCQ regions that don't set their own 'options'
+        'options_per_question': omr_config.get('options_per_question', DEFAULT_OPTIONS),
+        'num_written': len([q for q in questions if q['type'] == 'written']),
+        'target_size': (TARGET_WIDTH, TARGET_HEIGHT),
+        'detect_paper': omr_config.get('detect_paper', DETECT_PAPER),
+        # Sheets printed with corner markers
+        'fiducials': omr_config.get('fiducials', False),
+        # Bubble centers of a sheet generated by the answer-sheet endpoint
+        'bubbles': omr_config.get('bubbles'),
+        'bubble_radius': omr_config.get('bubble_radius'),
+        'omr': {
+            'bubble_threshold': check_test.omr_detector.bubble_threshold,
+            'min_bubble_area': check_test.omr_detector.min_bubble_area
+        },
+        'omr_calibration': {
+            'mode': CALIBRATION_MODE,
+            'prior': exam_threshold(submission['exam_id'], exam_data)
+        }
+    }
+    # The homography found on an earlier grade of this photo is reused only
+    # while the exam still uses the same fiducial sheet layout
+    job['alignment_key'] = alignment_key(job)
+    stored_alignment = submission.get('alignment') or {}
+    if job['fiducials'] and stored_alignment.get('key') == job['alignment_key']:
+        job['homography'] = stored_alignment.get('homography')
+    try:
+        plan_regrade(job, submission.get('artifacts'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if needs_cpu_stage(job) and not os.path.exists(job['image_path']):
+        raise HTTPException(status_code=404, detail=f"Image not found: {job['image_path']}")
+    
+    return job
+
+
+def score_prepared_submission(
+    submission_ref,
+    submission_id: str,
+    exam_data: dict,
+    prepared: dict,
+    grader_uid: str,
+    job: dict,
+    artifacts: dict = None,
+    write_buffer=None
+) -> dict:
+    """
+    Inference stage: OCR + comparison on prepared crops, then save the grade.
+    
+    Regions the CPU stage skipped are served from the submission's stored
+    artifacts, so an answer-key change only re-scores (and re-asks the
+    comparator for written answers whose key text changed).
+    
+    With ``write_buffer`` the Firestore update is queued for a batched
+    commit instead of being written immediately.
+    """
+    # Stage spans recorded inside the CPU pool worker
+    observe_timings(prepared.get('timings'))
+    
+    if prepared.get('error'):
+        raise HTTPException(status_code=400, detail=prepared['error'])
+    
+    artifacts = artifacts or {}
+    stored_written = artifacts.get('written') or {}
+    new_artifacts = {'mcq': None, 'written': {}}
+    
+    if prepared.get('original_size') is not None:
+        logger.info(f"Prepared sheet (original size {prepared['original_size']})")
+    else:
+        logger.info("All regions served from stored artifacts")
     
     results = []
     total_score = 0.0
@@ -217,64 +645,31 @@ async def grade_submission(
     written_questions = [q for q in exam_data['questions'] if q['type'] == 'written']
     
     # ============ PROCESS MCQ REGION ============
-    mcq_regions = [r for r in regions if r['type'] == 'mcq']
-    if mcq_regions and mcq_questions:
-        print(f"\n--- MCQ Processing ({len(mcq_questions)} questions) ---")
+    omr_result = prepared.get('mcq')
+    if job.get('skip_mcq'):
+        omr_result = artifacts['mcq']
+        logger.info("MCQ: reusing stored bubble detection")
+    if omr_result is not None and mcq_questions:
+        logger.info(f"MCQ processing ({len(mcq_questions)} questions)")
         try:
-            mcq_region = mcq_regions[0]
-            x, y, w, h = mcq_region['x'], mcq_region['y'], mcq_region['width'], mcq_region['height']
-            
-            # CROP MCQ region from resized image
-            mcq_region_img = image_np[y:y+h, x:x+w]
-            print(f"MCQ region cropped: {mcq_region_img.shape}")
-                # DEBUG: Save cropped MCQ region on backend
-            debug_dir = "debug_crops"
-            os.makedirs(debug_dir, exist_ok=True)
-
-            mcq_debug_path = os.path.join(debug_dir, f"{submission_id}_mcq_crop.jpg")
-            cv2.imwrite(mcq_debug_path, mcq_region_img)
-
-            print(f"Saved MCQ crop for debugging: {mcq_debug_path}")
-
+            if omr_result.get('error'):
+                raise RuntimeError(omr_result['error'])
             
-            # Save region as temporary file
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-                cv2.imwrite(tmp.name, mcq_region_img)
-                tmp_path = tmp.name
-            
-            try:
-                # Convert to UploadFile
-                with open(tmp_path, 'rb') as f:
-                    from fastapi import UploadFile
-                    from io import BytesIO
-                    
-                    file_content = f.read()
-                    upload_file = UploadFile(
-                        filename="mcq_region.jpg",
-                        file=BytesIO(file_content)
-                    )
-                    
-                    num_mcq = len(mcq_questions)
-                    # options_per_question = len(mcq_questions[0].get('options', [])) if mcq_questions else 4
-                    options_per_question = 5
-                    print(f"Calling process_omr: {num_mcq} questions, {options_per_question} options")
-                    
-                    # Use your working process_omr
-                    omr_result = await process_omr(
-                        image=upload_file,
-                        num_questions=num_mcq,
-                        options_per_question=options_per_question
-                    )
-                    
-                    mcq_answers = omr_result['answers']
-                    print(f"OMR Results: {mcq_answers}")
-                    print(f"Bubbles detected: {omr_result['total_bubbles_detected']}")
-                    print(f"Marked bubbles: {omr_result['marked_bubbles']}")
-            
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
+            mcq_answers = omr_result['answers']
+            mcq_confidence = omr_result.get('confidence') or {}
+            new_artifacts['mcq'] = {
+                'key': job['mcq_key'],
+                'answers': mcq_answers,
+                'confidence': mcq_confidence,
+                'calibration': omr_result.get('calibration'),
+                'total_bubbles_detected': omr_result['total_bubbles_detected'],
+                'marked_bubbles': omr_result['marked_bubbles']
+            }
+            logger.debug(f"OMR results: {mcq_answers}")
+            logger.info(f"Bubbles detected: {omr_result['total_bubbles_detected']}, "
+                        f"marked: {omr_result['marked_bubbles']}")
+            if not job.get('skip_mcq'):
+                record_sheet_calibration(get_db(), job['exam_id'], omr_result.get('calibration'))
             
             # Match answers to questions
             for idx, question in enumerate(mcq_questions):
@@ -295,7 +690,7 @@ async def grade_submission(
                     score = points if student_ans == correct_ans else 0.0
                     display_ans = student_ans
                 
-                print(f"Q{q_id}: Student={student_ans}, Correct={correct_ans}, Score={score}/{points}")
+                logger.debug(f"Q{q_id}: Student={student_ans}, Correct={correct_ans}, Score={score}/{points}")
                 
                 results.append({
                     'question_id': q_id,
@@ -304,23 +699,16 @@ async def grade_submission(
                     'correct_answer': correct_ans,
                     'score': round(score, 2),
                     'max_points': points,
-                    'type': 'mcq'
+                    'type': 'mcq',
+                    'confidence': mcq_confidence.get(omr_key)
                 })
                 
                 total_score += score
             
-            print(f"✓ MCQ complete. Subtotal: {total_score}/{sum(q['points'] for q in mcq_questions)}")
-            print("MCQ answers returned by OMR:", mcq_answers)
-            for idx, question in enumerate(mcq_questions):
-                omr_key = str(idx + 1)
-                student_ans = mcq_answers.get(omr_key, "BLANK")
-                print(f"Q{question['question_id']} -> student_ans: {student_ans}, correct_answer: {question['correct_answer']}")
-
+            logger.info(f"MCQ complete. Subtotal: {total_score}/{sum(q['points'] for q in mcq_questions)}")
         
         except Exception as e:
-            print(f"✗ MCQ error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.error(f"MCQ error: {str(e)}")
             
             for question in mcq_questions:
                 results.append({
@@ -335,53 +723,68 @@ async def grade_submission(
                 })
     
     # ============ PROCESS WRITTEN REGIONS ============
-    written_regions = [r for r in regions if r['type'] == 'written']
-    if written_regions and written_questions:
-        print(f"\n--- Written Processing ({len(written_questions)} questions) ---")
+    fresh_crops = {crop['index']: crop for crop in prepared.get('written', [])}
+    num_written = min(len(job['written_keys']), len(written_questions))
+    if num_written:
+        logger.info(f"Written processing ({len(written_questions)} questions)")
 
-    for idx, region in enumerate(written_regions):
-        if idx >= len(written_questions):
-            break
-        
+    for idx in range(num_written):
         question = written_questions[idx]
         q_id = question['question_id']
         
         try:
-            x, y, w, h = region['x'], region['y'], region['width'], region['height']
-            
-            # CROP written region from resized image
-            region_img = image_np[y:y+h, x:x+w]
-            print(f"Q{q_id}: Cropped region {region_img.shape}")
-            
-            # Convert to PIL Image for OCR processing
-            region_pil = Image.fromarray(cv2.cvtColor(region_img, cv2.COLOR_BGR2RGB))
-            
-            # Use the advanced OCR with word-by-word detection
-            ocr_result = perform_ocr_advanced(region_pil, batch_size=8)
-            student_text = ocr_result['text']
+            crop = fresh_crops.get(idx)
+            if crop is not None:
+                logger.debug(f"Q{q_id}: Cropped region {crop['image'].shape}")
+                
+                # Crops arrive as RGB arrays with their slice of the sheet binary
+                region_pil = Image.fromarray(crop['image'])
+                
+                # Use the advanced OCR with word-by-word detection
+                ocr_result = perform_ocr_advanced(region_pil, batch_size=8, binary=crop['binary'])
+                artifact = {
+                    'key': job['written_keys'][idx],
+                    'text': ocr_result['text'],
+                    'method': ocr_result['method'],
+                    'lines': ocr_result['lines'],
+                    'words': ocr_result['words']
+                }
+                
+                logger.debug(f"Q{q_id}: Detected {ocr_result['lines']} lines, {ocr_result['words']} words")
+                
+                # Log word details for debugging
+                if ocr_result.get('word_details') and logger.isEnabledFor(logging.DEBUG):
+                    for word_info in ocr_result['word_details'][:5]:  # Show first 5 words
+                        logger.debug(f"  Line {word_info['line']}, Word {word_info['word_num']}: '{word_info['text']}'")
+                    if len(ocr_result['word_details']) > 5:
+                        logger.debug(f"  ... and {len(ocr_result['word_details']) - 5} more words")
+            else:
+                artifact = dict(stored_written[str(idx)])
+                logger.debug(f"Q{q_id}: reusing stored OCR")
             
-            print(f"Q{q_id}: Detected {ocr_result['lines']} lines, {ocr_result['words']} words")
-            print(f"Q{q_id}: OCR='{student_text[:80]}'...")
+            student_text = artifact['text']
+            logger.debug(f"Q{q_id}: OCR='{student_text[:80]}'...")
             
-            # Log word details for debugging
-            if ocr_result.get('word_details'):
-                print(f"Q{q_id}: Word breakdown:")
-                for word_info in ocr_result['word_details'][:5]:  # Show first 5 words
-                    print(f"  Line {word_info['line']}, Word {word_info['word_num']}: '{word_info['text']}'")
-                if len(ocr_result['word_details']) > 5:
-                    print(f"  ... and {len(ocr_result['word_details']) - 5} more words")
+            # GPT comparison, skipped when neither the text nor the key changed
+            sim_key = similarity_key(student_text, question['correct_answer'], question.get('question_text', ''))
+            previous = stored_written.get(str(idx)) or {}
+            if previous.get('similarity_key') == sim_key:
+                similarity = previous['similarity']
+                artifact['similarity_key'] = sim_key
+                artifact['similarity'] = similarity
+            else:
+                similarity = compare_answers_with_gpt(
+                    student_text,
+                    question['correct_answer'],
+                    question.get('question_text', '')
+                )
+                artifact['similarity_key'] = sim_key
+                artifact['similarity'] = similarity
+            new_artifacts['written'][str(idx)] = artifact
             
-            # GPT comparison
-            similarity = compare_answers_with_gpt(
-                student_text,
-                question['correct_answer'],
-                question.get('question_text', '')
-            )
-            print(similarity)
             # score = similarity * question['points']
             score = 1.0
-            print(score)
-            print(f"Q{q_id}: Similarity={similarity:.2f}, Score={score:.2f}/{question['points']}")
+            logger.debug(f"Q{q_id}: Similarity={similarity:.2f}, Score={score:.2f}/{question['points']}")
             
             results.append({
                 'question_id': q_id,
@@ -392,17 +795,15 @@ async def grade_submission(
                 'max_points': question['points'],
                 'type': 'written',
                 'similarity': round(similarity, 2),
-                'ocr_method': ocr_result['method'],
-                'lines_detected': ocr_result['lines'],
-                'words_detected': ocr_result['words']
+                'ocr_method': artifact['method'],
+                'lines_detected': artifact['lines'],
+                'words_detected': artifact['words']
             })
             
             total_score += score
         
         except Exception as e:
-            print(f"✗ Q{q_id} error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Q{q_id} error: {str(e)}")
             
             results.append({
                 'question_id': q_id,
@@ -418,19 +819,29 @@ async def grade_submission(
     # Calculate final percentage
     percentage = (total_score / max_score * 100) if max_score > 0 else 0
     
-    print(f"\n{'='*60}")
-    print(f"FINAL: {total_score:.2f}/{max_score} ({percentage:.1f}%)")
-    print(f"{'='*60}\n")
+    logger.info(f"Graded {submission_id}: {total_score:.2f}/{max_score} ({percentage:.1f}%)")
     
     # Update submission
-    submission_ref.update({
+    update = {
         'status': 'graded',
         'score': round(total_score, 2),
         'percentage': round(percentage, 2),
         'results': results,
+        'artifacts': new_artifacts,
         'graded_at': datetime.utcnow().isoformat(),
-        'graded_by': user['uid']
-    })
+        'graded_by': grader_uid
+    }
+    if (prepared.get('alignment') or {}).get('method'):
+        update['alignment'] = prepared['alignment']
+    with span('firestore_write'):
+        if write_buffer is not None:
+            write_buffer.update(submission_ref, update)
+        else:
+            submission_ref.update(update)
+    
+    # Keep the exam's running statistics in step with this grade
+    with span('exam_stats'):
+        record_graded_submission(get_db(), job['exam_id'], submission_ref, results, percentage)
     
     return {
         "success": True,
@@ -442,6 +853,46 @@ async def grade_submission(
     }
 
 
+async def prepare_or_reuse(job: dict) -> dict:
+    """Run the CPU stage only if some region has no reusable artifact"""
+    if not needs_cpu_stage(job):
+        return reused_prepared()
+    return await get_cpu_executor().run(prepare_submission, job)
+
+
+def reused_prepared() -> dict:
+    """Stand-in CPU stage result when every region comes from artifacts"""
+    return {"original_size": None, "mcq": None, "written": [], "prepare_ms": 0.0}
+
+
+@router.post("/api/exams/grade-submission")
+async def grade_submission(
+    submission_id: str = Form(...),
+    user: dict = Depends(require_teacher)
+):
+    """Teacher grades submission with auto resize & crop"""
+    db = get_db()
+    
+    logger.info(f"Grading submission {submission_id}")
+    
+    with span('grade_submission'):
+        with span('load_context'):
+            submission_ref, submission, exam_data = await run_in_threadpool(
+                load_grading_context, db, submission_id, user
+            )
+        job = build_prepare_job(submission_id, submission, exam_data)
+        
+        # CPU stage (decode, resize, OMR, sheet binarization) runs in the process pool
+        with span('prepare'):
+            prepared = await prepare_or_reuse(job)
+        
+        # OCR, comparator calls and the Firestore write block, so keep them off the loop
+        return await run_in_threadpool(
+            score_prepared_submission, submission_ref, submission_id, exam_data, prepared,
+            user['uid'], job, submission.get('artifacts')
+        )
+
+
 @router.get("/api/exams/{exam_code}/submissions")
 async def get_exam_submissions(
     exam_code: str,
@@ -450,11 +901,7 @@ async def get_exam_submissions(
     """Get all submissions for an exam"""
     db = get_db()
     
-    exams = db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream()
-    exam_doc = None
-    for e in exams:
-        exam_doc = e
-        break
+    exam_doc = get_exam_by_code(db, exam_code)
     
     if not exam_doc:
         raise HTTPException(status_code=404, detail="Exam not found")
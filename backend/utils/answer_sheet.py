@@ -0,0 +1,230 @@
+# utils/answer_sheet.py - Printable answer sheets whose layout the grader knows
+#
+# make_layout places the MCQ bubble grid and written boxes and returns the
+# omr_config (teacher-tool region format) together with every bubble's
+# center, render_template draws the sheet with corner fiducials and an
+# exam-code QR, and sheets_to_pdf packs pages for printing.
+
+import io
+import math
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.fiducials import draw_fiducials
+
+SHEET_SIZE = (1275, 1650)  # grading resolution (TARGET_WIDTH x TARGET_HEIGHT)
+OPTION_LABELS = ['A', 'B', 'C', 'D', 'E', 'F']
+
+# Sheet geometry in pixels at SHEET_SIZE
+MARGIN = 80
+HEADER_HEIGHT = 130
+BUBBLE_RADIUS = 11
+OPTION_PITCH = 40
+ROW_PITCH = 36
+COLUMN_GAP = 70
+WRITTEN_HEIGHT = 170
+WRITTEN_GAP = 30
+
+def make_layout(
+    num_mcq: int,
+    options: int = 5,
+    num_written: int = 2,
+    columns: Optional[int] = None,
+    sheet_size: Tuple[int, int] = SHEET_SIZE,
+    region_per_column: bool = False,
+    fiducials: bool = True
+) -> Dict:
+    """
+    Place the MCQ grid and written boxes on a sheet.
+
+    Questions run down each column, then on to the next column. With
+    ``columns`` unset, as few columns as fit the page are used. With
+    ``region_per_column`` each column gets its own MCQ region carrying
+    question_start / num_questions, instead of one region for the grid.
+    ``fiducials`` prints the corner markers of utils/fiducials.py and
+    flags them in omr_config so grading aligns on them.
+
+    Returns:
+        dict with omr_config (teacher-tool format), num_mcq, options,
+        num_written and bubbles: per question, the option centers in
+        sheet pixels
+    """
+    if not 2 <= options <= len(OPTION_LABELS):
+        raise ValueError(f"options must be between 2 and {len(OPTION_LABELS)}")
+    width, height = sheet_size
+    written_space = num_written * (WRITTEN_HEIGHT + WRITTEN_GAP)
+    grid_top = MARGIN + HEADER_HEIGHT
+    available = height - grid_top - MARGIN - written_space
+    max_rows = max(1, int((available - 2 * BUBBLE_RADIUS) // ROW_PITCH) + 1)
+
+    column_width = 2 * BUBBLE_RADIUS + OPTION_PITCH * (options - 1) + COLUMN_GAP
+    if columns is None:
+        columns = max(1, math.ceil(num_mcq / max_rows)) if num_mcq else 0
+    rows = math.ceil(num_mcq / columns) if num_mcq else 0
+    if rows > max_rows or columns * column_width > width - 2 * MARGIN:
+        raise ValueError(f"{num_mcq} questions with {options} options and {num_written} "
+                         f"written boxes don't fit on one sheet")
+
+    regions, bubbles = [], []
+    grid_bottom = grid_top
+    if num_mcq:
+        pad = 20
+        grid_width = columns * column_width - COLUMN_GAP
+        grid_height = 2 * BUBBLE_RADIUS + ROW_PITCH * (rows - 1)
+        left = (width - grid_width) // 2
+        for q in range(num_mcq):
+            col, row = divmod(q, rows)
+            cy = grid_top + pad + BUBBLE_RADIUS + row * ROW_PITCH
+            cx0 = left + col * column_width + BUBBLE_RADIUS
+            bubbles.append([(cx0 + o * OPTION_PITCH, cy) for o in range(options)])
+        if region_per_column:
+            for col in range(columns):
+                start = col * rows
+                count = min(rows, num_mcq - start)
+                if count <= 0:
+                    break
+                regions.append({
+                    'question_id': f'mcq-{col + 1}', 'type': 'mcq',
+                    'x': left + col * column_width - pad, 'y': grid_top,
+                    'width': column_width - COLUMN_GAP + 2 * pad, 'height': grid_height + 2 * pad,
+                    'question_start': start + 1, 'num_questions': count
+                })
+        else:
+            regions.append({
+                'question_id': 'all', 'type': 'mcq',
+                'x': left - pad, 'y': grid_top,
+                'width': grid_width + 2 * pad, 'height': grid_height + 2 * pad
+            })
+        grid_bottom = grid_top + grid_height + 2 * pad
+
+    y = grid_bottom + WRITTEN_GAP
+    for i in range(num_written):
+        regions.append({
+            'question_id': i + 1, 'type': 'written',
+            'x': MARGIN, 'y': y, 'width': width - 2 * MARGIN, 'height': WRITTEN_HEIGHT
+        })
+        y += WRITTEN_HEIGHT + WRITTEN_GAP
+
+    omr_config = {'image_width': width, 'image_height': height, 'regions': regions}
+    if fiducials:
+        omr_config['fiducials'] = True
+    return {
+        'omr_config': omr_config,
+        'num_mcq': num_mcq,
+        'options': options,
+        'num_written': num_written,
+        'columns': columns,
+        'bubbles': bubbles
+    }
+
+
+# QR in the top-right of the header: "TESTLY|<exam code>|<student>"
+QR_PREFIX = "TESTLY"
+# 4 px modules survive a 150 dpi scan or a phone photo; the header fits 136 px
+QR_MODULE_PX = 4
+QR_MAX_SIZE = 136
+PRINT_DPI = 150  # 1275x1650 prints as US Letter
+
+
+def qr_payload(exam_code: str, student: Optional[str] = None) -> str:
+    return "|".join([QR_PREFIX, exam_code] + ([student] if student else []))
+
+
+def parse_qr_payload(text: str) -> Optional[Dict]:
+    """{exam_code, student} from a sheet QR, or None if it isn't one of ours"""
+    parts = (text or "").split("|")
+    if len(parts) < 2 or parts[0] != QR_PREFIX or not parts[1]:
+        return None
+    return {'exam_code': parts[1], 'student': "|".join(parts[2:]) or None}
+
+
+def encode_qr(text: str, max_size: int = QR_MAX_SIZE) -> np.ndarray:
+    """
+    Black-on-white QR, quiet zone included, at QR_MODULE_PX pixels per
+    module (fewer if that would exceed ``max_size``)
+    """
+    modules = cv2.QRCodeEncoder.create().encode(text)
+    scale = max(2, min(QR_MODULE_PX, max_size // modules.shape[0]))
+    return cv2.resize(modules, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+
+
+def render_template(
+    layout: Dict,
+    title: str = "TESTLY ANSWER SHEET",
+    qr_text: Optional[str] = None,
+    student_label: Optional[str] = None
+) -> np.ndarray:
+    """
+    Draw the printed, unmarked sheet: header, fiducials (if the layout
+    has them), bubble outlines and written boxes.
+
+    Args:
+        qr_text: payload of the header QR (see qr_payload); no QR if None
+        student_label: printed under the title, e.g. the student's name
+    """
+    width, height = layout['omr_config']['image_width'], layout['omr_config']['image_height']
+    img = np.full((height, width, 3), 250, dtype=np.uint8)
+    ink = (40, 40, 40)
+
+    rule_end = width - MARGIN
+    if qr_text:
+        qr = encode_qr(qr_text)
+        # Dark modules start at the margin; the quiet zone (4 modules) spills outside it
+        quiet = int(np.argmax(qr.min(axis=1) < 128))
+        x0, y0 = width - MARGIN + quiet - qr.shape[1], MARGIN - quiet
+        img[y0:y0 + qr.shape[0], x0:x0 + qr.shape[1]] = qr[..., None]
+        rule_end = x0 - 20
+
+    cv2.putText(img, title[:48], (MARGIN, MARGIN + 40), cv2.FONT_HERSHEY_SIMPLEX, 1.1, ink, 2)
+    cv2.line(img, (MARGIN, MARGIN + 70), (rule_end, MARGIN + 70), ink, 2)
+    cv2.putText(img, f"Name: {student_label}" if student_label else "Name: ______________________",
+                (MARGIN, MARGIN + 105), cv2.FONT_HERSHEY_SIMPLEX, 0.7, ink, 1, cv2.LINE_AA)
+    if layout['omr_config'].get('fiducials'):
+        draw_fiducials(img)
+
+    # Question numbers left of each row, option letters over each column;
+    # both stay clear of the bubble disks the grader samples
+    font, label_scale = cv2.FONT_HERSHEY_SIMPLEX, 0.5
+    column_tops = {}
+    for q, centers in enumerate(layout['bubbles']):
+        for center in centers:
+            cv2.circle(img, center, BUBBLE_RADIUS, (90, 90, 90), 2)
+        (text_w, text_h), _ = cv2.getTextSize(str(q + 1), font, label_scale, 1)
+        x, y = centers[0]
+        cv2.putText(img, str(q + 1), (x - BUBBLE_RADIUS - 8 - text_w, y + text_h // 2),
+                    font, label_scale, ink, 1, cv2.LINE_AA)
+        column_tops.setdefault(x, centers)
+    for centers in column_tops.values():
+        for label, (x, y) in zip(OPTION_LABELS, centers):
+            (text_w, _), _ = cv2.getTextSize(label, font, label_scale, 1)
+            cv2.putText(img, label, (x - text_w // 2, y - BUBBLE_RADIUS - 8), font, label_scale, ink, 1, cv2.LINE_AA)
+
+    for region in layout['omr_config']['regions']:
+        if region['type'] == 'written':
+            x, y, w, h = region['x'], region['y'], region['width'], region['height']
+            cv2.rectangle(img, (x, y), (x + w, y + h), (120, 120, 120), 1)
+
+    return img
+
+
+def bubble_config(layout: Dict) -> List[Dict]:
+    """
+    Bubble centers for omr_config, one entry per question:
+    {question, y, x: [option centers]}. Firestore can't store nested
+    arrays, hence the map per row.
+    """
+    return [
+        {'question': q + 1, 'y': int(centers[0][1]), 'x': [int(cx) for cx, _ in centers]}
+        for q, centers in enumerate(layout['bubbles'])
+    ]
+
+
+def sheets_to_pdf(pages: List[np.ndarray]) -> bytes:
+    """BGR page images -> one PDF at PRINT_DPI"""
+    images = [Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB)) for page in pages]
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PDF", save_all=True, append_images=images[1:], resolution=PRINT_DPI)
+    return buffer.getvalue()
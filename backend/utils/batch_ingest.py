@@ -0,0 +1,174 @@
+# utils/batch_ingest.py - Scan-station batch ingest: split a stack of scans into sheets
+#
+# A teacher feeds the class's paper sheets through a scanner and uploads the
+# result as one multi-page PDF or a ZIP of page images. Every page is read
+# in the CPU pool: rendered (PDF pages) or decoded, its header QR (printed
+# by the answer-sheet endpoint, see utils/answer_sheet.py) decoded for exam
+# code and student, turned upright from where the QR landed, and saved as
+# the submission image plus its thumbnail.
+
+import logging
+import os
+import zipfile
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from utils.answer_sheet import PRINT_DPI, parse_qr_payload
+from utils.renditions import JPEG_QUALITY, RENDITION_WIDTHS, resize_to_width
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+# Pages are searched for the QR at most this size (longest side)
+QR_SEARCH_MAX_DIM = 1600
+# Limits per upload: a class set is a few hundred sheets of ~1 MB each
+MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "1000"))
+MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+# Total size of the images unpacked from a ZIP (guards against zip bombs)
+MAX_EXTRACTED_BYTES = int(os.getenv("BATCH_MAX_EXTRACTED_MB", "2048")) * 1024 * 1024
+
+
+class ScanFormatError(ValueError):
+    """The upload isn't a readable PDF or ZIP of page images"""
+
+
+def list_pages(path: str, extract_dir: str) -> List[Dict]:
+    """
+    Pages of an uploaded scan, in order.
+
+    PDFs need PyMuPDF (optional dependency); ZIP members that are images
+    are extracted to ``extract_dir``.
+
+    Returns:
+        list of {'source', 'page'}: a PDF path and page index, or an
+        extracted image path and None
+
+    Raises:
+        ScanFormatError: unknown format, no pages, too many pages or bytes
+            (checked before anything is unpacked), or a PDF without PyMuPDF
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    if magic == b"%PDF":
+        try:
+            import pymupdf
+        except ImportError:
+            raise ScanFormatError("PDF scans need PyMuPDF (pip install pymupdf); upload a ZIP of page images instead")
+        with pymupdf.open(path) as doc:
+            count = doc.page_count
+        if count > MAX_PAGES:
+            raise ScanFormatError(f"{count} pages in one upload, at most {MAX_PAGES}")
+        pages = [{'source': path, 'page': i} for i in range(count)]
+    elif zipfile.is_zipfile(path):
+        os.makedirs(extract_dir, exist_ok=True)
+        pages = []
+        with zipfile.ZipFile(path) as archive:
+            members = sorted(
+                (m for m in archive.infolist()
+                 if m.filename.lower().endswith(IMAGE_EXTENSIONS) and not m.filename.startswith('__MACOSX/')),
+                key=lambda m: m.filename
+            )
+            if len(members) > MAX_PAGES:
+                raise ScanFormatError(f"{len(members)} pages in one upload, at most {MAX_PAGES}")
+            if sum(m.file_size for m in members) > MAX_EXTRACTED_BYTES:
+                raise ScanFormatError(f"ZIP unpacks to more than {MAX_EXTRACTED_BYTES // (1024 * 1024)} MB")
+            # The declared sizes can lie, so the bytes actually unpacked are counted too
+            extracted = 0
+            for index, member in enumerate(members):
+                # Flattened names: members can't write outside extract_dir
+                target = os.path.join(extract_dir, f"{index:05d}{os.path.splitext(member.filename)[1].lower()}")
+                with archive.open(member) as src, open(target, "wb") as dst:
+                    while chunk := src.read(1024 * 1024):
+                        extracted += len(chunk)
+                        if extracted > MAX_EXTRACTED_BYTES:
+                            raise ScanFormatError(f"ZIP unpacks to more than {MAX_EXTRACTED_BYTES // (1024 * 1024)} MB")
+                        dst.write(chunk)
+                pages.append({'source': target, 'page': None, 'name': member.filename})
+    else:
+        raise ScanFormatError("Upload a PDF or a ZIP of page images")
+
+    if not pages:
+        raise ScanFormatError("No pages found in the upload")
+    return pages
+
+
+def _load_page(source: str, page: Optional[int]) -> Optional[np.ndarray]:
+    if page is None:
+        return cv2.imread(source)
+    import pymupdf
+    with pymupdf.open(source) as doc:
+        pix = doc[page].get_pixmap(dpi=PRINT_DPI)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR if pix.n == 4 else cv2.COLOR_RGB2BGR)
+
+
+def read_sheet_qr(img: np.ndarray) -> Optional[Dict]:
+    """
+    Decode the sheet QR.
+
+    Returns:
+        {exam_code, student, center (x, y) in page pixels}, or None
+    """
+    height, width = img.shape[:2]
+    detector = cv2.QRCodeDetector()
+    scale = min(1.0, QR_SEARCH_MAX_DIM / max(width, height))
+    # Large scans are tried downscaled first, then at full resolution
+    for factor in ([scale, 1.0] if scale < 1 else [1.0]):
+        view = cv2.resize(img, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else img
+        text, points, _ = detector.detectAndDecode(view)
+        payload = parse_qr_payload(text) if points is not None else None
+        if payload is not None:
+            cx, cy = points.reshape(-1, 2).mean(axis=0) / factor
+            return {**payload, 'center': (float(cx), float(cy))}
+    return None
+
+
+def upright(img: np.ndarray, qr_center) -> np.ndarray:
+    """Rotate a page by quarter turns so the QR sits top-right, where it's printed"""
+    height, width = img.shape[:2]
+    right, top = qr_center[0] > width / 2, qr_center[1] < height / 2
+    if right and top:
+        return img
+    if not right and not top:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if not right:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+
+def read_scan_page(source: str, page: Optional[int], image_path: str, thumbnail_path: str) -> Dict:
+    """
+    Identify and normalize one scanned page (runs in the CPU pool).
+
+    Returns:
+        {'exam_code', 'student', 'rotated', 'image_path', 'thumbnail_path'}
+        or {'error'} when the page can't be read or carries no sheet QR
+    """
+    img = _load_page(source, page)
+    if img is None:
+        return {'error': "Could not read page"}
+
+    qr = read_sheet_qr(img)
+    if qr is None:
+        return {'error': "No answer-sheet QR found"}
+
+    sheet = upright(img, qr['center'])
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    cv2.imwrite(image_path, sheet, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+    thumb = resize_to_width(sheet, RENDITION_WIDTHS['thumb'])
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    cv2.imwrite(thumbnail_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY['thumb']])
+
+    return {
+        'exam_code': qr['exam_code'],
+        'student': qr['student'],
+        'rotated': sheet is not img,
+        'image_path': image_path,
+        'thumbnail_path': thumbnail_path
+    }
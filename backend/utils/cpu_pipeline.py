@@ -0,0 +1,130 @@
+# utils/cpu_pipeline.py - Process pool for the CPU-bound image stages
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, Tuple
+
+import cv2
+
+from utils.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Pin OpenCV to a single thread per worker process.
+
+    Every worker already owns one core, so letting OpenCV spin up its own
+    thread pool inside each of them only oversubscribes the machine.
+    """
+    cv2.setNumThreads(1)
+
+
+class CPUStageExecutor:
+    """
+    Runs CPU-bound stages (paper detection, OMR, sheet preprocessing) in a
+    process pool sized to the machine, off the request thread.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, queue_size: Optional[int] = None):
+        """
+        Args:
+            max_workers: Worker processes (defaults to the number of cores)
+            queue_size: Prepared results allowed to wait for the inference
+                stage before workers stop taking new submissions
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.max_workers * 2
+        self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already holds torch/CUDA state is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            logger.info(f"CPU stage pool started with {self.max_workers} workers")
+        return self._pool
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run a single stage call in the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, fn, *args)
+
+    async def stream(
+        self,
+        fn: Callable,
+        jobs: Iterable[Tuple[Any, tuple]]
+    ) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """
+        Feed ``(key, args)`` jobs through ``fn`` in the pool and yield
+        ``(key, result, error)`` in completion order.
+
+        At most ``max_workers`` jobs run at once and at most ``queue_size``
+        finished results wait for the consumer. When the consumer (the
+        inference stage) falls behind, the queue fills up and no new jobs
+        are submitted until it catches up.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        slots = asyncio.Semaphore(self.max_workers)
+        done = object()
+        # Prepared results waiting for the consumer
+        depth = QUEUE_DEPTH.labels(queue='cpu_stage')
+
+        async def run_one(key, args):
+            try:
+                result = await loop.run_in_executor(self.pool, fn, *args)
+                await queue.put((key, result, None))
+            except Exception as e:
+                await queue.put((key, None, e))
+            finally:
+                slots.release()
+                depth.set(queue.qsize())
+
+        async def produce():
+            tasks = []
+            try:
+                for key, args in jobs:
+                    await slots.acquire()
+                    tasks.append(asyncio.create_task(run_one(key, args)))
+                await asyncio.gather(*tasks)
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+            except Exception:
+                logger.exception("CPU stage producer failed")
+            await queue.put(done)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                depth.set(queue.qsize())
+                if item is done:
+                    break
+                yield item
+        finally:
+            producer.cancel()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+cpu_executor = None
+
+
+def get_cpu_executor() -> CPUStageExecutor:
+    global cpu_executor
+    if cpu_executor is None:
+        cpu_executor = CPUStageExecutor()
+    return cpu_executor
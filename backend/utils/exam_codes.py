@@ -0,0 +1,103 @@
+# utils/exam_codes.py - Exam code -> exam id lookup
+#
+# exam_codes/{code} holds {'exam_id': ...} and is written in the same
+# transaction as the exam, so a code is never handed out twice and resolving
+# one is a direct document get instead of a query over exams.
+
+import logging
+import secrets
+import string
+import threading
+from typing import Dict, Optional, Tuple
+
+from utils.firestore_writes import run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+CODES_COLLECTION = 'exam_codes'
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+MAX_CODE_ATTEMPTS = 10
+
+# Codes never change once assigned, so resolved mappings stay valid for the
+# life of the process. Misses are not cached.
+_code_cache: Dict[str, str] = {}
+_cache_lock = threading.Lock()
+
+
+def generate_code() -> str:
+    return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+
+def create_exam_with_code(db, exam_data: Dict) -> Tuple[str, str]:
+    """
+    Save a new exam together with its code mapping.
+
+    A fresh code is drawn until one is free; the mapping and the exam are
+    written in one transaction so two exams can never claim the same code.
+
+    Returns:
+        (exam_id, exam_code)
+    """
+    exam_ref = db.collection('exams').document()
+
+    def claim(transaction, code):
+        code_ref = db.collection(CODES_COLLECTION).document(code)
+        if code_ref.get(transaction=transaction).exists:
+            return False
+        transaction.create(code_ref, {'exam_id': exam_ref.id})
+        transaction.set(exam_ref, {**exam_data, 'exam_code': code})
+        return True
+
+    for _ in range(MAX_CODE_ATTEMPTS):
+        code = generate_code()
+        if run_in_transaction(db, claim, code):
+            _remember(code, exam_ref.id)
+            return exam_ref.id, code
+        logger.info(f"Exam code {code} already taken, drawing another")
+
+    raise RuntimeError("Could not allocate a unique exam code")
+
+
+def resolve_exam_id(db, exam_code: str) -> Optional[str]:
+    """Exam id for a code, from the cache or a single key get"""
+    with _cache_lock:
+        exam_id = _code_cache.get(exam_code)
+    if exam_id:
+        return exam_id
+
+    code_doc = db.collection(CODES_COLLECTION).document(exam_code).get()
+    if code_doc.exists:
+        exam_id = code_doc.to_dict()['exam_id']
+    else:
+        exam_id = _backfill(db, exam_code)
+
+    if exam_id:
+        _remember(exam_code, exam_id)
+    return exam_id
+
+
+def get_exam_by_code(db, exam_code: str):
+    """Exam snapshot for a code, or None if the code is unknown"""
+    exam_id = resolve_exam_id(db, exam_code)
+    if not exam_id:
+        return None
+    exam_doc = db.collection('exams').document(exam_id).get()
+    return exam_doc if exam_doc.exists else None
+
+
+def _backfill(db, exam_code: str) -> Optional[str]:
+    """Exams created before the lookup collection: find once by query and record the mapping"""
+    for exam_doc in db.collection('exams').where('exam_code', '==', exam_code).limit(1).stream():
+        try:
+            db.collection(CODES_COLLECTION).document(exam_code).create({'exam_id': exam_doc.id})
+        except Exception:
+            # Another request backfilled it first
+            pass
+        return exam_doc.id
+    return None
+
+
+def _remember(exam_code: str, exam_id: str):
+    with _cache_lock:
+        _code_cache[exam_code] = exam_id
@@ -0,0 +1,184 @@
+# utils/exam_stats.py - Running exam statistics maintained as papers are graded
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from utils.firestore_writes import commit_updates, get_write_buffer, run_in_transaction
+from utils.scoring import OPTION_LABELS
+
+logger = logging.getLogger(__name__)
+
+STATS_COLLECTION = 'exam_stats'
+HISTOGRAM_BINS = 10  # 0-10%, 10-20%, ..., 90-100%
+
+# Exams whose stats document was checked or backfilled by this process,
+# and one lock per exam so a slow backfill only holds up its own exam
+_backfilled = set()
+_backfill_locks: Dict[str, threading.Lock] = {}
+_backfill_locks_guard = threading.Lock()
+
+
+def empty_stats() -> Dict:
+    return {
+        'count': 0,
+        'sum_percentage': 0.0,
+        'sum_sq_percentage': 0.0,
+        'histogram': [0] * HISTOGRAM_BINS,
+        'questions': {}
+    }
+
+
+def contribution(results: List[Dict], percentage: float) -> Dict:
+    """What one graded paper adds to the exam statistics"""
+    questions = {}
+    for r in results:
+        max_points = r.get('max_points') or 0
+        entry = {'ratio': (r.get('score', 0.0) / max_points) if max_points else 0.0}
+        # Only an actually marked option counts as a wrong choice; blanks don't
+        if r.get('type') == 'mcq' and entry['ratio'] < 1 and r.get('student_answer') in OPTION_LABELS:
+            entry['wrong'] = r['student_answer']
+        questions[str(r['question_id'])] = entry
+    return {'percentage': float(percentage), 'questions': questions}
+
+
+def apply_contribution(stats: Dict, contrib: Dict, sign: int = 1) -> Dict:
+    """Add (sign=1) or remove (sign=-1) one paper from running aggregates"""
+    p = contrib['percentage']
+    stats['count'] += sign
+    stats['sum_percentage'] += sign * p
+    stats['sum_sq_percentage'] += sign * p * p
+    bin_idx = min(int(max(p, 0.0) * HISTOGRAM_BINS // 100), HISTOGRAM_BINS - 1)
+    stats['histogram'][bin_idx] += sign
+
+    for q_id, entry in contrib['questions'].items():
+        q = stats['questions'].setdefault(q_id, {'attempts': 0, 'correct': 0.0, 'wrong': {}})
+        q['attempts'] += sign
+        q['correct'] += sign * entry['ratio']
+        if 'wrong' in entry:
+            wrong = q['wrong']
+            wrong[entry['wrong']] = wrong.get(entry['wrong'], 0) + sign
+            if wrong[entry['wrong']] <= 0:
+                del wrong[entry['wrong']]
+    return stats
+
+
+def finalize(stats: Dict) -> Dict:
+    """Fill in derived fields so readers need nothing but this document"""
+    count = stats['count']
+    mean = stats['sum_percentage'] / count if count else 0.0
+    variance = max(stats['sum_sq_percentage'] / count - mean * mean, 0.0) if count else 0.0
+    stats['mean'] = round(mean, 2)
+    stats['std'] = round(variance ** 0.5, 2)
+
+    for q in stats['questions'].values():
+        q['correct_rate'] = round(q['correct'] / q['attempts'], 4) if q['attempts'] else None
+        q['most_common_wrong'] = max(q['wrong'], key=q['wrong'].get) if q['wrong'] else None
+
+    stats['updated_at'] = datetime.utcnow().isoformat()
+    return stats
+
+
+def record_graded_submission(db, exam_id: str, submission_ref, results: List[Dict], percentage: float):
+    """
+    Fold one graded paper into ``exam_stats/{exam_id}`` in a transaction.
+
+    The contribution applied is remembered on the submission (stats_applied)
+    so a regrade first takes the old one back out; counts never drift.
+    """
+    stats_ref = db.collection(STATS_COLLECTION).document(exam_id)
+    new_contrib = contribution(results, percentage)
+    try:
+        ensure_stats(db, exam_id)
+    except Exception:
+        logger.exception(f"Backfilling stats for exam {exam_id} failed")
+
+    def update(transaction):
+        stats_doc = stats_ref.get(transaction=transaction)
+        submission_doc = submission_ref.get(transaction=transaction)
+        stats = stats_doc.to_dict() if stats_doc.exists else empty_stats()
+
+        old_contrib = (submission_doc.to_dict() or {}).get('stats_applied')
+        if old_contrib:
+            apply_contribution(stats, old_contrib, sign=-1)
+        apply_contribution(stats, new_contrib)
+
+        transaction.set(stats_ref, finalize(stats))
+        transaction.update(submission_ref, {'stats_applied': new_contrib})
+
+    try:
+        run_in_transaction(db, update)
+    except Exception:
+        # Stats are advisory; never fail a grade because of them
+        logger.exception(f"Updating stats for exam {exam_id} failed")
+
+
+def rebuild_stats(db, exam_id: str, papers: Iterable[Dict]) -> Dict:
+    """
+    Recompute the stats document from scratch, e.g. after an exam-wide rescore.
+
+    Args:
+        papers: dicts with results and percentage of every graded submission
+    """
+    stats = empty_stats()
+    for paper in papers:
+        apply_contribution(stats, contribution(paper['results'], paper['percentage']))
+    stats = finalize(stats)
+    db.collection(STATS_COLLECTION).document(exam_id).set(stats)
+    return stats
+
+
+def backfill_stats(db, exam_id: str) -> Dict:
+    """
+    Build the stats document from every graded submission of the exam and
+    mark each as counted (stats_applied), for exams graded before stats
+    were kept. Buffered grade writes are flushed first so they're included.
+    """
+    get_write_buffer().flush()
+    docs = list(
+        db.collection('submissions')
+        .where('exam_id', '==', exam_id)
+        .where('status', '==', 'graded')
+        .stream()
+    )
+    papers, updates = [], []
+    for doc in docs:
+        sub = doc.to_dict()
+        paper = {'results': sub.get('results') or [], 'percentage': sub.get('percentage') or 0.0}
+        papers.append(paper)
+        updates.append((doc.reference, {'stats_applied': contribution(paper['results'], paper['percentage'])}))
+    commit_updates(db, updates)
+    stats = rebuild_stats(db, exam_id, papers)
+    logger.info(f"Backfilled stats for exam {exam_id} from {len(papers)} graded submissions")
+    return stats
+
+
+def ensure_stats(db, exam_id: str) -> Optional[Dict]:
+    """
+    The exam's stats document, backfilled once if it doesn't exist yet.
+
+    Returns:
+        the stats when they had to be built, else None
+    """
+    if exam_id in _backfilled:
+        return None
+    with _backfill_locks_guard:
+        lock = _backfill_locks.setdefault(exam_id, threading.Lock())
+    with lock:
+        if exam_id in _backfilled:
+            return None
+        built = None
+        if not db.collection(STATS_COLLECTION).document(exam_id).get().exists:
+            built = backfill_stats(db, exam_id)
+        _backfilled.add(exam_id)
+        return built
+
+
+def get_stats(db, exam_id: str) -> Optional[Dict]:
+    """Stats document of the exam, built from its graded papers if missing"""
+    built = ensure_stats(db, exam_id)
+    if built is not None:
+        return built
+    doc = db.collection(STATS_COLLECTION).document(exam_id).get()
+    return doc.to_dict() if doc.exists else None
@@ -0,0 +1,156 @@
+# utils/fiducials.py - Corner fiducials: sheet-to-photo homography and direct region warps
+#
+# Printed sheets carry a nested-square marker (black square, white square,
+# black center) near each corner. Finding the four centers in a photo gives
+# a homography from template coordinates (the TARGET 1275x1650 space the
+# regions are drawn in) to photo pixels, and every region is then warped
+# straight out of the original photo: one resample per region, and the crop
+# lands on the printed region whatever the framing.
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SIZE = (1275, 1650)
+# Marker geometry in template pixels: outer black square, white square, black center
+FIDUCIAL_OUTER = 48
+FIDUCIAL_INNER = 28
+FIDUCIAL_CENTER = 14
+# Gap between the sheet edge and the marker
+FIDUCIAL_INSET = 24
+
+# Photos are searched at this longest side, in a window of this fraction of
+# the width/height at each corner
+SEARCH_MAX_DIM = 1000
+SEARCH_FRACTION = 0.35
+
+
+def fiducial_centers(size: Tuple[int, int] = TEMPLATE_SIZE) -> np.ndarray:
+    """Marker centers in template pixels: TL, TR, BR, BL"""
+    width, height = size
+    offset = FIDUCIAL_INSET + FIDUCIAL_OUTER / 2
+    return np.float32([
+        [offset, offset],
+        [width - offset, offset],
+        [width - offset, height - offset],
+        [offset, height - offset]
+    ])
+
+
+def draw_fiducials(img: np.ndarray) -> np.ndarray:
+    """Draw the four markers onto a template-sized sheet (in place)"""
+    height, width = img.shape[:2]
+    scale = width / TEMPLATE_SIZE[0]
+    for cx, cy in fiducial_centers((width, height)):
+        for side, color in ((FIDUCIAL_OUTER, 0), (FIDUCIAL_INNER, 255), (FIDUCIAL_CENTER, 0)):
+            half = side * scale / 2
+            cv2.rectangle(img, (int(round(cx - half)), int(round(cy - half))),
+                          (int(round(cx + half)) - 1, int(round(cy + half)) - 1),
+                          (color, color, color) if img.ndim == 3 else color, -1)
+    return img
+
+
+def _marker_candidates(gray: np.ndarray) -> List[Tuple[float, float, float]]:
+    """(x, y, side) of every nested-square marker in a grayscale patch"""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+    hierarchy = hierarchy[0]
+
+    found = []
+    for i, contour in enumerate(contours):
+        area = cv2.contourArea(contour)
+        child = hierarchy[i][2]
+        if area < 16 or child < 0 or hierarchy[child][2] < 0:
+            continue
+        (_, _), (w, h), _ = cv2.minAreaRect(contour)
+        if not w or not h or not 0.6 < w / h < 1.6 or area < 0.8 * w * h:
+            continue
+        # The white square inside covers about (28/48)^2 of the marker
+        if not 0.15 < cv2.contourArea(contours[child]) / area < 0.6:
+            continue
+        m = cv2.moments(contour)
+        found.append((m['m10'] / m['m00'], m['m01'] / m['m00'], float(np.sqrt(area))))
+    return found
+
+
+def find_fiducials(img: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Locate the four corner markers in a photo.
+
+    Each corner is searched on a downscaled copy, in a window at that
+    corner of the photo, taking the marker nearest the corner; the center
+    is then re-measured on the full-resolution pixels around it.
+
+    Returns:
+        marker centers in photo pixels (TL, TR, BR, BL), or None
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    height, width = gray.shape
+    scale = min(1.0, SEARCH_MAX_DIM / max(width, height))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    sh, sw = small.shape
+    win_w, win_h = int(sw * SEARCH_FRACTION), int(sh * SEARCH_FRACTION)
+
+    points = []
+    for corner_x, corner_y in ((0, 0), (1, 0), (1, 1), (0, 1)):
+        x0 = sw - win_w if corner_x else 0
+        y0 = sh - win_h if corner_y else 0
+        candidates = _marker_candidates(small[y0:y0 + win_h, x0:x0 + win_w])
+        if not candidates:
+            return None
+        anchor = (corner_x * win_w, corner_y * win_h)
+        x, y, side = min(candidates, key=lambda c: (c[0] - anchor[0]) ** 2 + (c[1] - anchor[1]) ** 2)
+        points.append(_refine(gray, (x + x0) / scale, (y + y0) / scale, side / scale))
+
+    points = np.float32(points)
+    if not _plausible(points):
+        return None
+    return points
+
+
+def _refine(gray: np.ndarray, x: float, y: float, side: float) -> Tuple[float, float]:
+    """Re-measure a marker center on full-resolution pixels around an estimate"""
+    r = int(side * 1.5) + 4
+    x0, y0 = max(0, int(x) - r), max(0, int(y) - r)
+    patch = gray[y0:int(y) + r, x0:int(x) + r]
+    candidates = _marker_candidates(patch)
+    if not candidates:
+        return x, y
+    cx, cy, _ = min(candidates, key=lambda c: (c[0] + x0 - x) ** 2 + (c[1] + y0 - y) ** 2)
+    return cx + x0, cy + y0
+
+
+def _plausible(points: np.ndarray) -> bool:
+    """Convex quad whose side ratios roughly match the template's"""
+    if not cv2.isContourConvex(points.reshape(-1, 1, 2)):
+        return False
+    expected = fiducial_centers()
+    top, left = np.linalg.norm(points[1] - points[0]), np.linalg.norm(points[3] - points[0])
+    bottom, right = np.linalg.norm(points[2] - points[3]), np.linalg.norm(points[2] - points[1])
+    aspect = (left + right) / max(top + bottom, 1e-6)
+    expected_aspect = (expected[3, 1] - expected[0, 1]) / (expected[1, 0] - expected[0, 0])
+    return 0.7 < aspect / expected_aspect < 1.4
+
+
+def template_homography(points: np.ndarray, size: Tuple[int, int] = TEMPLATE_SIZE) -> np.ndarray:
+    """Homography taking template pixels (``size`` space) to photo pixels"""
+    return cv2.getPerspectiveTransform(fiducial_centers(size), np.float32(points))
+
+
+def warp_region(img: np.ndarray, homography: np.ndarray, region: Dict) -> np.ndarray:
+    """
+    Cut a template-space rectangle (x, y, width, height) straight out of
+    the photo through the template->photo homography.
+    """
+    x, y, w, h = region['x'], region['y'], region['width'], region['height']
+    shift = np.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=np.float64)
+    # Output pixel (u, v) samples the photo at H * (u + x, v + y)
+    return cv2.warpPerspective(img, np.asarray(homography) @ shift, (w, h),
+                               flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                               borderMode=cv2.BORDER_REPLICATE)
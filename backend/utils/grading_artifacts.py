@@ -0,0 +1,105 @@
+# utils/grading_artifacts.py - Per-region grading artifacts for incremental regrades
+
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+from utils.grading_stages import mcq_blocks
+
+# Bump when the corresponding stage changes its output for the same pixels,
+# so stored artifacts from the old version are recomputed instead of reused
+OMR_VERSION = "omr-3"
+OCR_VERSION = "kazars24/trocr-base-handwritten-ru:line-word-1"
+COMPARATOR_VERSION = "gpt-4.1-mini:1"
+
+
+def _digest(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _geometry(region: Dict) -> Dict:
+    return {k: region.get(k) for k in ('type', 'x', 'y', 'width', 'height')}
+
+
+def mcq_key(blocks: List[Dict], job: Dict) -> str:
+    """Identity of an MCQ detection: block geometry and ranges, sheet normalization and OMR settings"""
+    return _digest({
+        'blocks': [
+            {**_geometry(b['region']), 'start': b['question_start'], 'count': b['num_questions'], 'options': b['options']}
+            for b in blocks
+        ],
+        'target_size': job['target_size'],
+        'detect_paper': job.get('detect_paper', False),
+        'fiducials': job.get('fiducials', False),
+        'bubbles': [job.get('bubbles'), job.get('bubble_radius')],
+        'omr': job['omr'],
+        'calibration': (job.get('omr_calibration') or {}).get('mode', 'off'),
+        'version': OMR_VERSION
+    })
+
+
+def ocr_key(region: Dict, job: Dict) -> str:
+    """Identity of an OCR read: region geometry, sheet normalization and model"""
+    return _digest({
+        'region': _geometry(region),
+        'target_size': job['target_size'],
+        'detect_paper': job.get('detect_paper', False),
+        'fiducials': job.get('fiducials', False),
+        'version': OCR_VERSION
+    })
+
+
+def alignment_key(job: Dict) -> str:
+    """Identity of the sheet layout a stored template->photo homography was found for"""
+    return _digest({
+        'target_size': job['target_size'],
+        'fiducials': job.get('fiducials', False),
+        'bubbles': [job.get('bubbles'), job.get('bubble_radius')]
+    })
+
+
+def similarity_key(student_text: str, correct_answer: str, question_text: str) -> str:
+    """Identity of a comparator call; changes whenever the answer key does"""
+    return _digest({
+        'student': student_text,
+        'correct': correct_answer,
+        'question': question_text,
+        'version': COMPARATOR_VERSION
+    })
+
+
+def plan_regrade(job: Dict, artifacts: Optional[Dict]) -> Dict:
+    """
+    Mark which parts of a prepare job can reuse stored artifacts.
+
+    Adds to ``job``:
+        mcq_key / skip_mcq: whether the stored MCQ detection (all MCQ
+            blocks together) is still valid
+        written_keys: OCR key per written region index
+        written_indices: written region indices that need OCR again
+    """
+    artifacts = artifacts or {}
+    regions = job['regions']
+
+    blocks = mcq_blocks(regions, job['num_mcq'], job['options_per_question'])
+    job['mcq_key'] = mcq_key(blocks, job) if blocks else None
+    stored_mcq = artifacts.get('mcq') or {}
+    job['skip_mcq'] = job['mcq_key'] is not None and stored_mcq.get('key') == job['mcq_key']
+
+    written_regions = [r for r in regions if r['type'] == 'written'][:job['num_written']]
+    stored_written = artifacts.get('written') or {}
+    job['written_keys'] = [ocr_key(r, job) for r in written_regions]
+    job['written_indices'] = [
+        idx for idx, key in enumerate(job['written_keys'])
+        if (stored_written.get(str(idx)) or {}).get('key') != key
+    ]
+    return job
+
+
+def needs_cpu_stage(job: Dict) -> bool:
+    """False when every region can be served from stored artifacts"""
+    return (job['mcq_key'] is not None and not job['skip_mcq']) or bool(job['written_indices'])
+
+
+def cached_written_indices(job: Dict) -> List[int]:
+    return [idx for idx in range(len(job['written_keys'])) if idx not in job['written_indices']]
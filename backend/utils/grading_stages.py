@@ -0,0 +1,311 @@
+# utils/grading_stages.py - CPU stage of grading, runs inside the process pool
+
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.answer_sheet import BUBBLE_RADIUS
+from utils.fiducials import find_fiducials, template_homography, warp_region
+from utils.omr_detection import OMRDetector
+from utils.paper_detection import PaperDetector
+from utils.image_ops import preprocess_image
+from utils.metrics import collect_timings, span
+
+logger = logging.getLogger(__name__)
+
+DEBUG_DIR = "debug_crops"
+
+
+def prepare_submission(job: Dict) -> Dict:
+    """
+    Decode, normalize and preprocess one submission sheet.
+
+    Everything CPU-bound happens here so the request thread only runs the
+    inference stage (TrOCR + comparison) on the prepared crops.
+
+    Args:
+        job: dict with submission_id, image_path, regions, num_mcq,
+            options_per_question, num_written, target_size (w, h),
+            detect_paper, omr (OMRDetector kwargs) and omr_calibration
+            ({mode, prior}, see utils/omr_calibration.py); fiducials=True
+            aligns on the printed corner markers (homography: a stored
+            template->photo homography to reuse, alignment_key: the layout
+            it is stored under) and bubbles/bubble_radius
+            (from a generated answer sheet) are then sampled in place; skip_mcq and
+            written_indices (from plan_regrade) limit the work to regions
+            without a reusable artifact; save_debug=False skips the
+            debug_crops images
+
+    Returns:
+        dict with keys: original_size, alignment, mcq, written, prepare_ms, error
+    """
+    start = time.perf_counter()
+    with collect_timings() as timings:
+        prepared = _prepare(job)
+    prepared['timings'] = timings
+    prepared['prepare_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return prepared
+
+
+def _prepare(job: Dict) -> Dict:
+    submission_id = job['submission_id']
+    target_width, target_height = job['target_size']
+
+    with span('decode'):
+        image_np = cv2.imread(job['image_path'])
+    if image_np is None:
+        return {"error": "Could not read image"}
+
+    # ALIGN: with printed fiducials every region is warped straight out of
+    # the photo; otherwise the sheet is normalized to the standard size once
+    original_size = image_np.shape[:2]
+    target_size = (target_width, target_height)
+    alignment = {'method': None}
+    with span('normalize'):
+        # A stored homography only applies to a sheet still aligned on fiducials
+        homography = job.get('homography') if job.get('fiducials') else None
+        if homography is None and job.get('fiducials'):
+            points = find_fiducials(image_np)
+            if points is not None:
+                homography = template_homography(points, target_size)
+            else:
+                logger.info("Fiducials not found, falling back to whole-sheet normalization")
+
+        if homography is not None:
+            homography = np.asarray(homography, dtype=np.float64)
+            sheet = SheetView(image_np, homography)
+            alignment = {'method': 'fiducials', 'homography': homography.tolist(),
+                         'key': job.get('alignment_key')}
+            logger.info(f"Aligned on fiducials: {original_size}")
+        elif job.get('detect_paper'):
+            outputs, detected = PaperDetector().normalize(image_np, [target_size])
+            sheet = SheetView(outputs[target_size])
+            alignment['method'] = 'paper' if detected else 'resize'
+            logger.info(f"Paper {'detected and warped' if detected else 'not found, resized'}: "
+                        f"{original_size} -> {target_size}")
+        else:
+            sheet = SheetView(cv2.resize(image_np, target_size))
+            alignment['method'] = 'resize'
+            logger.info(f"Resized image: {original_size} -> {target_size}")
+
+    # DEBUG: Save resized full sheet
+    if job.get('save_debug', True):
+        os.makedirs(DEBUG_DIR, exist_ok=True)
+        full = {'x': 0, 'y': 0, 'width': target_width, 'height': target_height}
+        cv2.imwrite(os.path.join(DEBUG_DIR, f"{submission_id}_resized.jpg"), sheet.crop(full))
+
+    regions = job['regions']
+    prepared = {
+        "original_size": original_size,
+        "alignment": alignment,
+        "mcq": None,
+        "written": []
+    }
+
+    # ============ MCQ REGIONS ============
+    if job['num_mcq'] and not job.get('skip_mcq'):
+        try:
+            blocks = mcq_blocks(regions, job['num_mcq'], job['options_per_question'])
+            if blocks:
+                with span('omr'):
+                    prepared['mcq'] = _detect_mcq(sheet, blocks, job)
+        except Exception as e:
+            logger.exception("MCQ stage failed")
+            prepared['mcq'] = {"error": str(e)}
+
+    # ============ WRITTEN REGIONS ============
+    written_regions = [r for r in regions if r['type'] == 'written'][:job['num_written']]
+    indices = job.get('written_indices', range(len(written_regions)))
+    if indices:
+        with span('segment'):
+            prepared['written'] = _crop_written(sheet, written_regions, indices)
+
+    return prepared
+
+
+class SheetView:
+    """
+    Template-space crops of one sheet: warped out of the photo through a
+    template->photo homography, or sliced from the already normalized sheet.
+    """
+
+    def __init__(self, image: np.ndarray, homography: np.ndarray = None):
+        self.image = image
+        self.homography = homography
+
+    def crop(self, region: Dict) -> np.ndarray:
+        if self.homography is not None:
+            return warp_region(self.image, self.homography, region)
+        x, y, w, h = region['x'], region['y'], region['width'], region['height']
+        return self.image[y:y+h, x:x+w]
+
+
+def mcq_blocks(regions: List[Dict], num_mcq: int, options_per_question: int) -> List[Dict]:
+    """
+    Question range and option count of every MCQ region.
+
+    A region may set question_start (1-based), num_questions and options;
+    questions not claimed explicitly are split in order over the regions
+    that don't say, so a single unannotated region still covers the whole
+    exam.
+
+    Returns:
+        list of {region, question_start, num_questions, options}
+
+    Raises:
+        ValueError: if the ranges overlap or fall outside the exam
+    """
+    mcq_regions = [r for r in regions if r['type'] == 'mcq']
+    claimed = sum(int(r['num_questions']) for r in mcq_regions if r.get('num_questions') is not None)
+    open_regions = [r for r in mcq_regions if r.get('num_questions') is None]
+    share = math.ceil(max(num_mcq - claimed, 0) / len(open_regions)) if open_regions else 0
+
+    blocks, next_question, remaining = [], 1, num_mcq - claimed
+    for region in mcq_regions:
+        if region.get('num_questions') is not None:
+            count = int(region['num_questions'])
+        else:
+            count = max(0, min(share, remaining))
+            remaining -= count
+        start = int(region.get('question_start') or next_question)
+        next_question = start + count
+        if count:
+            blocks.append({
+                'region': region,
+                'question_start': start,
+                'num_questions': count,
+                'options': int(region.get('options') or options_per_question)
+            })
+
+    covered = sorted((b['question_start'], b['question_start'] + b['num_questions'] - 1) for b in blocks)
+    for (_, end), (start, _) in zip(covered, covered[1:]):
+        if start <= end:
+            raise ValueError(f"MCQ regions overlap at question {start}")
+    if covered and (covered[0][0] < 1 or covered[-1][1] > num_mcq):
+        raise ValueError(f"MCQ regions cover questions {covered[0][0]}-{covered[-1][1]}, exam has {num_mcq}")
+    return blocks
+
+
+def _detect_mcq(sheet: SheetView, blocks: List[Dict], job: Dict) -> Dict:
+    """
+    Read the bubbles of every MCQ block and merge them into one answer map.
+
+    Bubble detection runs on one thread per block (OpenCV releases the
+    GIL), so a sheet with its questions spread over several regions takes
+    about as long as its largest block. The marked/unmarked threshold is
+    then fitted on the bubbles of the whole sheet (job['omr_calibration']
+    gives the mode and the exam's learned threshold as fallback) before the
+    grids are read.
+    """
+    crops = []
+    for index, block in enumerate(blocks):
+        crops.append(sheet.crop(block['region']))
+
+        # DEBUG: Save cropped MCQ region
+        if job.get('save_debug', True):
+            suffix = f"_{index + 1}" if index else ""
+            cv2.imwrite(os.path.join(DEBUG_DIR, f"{job['submission_id']}_mcq_crop{suffix}.jpg"), crops[-1])
+
+    detector = OMRDetector(**job['omr'])
+    # Sheets printed from the exam's layout and aligned on their fiducials
+    # are sampled at the known bubble centers; anything else is searched
+    layout_rows = _layout_rows(blocks, job) if sheet.homography is not None else None
+    if layout_rows is not None:
+        radius = int(job.get('bubble_radius') or BUBBLE_RADIUS + 1)
+        block_rows = [detector.sample_bubbles(crop, centers, radius) for crop, centers in zip(crops, layout_rows)]
+        block_bubbles = [[b for row in rows for b in row if b is not None] for rows in block_rows]
+    elif len(blocks) == 1:
+        block_bubbles = [detector.detect_bubbles(crops[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(blocks)) as pool:
+            block_bubbles = list(pool.map(detector.detect_bubbles, crops))
+
+    settings = job.get('omr_calibration') or {}
+    calibration = None
+    if settings.get('mode', 'off') != 'off':
+        calibration = detector.calibrate([b for bubbles in block_bubbles for b in bubbles], settings.get('prior'))
+
+    answers, confidence = {}, {}
+    for index, (block, crop, bubbles) in enumerate(zip(blocks, crops, block_bubbles)):
+        if layout_rows is not None:
+            grid = detector.read_rows(block_rows[index], block['options'])
+        else:
+            grid = detector.read_grid(
+                crop,
+                num_questions=block['num_questions'],
+                options_per_question=block['options'],
+                bubbles=bubbles
+            )
+        offset = block['question_start'] - 1
+        for question, answer in grid['answers'].items():
+            answers[str(int(question) + offset)] = answer
+            confidence[str(int(question) + offset)] = grid['confidence'][question]
+
+    all_bubbles = [b for bubbles in block_bubbles for b in bubbles]
+    return {
+        "answers": answers,
+        "confidence": confidence,
+        "calibration": calibration,
+        "total_bubbles_detected": len(all_bubbles),
+        "marked_bubbles": len([b for b in all_bubbles if b['is_marked']])
+    }
+
+
+def _layout_rows(blocks: List[Dict], job: Dict) -> Optional[List[List[List[Tuple[int, int]]]]]:
+    """
+    Per block, the printed bubble centers of its questions in block-crop
+    pixels, from job['bubbles'] ([{question, y, x: [...]}], saved in
+    omr_config by the answer-sheet endpoint). None if the layout doesn't
+    cover every question with the block's option count.
+    """
+    layout = {int(b['question']): b for b in job.get('bubbles') or []}
+    if not layout:
+        return None
+
+    rows = []
+    for block in blocks:
+        region = block['region']
+        centers = []
+        for question in range(block['question_start'], block['question_start'] + block['num_questions']):
+            entry = layout.get(question)
+            if entry is None or len(entry['x']) != block['options']:
+                return None
+            centers.append([(x - region['x'], entry['y'] - region['y']) for x in entry['x']])
+        rows.append(centers)
+    return rows
+
+
+def _crop_written(sheet: SheetView, all_regions: List[Dict], indices) -> List[Dict]:
+    """
+    Cut each written region out of the sheet together with its slice of a
+    binary computed once for the whole written area.
+
+    Only the bounding box of the written regions is binarized: it still takes
+    a single CLAHE/denoise/Otsu pass with one shared threshold, but skips the
+    MCQ block and margins, where non-local-means denoising is most of the cost.
+    """
+    regions = [all_regions[idx] for idx in indices]
+    x0 = min(r['x'] for r in regions)
+    y0 = min(r['y'] for r in regions)
+    x1 = max(r['x'] + r['width'] for r in regions)
+    y1 = max(r['y'] + r['height'] for r in regions)
+    area = sheet.crop({'x': x0, 'y': y0, 'width': x1 - x0, 'height': y1 - y0})
+    sheet_binary = preprocess_image(area)
+
+    crops = []
+    for idx, region in zip(indices, regions):
+        w, h = region['width'], region['height']
+        bx, by = region['x'] - x0, region['y'] - y0
+        crops.append({
+            "index": idx,
+            "region": region,
+            "image": cv2.cvtColor(area[by:by+h, bx:bx+w], cv2.COLOR_BGR2RGB),
+            "binary": sheet_binary[by:by+h, bx:bx+w].copy()
+        })
+    return crops
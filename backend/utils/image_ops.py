@@ -0,0 +1,35 @@
+# utils/image_ops.py - OpenCV image helpers shared by the OCR and grading stages
+#
+# Kept free of torch so the CPU-pool workers (utils/grading_stages.py) can
+# use them without importing the OCR model stack.
+
+import cv2
+import numpy as np
+
+
+def preprocess_image(image: np.ndarray) -> np.ndarray:
+    """Preprocess image for better OCR accuracy"""
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    # Apply CLAHE for better contrast
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    gray = clahe.apply(gray)
+    
+    # Denoise more aggressively
+    denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
+    
+    # Try Otsu's thresholding first
+    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    
+    # Invert if background is dark
+    if np.mean(binary) < 127:
+        binary = cv2.bitwise_not(binary)
+    
+    # Morphological operations to clean up
+    kernel = np.ones((2,2), np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    
+    return binary
@@ -0,0 +1,279 @@
+# utils/ingest.py - Spooled submission ingest
+#
+# An upload is appended to a spool file and fsync'd, then acknowledged with a
+# receipt. Everything slow (paper validation, thumbnail, Firestore writes)
+# happens afterwards in a small pool of background workers, so a whole class
+# uploading at the deadline only costs each request a local disk write.
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+import cv2
+
+from utils.metrics import QUEUE_DEPTH
+from utils.renditions import JPEG_QUALITY, RENDITION_WIDTHS, resize_to_width
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = "uploads/spool"
+THUMBNAIL_DIR = "uploads/thumbnails"
+CHUNK_SIZE = 1024 * 1024
+# Finished receipts are kept this long, and at most this many, for polling;
+# stored uploads can still be looked up on their submission afterwards
+RECEIPT_TTL = float(os.getenv("INGEST_RECEIPT_TTL", "3600"))
+MAX_RECEIPTS = int(os.getenv("INGEST_MAX_RECEIPTS", "10000"))
+FINAL_STATUSES = ('stored', 'duplicate', 'failed')
+
+
+def _write_synced(path: str, chunks):
+    with open(path, "ab") as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class UploadTooLarge(ValueError):
+    """An upload went over the size its endpoint accepts"""
+
+
+def save_upload(fileobj, path: str, max_bytes: Optional[int] = None) -> int:
+    """
+    Copy an upload to ``path`` in CHUNK_SIZE pieces, returning the bytes written.
+
+    Raises:
+        UploadTooLarge: more than ``max_bytes`` arrived (the partial file is removed)
+    """
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+            written += len(chunk)
+            if max_bytes is not None and written > max_bytes:
+                break
+            f.write(chunk)
+    if max_bytes is not None and written > max_bytes:
+        os.remove(path)
+        raise UploadTooLarge(f"Upload is larger than {max_bytes // (1024 * 1024)} MB")
+    return written
+
+
+def _limited_chunks(fileobj, max_bytes: Optional[int]):
+    """CHUNK_SIZE pieces of an upload, raising UploadTooLarge past ``max_bytes``"""
+    read = 0
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        read += len(chunk)
+        if max_bytes is not None and read > max_bytes:
+            raise UploadTooLarge(f"Upload is larger than {max_bytes // (1024 * 1024)} MB")
+        yield chunk
+
+
+def read_upload(fileobj, max_bytes: int) -> bytes:
+    """
+    Read a small upload into memory, at most ``max_bytes``.
+
+    Raises:
+        UploadTooLarge: the upload is bigger than that
+    """
+    data = fileobj.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLarge(f"Upload is larger than {max_bytes // (1024 * 1024)} MB")
+    return data
+
+
+def spool_upload(fileobj, meta: Dict, spool_dir: str = SPOOL_DIR, max_bytes: Optional[int] = None) -> Dict:
+    """
+    Durably store an upload and its metadata in the spool.
+
+    The image is appended in chunks (memory stays bounded by CHUNK_SIZE) and
+    fsync'd before the metadata file that makes it visible to recovery.
+
+    Returns:
+        meta with receipt_id and spool_path filled in
+
+    Raises:
+        UploadTooLarge: more than ``max_bytes`` arrived; like any failed
+            write, nothing is left behind in the spool
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    receipt_id = meta.get('receipt_id') or uuid.uuid4().hex
+    spool_path = os.path.join(spool_dir, f"{receipt_id}.jpg")
+    meta_path = os.path.join(spool_dir, f"{receipt_id}.json")
+
+    try:
+        _write_synced(spool_path, _limited_chunks(fileobj, max_bytes))
+        meta = {**meta, 'receipt_id': receipt_id, 'spool_path': spool_path}
+        _write_synced(meta_path + ".tmp", [json.dumps(meta).encode()])
+        os.replace(meta_path + ".tmp", meta_path)
+    except BaseException:
+        for path in (spool_path, meta_path + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return meta
+
+
+def release_spooled(meta: Dict):
+    """Drop a spool entry once it has been handled"""
+    for path in (meta['spool_path'], os.path.splitext(meta['spool_path'])[0] + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def inspect_upload(image_path: str, thumbnail_path: str) -> Dict:
+    """
+    Paper validation and thumbnail for a stored upload (runs in the CPU pool).
+
+    Returns:
+        {'readable', 'paper_detected', 'thumbnail_path'}
+    """
+    from utils.paper_detection import PaperDetector
+
+    img = cv2.imread(image_path)
+    if img is None:
+        return {'readable': False, 'paper_detected': False, 'thumbnail_path': None}
+
+    corners = PaperDetector().find_paper_corners(img, refine=False)
+
+    thumb = resize_to_width(img, RENDITION_WIDTHS['thumb'])
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    cv2.imwrite(thumbnail_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY['thumb']])
+
+    return {'readable': True, 'paper_detected': corners is not None, 'thumbnail_path': thumbnail_path}
+
+
+class IngestPipeline:
+    """
+    Background workers draining spooled uploads through ``handler``.
+
+    Receipts are tracked in memory so clients can poll the outcome; the
+    spool itself is the durable record, and entries left behind by a crash
+    are picked up again by ``recover()`` at startup.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict], Awaitable[Dict]],
+        concurrency: int = 4,
+        spool_dir: str = SPOOL_DIR
+    ):
+        """
+        Args:
+            handler: Coroutine storing one spooled upload, returning a status dict
+            concurrency: Uploads processed at the same time
+        """
+        self.handler = handler
+        self.concurrency = concurrency
+        self.spool_dir = spool_dir
+        self.receipts: "OrderedDict[str, Dict]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        # Submission ids accepted but not yet stored, to turn away double taps early
+        self.in_flight = set()
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def enqueue(self, meta: Dict) -> Dict:
+        self._ensure_workers()
+        receipt = {'receipt_id': meta['receipt_id'], 'status': 'queued', 'student_id': meta.get('student_id')}
+        self.receipts[meta['receipt_id']] = receipt
+        self._evict()
+        if meta.get('submission_id'):
+            self.in_flight.add(meta['submission_id'])
+        await self._queue.put(meta)
+        QUEUE_DEPTH.labels(queue='ingest').set(self._queue.qsize())
+        return receipt
+
+    async def _worker(self):
+        while True:
+            meta = await self._queue.get()
+            QUEUE_DEPTH.labels(queue='ingest').set(self._queue.qsize())
+            receipt = self.receipts[meta['receipt_id']]
+            try:
+                receipt.update(await self.handler(meta))
+                release_spooled(meta)
+            except Exception as e:
+                # Left in the spool; recover() retries it on the next start
+                logger.exception(f"Ingest of {meta['receipt_id']} failed")
+                receipt.update({'status': 'failed', 'error': str(e)})
+            finally:
+                receipt['finished_at'] = time.monotonic()
+                self.in_flight.discard(meta.get('submission_id'))
+                self._queue.task_done()
+
+    def _evict(self):
+        """Drop finished receipts past RECEIPT_TTL, then the oldest finished ones over MAX_RECEIPTS"""
+        now = time.monotonic()
+        expired = [
+            receipt_id for receipt_id, receipt in self.receipts.items()
+            if receipt['status'] in FINAL_STATUSES and now - receipt.get('finished_at', now) > RECEIPT_TTL
+        ]
+        for receipt_id in expired:
+            del self.receipts[receipt_id]
+        if len(self.receipts) > MAX_RECEIPTS:
+            finished = [rid for rid, r in self.receipts.items() if r['status'] in FINAL_STATUSES]
+            for receipt_id in finished[:len(self.receipts) - MAX_RECEIPTS]:
+                del self.receipts[receipt_id]
+
+    async def recover(self) -> int:
+        """
+        Re-queue spool entries that were accepted but never stored.
+
+        Their receipts are rebuilt from the spool metadata (receipt id and
+        student) as 'queued', so clients polling across a restart keep
+        getting an answer. Metadata whose image is gone (already moved into
+        place by the handler) and files no metadata points to are removed.
+        """
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        count, removed = 0, 0
+        names = sorted(os.listdir(self.spool_dir))
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.spool_dir, name)
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if os.path.exists(meta['spool_path']):
+                await self.enqueue(meta)
+                count += 1
+            else:
+                os.remove(meta_path)
+                removed += 1
+        # Images written without their metadata and unfinished metadata files
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext == ".tmp" or (ext == ".jpg" and f"{stem}.json" not in names):
+                os.remove(os.path.join(self.spool_dir, name))
+                removed += 1
+        if count:
+            logger.info(f"Recovered {count} spooled uploads")
+        if removed:
+            logger.info(f"Removed {removed} stale spool files")
+        return count
+
+    def status(self, receipt_id: str) -> Optional[Dict]:
+        self._evict()
+        return self.receipts.get(receipt_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def drain(self):
+        """Wait until everything queued so far has been handled"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._queue = None
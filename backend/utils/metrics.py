@@ -0,0 +1,78 @@
+# utils/metrics.py - Stage timings and pipeline gauges exported for Prometheus
+
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    'testly_stage_seconds',
+    'Time spent in each grading stage',
+    ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+OCR_BATCH_SIZE = Gauge('testly_ocr_batch_size', 'Word crops in the last TrOCR generate call')
+GRADING_BATCH_SIZE = Gauge('testly_grading_batch_size', 'Papers in running grade-all sessions')
+QUEUE_DEPTH = Gauge('testly_queue_depth', 'Items waiting in a pipeline queue', ['queue'])
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Stages timed inside a process-pool worker can't reach the parent's registry,
+# so while a collector is active spans are recorded into it instead and the
+# parent observes them when the result comes back (see observe_timings).
+_collector = threading.local()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as ``stage``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings: Optional[Dict[str, List[float]]] = getattr(_collector, 'timings', None)
+        if timings is not None:
+            timings.setdefault(stage, []).append(elapsed)
+        else:
+            STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        logger.debug(f"{stage}: {elapsed * 1000:.1f} ms")
+
+
+def timed(stage: str):
+    """Decorator form of span"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def collect_timings():
+    """Gather spans of this thread into a dict instead of the registry"""
+    previous = getattr(_collector, 'timings', None)
+    _collector.timings = {}
+    try:
+        yield _collector.timings
+    finally:
+        _collector.timings = previous
+
+
+def observe_timings(timings: Optional[Dict[str, List[float]]]):
+    """Record spans collected in another process"""
+    for stage, values in (timings or {}).items():
+        for value in values:
+            STAGE_SECONDS.labels(stage=stage).observe(value)
+
+
+def render_metrics() -> bytes:
+    return generate_latest()
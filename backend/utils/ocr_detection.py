@@ -7,10 +7,13 @@ import cv2
 import numpy as np
 import torch
 from PIL import Image
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import logging
 from scipy.ndimage import gaussian_filter1d
 
+from utils.image_ops import preprocess_image
+from utils.metrics import OCR_BATCH_SIZE, span, timed
+
 logger = logging.getLogger(__name__)
 # ocr_detector.py
 ocr_processor = None
@@ -27,37 +30,19 @@ def initialize_ocr_model(processor, model, device_name):
     logger.info(f"OCR model initialized on device: {device}")
 
 
-def preprocess_image(image: np.ndarray) -> np.ndarray:
-    """Preprocess image for better OCR accuracy"""
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-    
-    # Apply CLAHE for better contrast
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    gray = clahe.apply(gray)
-    
-    # Denoise more aggressively
-    denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
-    
-    # Try Otsu's thresholding first
-    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    
-    # Invert if background is dark
-    if np.mean(binary) < 127:
-        binary = cv2.bitwise_not(binary)
-    
-    # Morphological operations to clean up
-    kernel = np.ones((2,2), np.uint8)
-    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-    
-    return binary
-
+def detect_lines(
+    image: np.ndarray,
+    min_line_height: int = 10,
+    binary: Optional[np.ndarray] = None
+) -> List[Tuple[int, int, np.ndarray]]:
+    """
+    Detect text lines with improved algorithm
 
-def detect_lines(image: np.ndarray, min_line_height: int = 10) -> List[Tuple[int, int, np.ndarray]]:
-    """Detect text lines with improved algorithm"""
-    binary = preprocess_image(image)
+    If ``binary`` is given it is used as the preprocessed version of ``image``
+    (e.g. a slice of the sheet-level binary) and preprocessing is skipped.
+    """
+    if binary is None:
+        binary = preprocess_image(image)
     
     # Horizontal projection with smoothing
     h_projection = np.sum(binary == 0, axis=1)
@@ -149,23 +134,32 @@ def perform_ocr_batch(images: List[Image.Image]) -> List[str]:
     if ocr_processor is None or ocr_model is None:
         raise RuntimeError("OCR model not initialized. Call initialize_ocr_model() first.")
     
-    pixel_values = ocr_processor(images=images, return_tensors="pt").pixel_values
-    pixel_values = pixel_values.to(device)
-    
-    with torch.no_grad():
-        generated_ids = ocr_model.generate(pixel_values, max_length=64)
+    OCR_BATCH_SIZE.set(len(images))
+    with span('ocr_generate'):
+        pixel_values = ocr_processor(images=images, return_tensors="pt").pixel_values
+        pixel_values = pixel_values.to(device)
+        
+        with torch.no_grad():
+            generated_ids = ocr_model.generate(pixel_values, max_length=64)
     
     texts = ocr_processor.batch_decode(generated_ids, skip_special_tokens=True)
     return texts
 
 
-def perform_ocr_advanced(image: Image.Image, batch_size: int = 8) -> dict:
+@timed('ocr')
+def perform_ocr_advanced(
+    image: Image.Image,
+    batch_size: int = 8,
+    binary: Optional[np.ndarray] = None
+) -> dict:
     """
     Perform OCR with line/word detection and detailed logging
     
     Args:
         image: PIL Image to process
         batch_size: Number of words to process in each batch
+        binary: Optional preprocessed binary of the same region, usually sliced
+            from the sheet-level binary so the page is preprocessed only once
         
     Returns:
         dict with keys: text, lines, words, method, word_details
@@ -174,13 +168,17 @@ def perform_ocr_advanced(image: Image.Image, batch_size: int = 8) -> dict:
     
     logger.info(f"Processing image of size: {img_array.shape}")
     
+    if binary is None:
+        with span('ocr_preprocess'):
+            binary = preprocess_image(img_array)
+    
     # Detect lines
-    lines = detect_lines(img_array)
+    with span('ocr_segment'):
+        lines = detect_lines(img_array, binary=binary)
     
     if len(lines) == 0:
         logger.warning("No lines detected, processing full image")
-        preprocessed = preprocess_image(img_array)
-        pil_img = resize_for_model(preprocessed)
+        pil_img = resize_for_model(binary)
         result = perform_ocr_batch([pil_img])
         return {
             "text": result[0] if result else "",
@@ -198,7 +196,8 @@ def perform_ocr_advanced(image: Image.Image, batch_size: int = 8) -> dict:
         logger.info(f"Processing line {line_idx + 1}/{len(lines)}")
         
         # Detect words in line
-        words = detect_words(line_img)
+        with span('ocr_segment'):
+            words = detect_words(line_img)
         logger.info(f"  Found {len(words)} words in line {line_idx + 1}")
         
         if len(words) == 0:
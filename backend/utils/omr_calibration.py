@@ -0,0 +1,57 @@
+# utils/omr_calibration.py - Per-exam bubble threshold learned from graded sheets
+#
+# Every sheet fits its own marked/unmarked threshold (OMRDetector.calibrate).
+# Sheets whose fit holds feed a running mean per exam, which later sheets of
+# the same exam fall back to when their own fills don't separate (a nearly
+# blank sheet, very faint pencil). The mean is kept in memory and saved on
+# the exam document as omr_calibration every few sheets, so it survives a
+# restart without a write per graded paper.
+
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FIELD = 'omr_calibration'
+# 'sheet': fit every sheet, fall back to the exam's threshold; 'off': fixed threshold
+CALIBRATION_MODE = os.getenv("OMR_CALIBRATION", "sheet")
+PERSIST_EVERY = 10
+
+_calibrations: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+
+def exam_threshold(exam_id: str, exam_data: Dict) -> Optional[float]:
+    """The exam's learned threshold, if any sheet has been calibrated yet"""
+    with _lock:
+        calibration = _calibrations.get(exam_id)
+        if calibration is None and exam_data.get(CALIBRATION_FIELD):
+            calibration = _calibrations[exam_id] = dict(exam_data[CALIBRATION_FIELD])
+    return calibration['threshold'] if calibration else None
+
+
+def record_sheet_calibration(db, exam_id: str, sheet: Optional[Dict]):
+    """
+    Fold one sheet's fitted threshold into the exam's running mean.
+
+    Only sheets whose own fit held (source 'sheet') count.
+    """
+    if not sheet or sheet.get('source') != 'sheet':
+        return
+
+    with _lock:
+        calibration = _calibrations.setdefault(exam_id, {'threshold': 0.0, 'sheets': 0})
+        n = calibration['sheets'] + 1
+        calibration['threshold'] = round(calibration['threshold'] + (sheet['threshold'] - calibration['threshold']) / n, 4)
+        calibration['sheets'] = n
+        snapshot = dict(calibration) if n == 1 or n % PERSIST_EVERY == 0 else None
+
+    if snapshot is not None:
+        snapshot['updated_at'] = datetime.utcnow().isoformat()
+        try:
+            db.collection('exams').document(exam_id).update({CALIBRATION_FIELD: snapshot})
+        except Exception:
+            logger.exception(f"Could not save OMR calibration for exam {exam_id}")
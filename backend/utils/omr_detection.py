@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import timed
 
 class OMRDetector:
     """
@@ -84,6 +86,74 @@ class OMRDetector:
         
         return bubbles
     
+    def sample_bubbles(self, image: np.ndarray, centers: List[List[Tuple[int, int]]], radius: int) -> List[List[Dict]]:
+        """
+        Measure bubbles at known positions instead of looking for them.
+        
+        For sheets printed from a layout (utils/answer_sheet.py) the bubble
+        centers are known, so each fill is read from a disk of ``radius``
+        at its center: no contour search, and a faint or smudged bubble
+        can't go missing or shift the grid.
+        
+        Args:
+            centers: per question, the (x, y) center of each option in image pixels
+        
+        Returns:
+            per question, one bubble dict per option (detect_bubbles format)
+        """
+        thresh = self.preprocess_image(image)
+        height, width = thresh.shape
+        disk = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+        cv2.circle(disk, (radius, radius), radius, 1, -1)
+        padded = cv2.copyMakeBorder(thresh, radius, radius, radius, radius, cv2.BORDER_CONSTANT, value=0)
+        
+        rows = []
+        for question in centers:
+            row = []
+            for x, y in question:
+                x, y = int(round(x)), int(round(y))
+                if not (0 <= x < width and 0 <= y < height):
+                    row.append(None)
+                    continue
+                patch = padded[y:y + 2 * radius + 1, x:x + 2 * radius + 1]
+                filled_ratio = np.count_nonzero(patch[disk > 0]) / np.count_nonzero(disk)
+                row.append({
+                    'center': (x, y),
+                    'radius': radius,
+                    'area': float(np.pi * radius * radius),
+                    'filled_ratio': filled_ratio,
+                    'is_marked': filled_ratio >= self.bubble_threshold
+                })
+            rows.append(row)
+        return rows
+    
+    def calibrate(self, bubbles: List[Dict], prior: Optional[float] = None) -> Dict:
+        """
+        Pick the marked/unmarked threshold for this sheet from its own fills.
+        
+        Otsu on the bubbles' filled ratios finds the split between paper and
+        pencil. If the sheet doesn't show two clear groups (few marks, or
+        marks barely darker than the paper) ``prior`` is used instead,
+        then the configured threshold. ``is_marked`` of the bubbles and
+        ``self.bubble_threshold`` are updated in place.
+        
+        Returns:
+            dict with threshold, source ('sheet', 'exam' or 'default'),
+            and the fitted unmarked/marked means when the sheet fit held
+        """
+        fit = fit_fill_threshold([b['filled_ratio'] for b in bubbles])
+        if fit is not None:
+            calibration = {**fit, 'source': 'sheet'}
+        elif prior is not None:
+            calibration = {'threshold': prior, 'source': 'exam'}
+        else:
+            calibration = {'threshold': self.bubble_threshold, 'source': 'default'}
+        
+        self.bubble_threshold = calibration['threshold']
+        for bubble in bubbles:
+            bubble['is_marked'] = bubble['filled_ratio'] >= self.bubble_threshold
+        return calibration
+    
     def _calculate_circularity(self, contour, area):
         """Calculate how circular a contour is (1.0 = perfect circle)"""
         perimeter = cv2.arcLength(contour, True)
@@ -97,7 +167,8 @@ class OMRDetector:
         image: np.ndarray,
         num_questions: int,
         options_per_question: int = 4,
-        grid_config: Dict = None
+        grid_config: Dict = None,
+        bubbles: List[Dict] = None
     ) -> Dict[str, str]:
         """
         Detect answers in a grid layout (standard OMR sheet)
@@ -107,10 +178,29 @@ class OMRDetector:
             num_questions: Number of questions
             options_per_question: Number of options (A, B, C, D, etc.)
             grid_config: Optional dict with 'top', 'left', 'width', 'height' to crop region
+            bubbles: detect_bubbles output for this image, if already computed
         
         Returns:
             Dict mapping question_id to selected answer (e.g., {'1': 'B', '2': 'A'})
         """
+        return self.read_grid(image, num_questions, options_per_question, grid_config, bubbles)['answers']
+    
+    @timed('omr_grid_answers')
+    def read_grid(
+        self,
+        image: np.ndarray,
+        num_questions: int,
+        options_per_question: int = 4,
+        grid_config: Dict = None,
+        bubbles: List[Dict] = None
+    ) -> Dict[str, Dict[str, object]]:
+        """
+        detect_grid_answers, plus how sure each answer is.
+        
+        Returns:
+            dict with answers ({'1': 'B', '2': 'BLANK', ...}) and confidence
+            ({'1': 0.97, ...}, 0-1, see _row_confidence)
+        """
         # Crop to grid region if specified
         if grid_config:
             y1, y2 = grid_config['top'], grid_config['top'] + grid_config['height']
@@ -118,27 +208,46 @@ class OMRDetector:
             image = image[y1:y2, x1:x2]
         
         # Detect all bubbles
-        bubbles = self.detect_bubbles(image)
+        if bubbles is None:
+            bubbles = self.detect_bubbles(image)
         
-        # Sort bubbles by position (top to bottom, left to right)
-        bubbles = sorted(bubbles, key=lambda b: (b['center'][1], b['center'][0]))
+        # Fit the bubble grid (rows x option columns, possibly several
+        # column blocks); fall back to equal y-bands if it doesn't fit
+        rows = self._fit_grid(bubbles, num_questions, options_per_question)
+        fitted = rows is not None
+        if not fitted:
+            bubbles = sorted(bubbles, key=lambda b: (b['center'][1], b['center'][0]))
+            rows = self._group_into_rows(bubbles, num_questions)
         
-        # Group bubbles into rows (questions)
-        rows = self._group_into_rows(bubbles, num_questions)
+        return self.read_rows(rows, options_per_question, fitted)
+    
+    def read_rows(self, rows: List[List[Optional[Dict]]], options_per_question: int, fitted: bool = True) -> Dict[str, Dict[str, object]]:
+        """
+        Answers and confidence from bubbles already grouped into question
+        rows (one slot per option, None where a bubble is missing).
         
+        Args:
+            fitted: False for equal-band rows, which halves the confidence
+        """
         # Extract answers
         answers = {}
+        confidence = {}
         option_labels = ['A', 'B', 'C', 'D', 'E', 'F'][:options_per_question]
         
         for question_idx, row in enumerate(rows):
             question_id = str(question_idx + 1)
             
-            # Find marked bubble in this row
-            marked = [b for b in row if b['is_marked']]
+            # Find marked bubble in this row (slots may be None where the
+            # grid fitter found no bubble)
+            marked = [i for i, b in enumerate(row) if b is not None and b['is_marked']]
+            confidence[question_id] = self._row_confidence(row, len(marked), options_per_question)
+            if not fitted:
+                # Equal-band rows may hold bubbles of a neighbouring question
+                confidence[question_id] = round(confidence[question_id] * 0.5, 3)
             
             if len(marked) == 1:
                 # Find which option (A, B, C, D) is marked
-                bubble_idx = row.index(marked[0])
+                bubble_idx = marked[0]
                 if bubble_idx < len(option_labels):
                     answers[question_id] = option_labels[bubble_idx]
             elif len(marked) > 1:
@@ -148,8 +257,123 @@ class OMRDetector:
                 # No bubble marked
                 answers[question_id] = "BLANK"
         
-        return answers
+        return {'answers': answers, 'confidence': confidence}
     
+    def _row_confidence(self, row: List[Optional[Dict]], num_marked: int, options_per_question: int) -> float:
+        """
+        How clearly a row's fills support its reading, 0 (coin flip) to 1.
+        
+        The row's background is its median fill. With marks, confidence is
+        the gap between the weakest marked and the strongest unmarked fill
+        (the top two for a single answer) relative to the darkest fill's
+        height above background; for a blank row, it's how far the darkest
+        fill stays below the threshold, relative to the same background.
+        Bubbles the grid fitter couldn't find scale it down.
+        """
+        fills = sorted((b['filled_ratio'] for b in row if b is not None), reverse=True)
+        if len(fills) < 2:
+            return 0.0
+        background = float(np.median(fills))
+        
+        if num_marked:
+            weakest = fills[num_marked - 1]
+            strongest_unmarked = fills[num_marked] if num_marked < len(fills) else background
+            margin = (weakest - strongest_unmarked) / max(fills[0] - background, 1e-6)
+        else:
+            margin = (self.bubble_threshold - fills[0]) / max(self.bubble_threshold - background, 1e-6)
+        
+        found = min(len(fills) / options_per_question, 1.0)
+        return round(float(np.clip(margin, 0.0, 1.0)) * found, 3)
+    
+    def _fit_grid(
+        self,
+        bubbles: List[Dict],
+        num_questions: int,
+        options_per_question: int
+    ) -> Optional[List[List[Optional[Dict]]]]:
+        """
+        Assign bubbles to (question, option) by clustering their centers on
+        each axis.
+
+        Option columns are found by splitting the sorted x coordinates at
+        gaps wider than a bubble radius, and grouped into answer blocks of
+        ``options_per_question`` columns (blocks are read left to right,
+        questions run down each block). Rows are clustered the same way on y
+        within each block and snapped to the common row pitch, so a row
+        with no detected bubbles still takes its place. Sorting dominates:
+        O(n log n) in the number of bubbles.
+
+        Returns:
+            One list of ``options_per_question`` slots (bubble or None) per
+            question, or None if the bubbles don't form such a grid
+        """
+        if len(bubbles) < options_per_question:
+            return None
+
+        # Stray marks and text rarely match the printed bubble size
+        radius = float(np.median([b['radius'] for b in bubbles]))
+        bubbles = [b for b in bubbles if 0.6 * radius <= b['radius'] <= 1.5 * radius]
+        gap = max(radius, 2.0)
+
+        # Option columns: 1-D clustering of x, dropping sparse clusters
+        columns = _cluster_1d(bubbles, 0, gap)
+        typical = np.median([len(c) for c in columns])
+        columns = [c for c in columns if len(c) >= 0.3 * typical]
+        if not columns or len(columns) % options_per_question:
+            return None
+        column_x = [float(np.mean([b['center'][0] for b in c])) for c in columns]
+
+        # Answer blocks: consecutive columns, cut at the wide gaps between blocks
+        pitches = np.diff(column_x)
+        if len(columns) > options_per_question:
+            pitch = float(np.median(pitches))
+            cuts = [i + 1 for i, d in enumerate(pitches) if d > 1.5 * pitch]
+            if len(cuts) != len(columns) // options_per_question - 1 or \
+                    any((b - a) != options_per_question for a, b in zip([0] + cuts, cuts + [len(columns)])):
+                return None
+
+        blocks = []
+        for start in range(0, len(columns), options_per_question):
+            block_columns = column_x[start:start + options_per_question]
+            members = [b for c in columns[start:start + options_per_question] for b in c]
+            rows = _cluster_1d(members, 1, gap)
+            blocks.append((block_columns, rows))
+
+        # Row pitch shared by all blocks; blocks start on the same line
+        row_y = [[float(np.mean([b['center'][1] for b in r])) for r in rows] for _, rows in blocks]
+        steps = [d for ys in row_y for d in np.diff(ys)]
+        row_pitch = float(np.median(steps)) if steps else None
+        top = min(ys[0] for ys in row_y if ys)
+
+        block_grids: List[List[List[Optional[Dict]]]] = []
+        for (block_columns, rows), ys in zip(blocks, row_y):
+            block_grid: List[List[Optional[Dict]]] = []
+            for row, y in zip(rows, ys):
+                index = int(round((y - top) / row_pitch)) if row_pitch else len(block_grid)
+                # A row split in two by skew lands on the same index again
+                block_grid.extend([None] * options_per_question for _ in range(index + 1 - len(block_grid)))
+                slots = block_grid[index]
+                for bubble in row:
+                    distances = [abs(bubble['center'][0] - x) for x in block_columns]
+                    option = int(np.argmin(distances))
+                    current = slots[option]
+                    if current is None or distances[option] < abs(current['center'][0] - block_columns[option]):
+                        slots[option] = bubble
+            block_grids.append(block_grid)
+
+        # Every block but the last is as long as the longest one
+        block_length = max(len(g) for g in block_grids)
+        grid: List[List[Optional[Dict]]] = []
+        for block_grid in block_grids[:-1]:
+            grid.extend(block_grid + [[None] * options_per_question for _ in range(block_length - len(block_grid))])
+        grid.extend(block_grids[-1])
+
+        # More rows than questions means text or marks formed extra rows
+        if len(grid) > num_questions:
+            return None
+        grid.extend([None] * options_per_question for _ in range(num_questions - len(grid)))
+        return grid
+
     def _group_into_rows(self, bubbles: List[Dict], num_questions: int) -> List[List[Dict]]:
         """Group bubbles into rows (questions)"""
         if not bubbles:
@@ -208,34 +432,54 @@ class OMRDetector:
         return vis
 
 
-# Usage example
-if __name__ == "__main__":
-    # Load test image
-    image = cv2.imread("test_sheet.jpg")
-    
-    # Initialize detector
-    detector = OMRDetector(bubble_threshold=0.7)
-    
-    # Method 1: Detect all bubbles
-    bubbles = detector.detect_bubbles(image)
-    print(f"Detected {len(bubbles)} bubbles")
+# Sheet-level threshold fit: at least this many bubbles, marked and unmarked
+# means this far apart, and the threshold kept inside this band
+MIN_CALIBRATION_BUBBLES = 10
+MIN_FILL_SEPARATION = 0.2
+THRESHOLD_RANGE = (0.4, 0.9)
+
+
+def fit_fill_threshold(fills: List[float]) -> Optional[Dict]:
+    """
+    Otsu's threshold on filled ratios (0-1).
     
-    # Method 2: Detect answers in grid format
-    answers = detector.detect_grid_answers(
-        image,
-        num_questions=20,
-        options_per_question=4,
-        grid_config={
-            'top': 100,
-            'left': 50,
-            'width': 600,
-            'height': 800
-        }
-    )
+    Returns:
+        {threshold, unmarked_mean, marked_mean}, or None when the fills
+        don't split into two well separated groups
+    """
+    if len(fills) < MIN_CALIBRATION_BUBBLES:
+        return None
+    values = np.sort(np.asarray(fills, dtype=float))
     
-    print("Detected answers:", answers)
+    # Between-class variance for every cut between consecutive sorted values
+    n = len(values)
+    counts = np.arange(1, n)
+    sums = np.cumsum(values)[:-1]
+    mean_low = sums / counts
+    mean_high = (values.sum() - sums) / (n - counts)
+    between = counts * (n - counts) * (mean_high - mean_low) ** 2
+    cut = int(np.argmax(between))
     
-    # Visualize
-    vis = detector.visualize_detection(image, bubbles, "detection_result.jpg")
-    cv2.imshow("OMR Detection", vis)
-    cv2.waitKey(0)
\ No newline at end of file
+    unmarked, marked = float(mean_low[cut]), float(mean_high[cut])
+    if marked - unmarked < MIN_FILL_SEPARATION:
+        return None
+    threshold = float(np.clip((values[cut] + values[cut + 1]) / 2, *THRESHOLD_RANGE))
+    return {
+        'threshold': round(threshold, 4),
+        'unmarked_mean': round(unmarked, 4),
+        'marked_mean': round(marked, 4)
+    }
+
+
+def _cluster_1d(bubbles: List[Dict], axis: int, gap: float) -> List[List[Dict]]:
+    """Split bubbles into groups where sorted centers on ``axis`` jump by more than ``gap``"""
+    ordered = sorted(bubbles, key=lambda b: b['center'][axis])
+    groups: List[List[Dict]] = []
+    previous = None
+    for bubble in ordered:
+        value = bubble['center'][axis]
+        if previous is None or value - previous > gap:
+            groups.append([])
+        groups[-1].append(bubble)
+        previous = value
+    return groups
@@ -0,0 +1,81 @@
+# utils/renditions.py - Downscaled copies of submission photos, cached on disk
+
+import os
+import uuid
+from typing import Dict, Optional
+
+import cv2
+from PIL import Image
+
+RENDITION_DIR = "uploads/renditions"
+
+# Target width per rendition; 'full' is the original upload
+RENDITION_WIDTHS: Dict[str, Optional[int]] = {
+    'thumb': 240,
+    'review': 1275,
+    'full': None
+}
+JPEG_QUALITY = {'thumb': 75, 'review': 85}
+
+
+def resize_to_width(img, width: int):
+    """Downscale keeping the aspect ratio (never upscales)"""
+    height, src_width = img.shape[:2]
+    if src_width <= width:
+        return img
+    new_height = max(1, round(height * width / src_width))
+    return cv2.resize(img, (width, new_height), interpolation=cv2.INTER_AREA)
+
+
+def _read_reduced(image_path: str, src_width: int, width: int):
+    """
+    Decode at 1/2, 1/4 or 1/8 scale when that still covers ``width``; the
+    JPEG decoder skips most of the work for a large phone photo.
+    """
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if src_width // factor >= width:
+            return cv2.imread(image_path, flag)
+    return cv2.imread(image_path)
+
+
+def rendition_path(image_path: str, size: str, cache_dir: str = RENDITION_DIR) -> str:
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(cache_dir, f"{name}_{size}.jpg")
+
+
+def ensure_rendition(image_path: str, size: str, cache_dir: str = RENDITION_DIR) -> str:
+    """
+    Path of the ``size`` rendition of ``image_path``, rendering it on first
+    use. A cached copy older than the source is rendered again.
+    """
+    width = RENDITION_WIDTHS[size]
+    if width is None:
+        return image_path
+
+    # Header only; a photo no wider than the rendition is served as is
+    with Image.open(image_path) as header:
+        src_width = header.size[0]
+    if src_width <= width:
+        return image_path
+
+    path = rendition_path(image_path, size, cache_dir)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(image_path):
+        return path
+
+    img = _read_reduced(image_path, src_width, width)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp.jpg"
+    cv2.imwrite(tmp_path, resize_to_width(img, width), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY[size]])
+    # Atomic so concurrent requests never serve a half-written file
+    os.replace(tmp_path, path)
+    return path
+
+
+def etag_for(path: str) -> str:
+    stat = os.stat(path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
@@ -0,0 +1,72 @@
+# utils/scoring.py - Vectorized MCQ scoring
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+OPTION_LABELS = ['A', 'B', 'C', 'D', 'E', 'F']
+
+# Codes for non-option answers in the encoded matrix
+BLANK = -1
+MULTIPLE = -2
+UNKNOWN = -3
+
+# Display strings stored in submission results for the special answers
+DISPLAY = {"BLANK": "No answer", "MULTIPLE": "Multiple answers marked"}
+
+
+def encode_answer(answer: str) -> int:
+    """Map an OMR answer ('A'..'F', 'BLANK', 'MULTIPLE' or a display string) to a code"""
+    if answer in ("BLANK", DISPLAY["BLANK"], None, ""):
+        return BLANK
+    if answer in ("MULTIPLE", DISPLAY["MULTIPLE"]):
+        return MULTIPLE
+    if answer in OPTION_LABELS:
+        return OPTION_LABELS.index(answer)
+    return UNKNOWN
+
+
+def decode_answer(code: int) -> str:
+    """Inverse of encode_answer, returning the raw OMR form"""
+    if code >= 0:
+        return OPTION_LABELS[code]
+    if code == MULTIPLE:
+        return "MULTIPLE"
+    return "BLANK"
+
+
+def display_answer(answer: str) -> str:
+    """What the results list shows for a raw OMR answer"""
+    return DISPLAY.get(answer, answer)
+
+
+def encode_answer_matrix(answer_maps: List[Dict[str, str]], num_questions: int) -> np.ndarray:
+    """
+    Stack per-student OMR answer maps ({'1': 'B', ...}) into a
+    (students x questions) int8 matrix of option codes.
+    """
+    matrix = np.full((len(answer_maps), num_questions), BLANK, dtype=np.int8)
+    for row, answers in enumerate(answer_maps):
+        for q in range(num_questions):
+            matrix[row, q] = encode_answer(answers.get(str(q + 1), "BLANK"))
+    return matrix
+
+
+def score_mcq_matrix(
+    answers: np.ndarray,
+    key: np.ndarray,
+    points: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every student against the key at once.
+
+    Args:
+        answers: (students x questions) option codes
+        key: (questions,) correct option codes
+        points: (questions,) points per question
+
+    Returns:
+        (per-question scores matrix, per-student MCQ totals)
+    """
+    correct = (answers == key[np.newaxis, :]) & (answers >= 0)
+    scores = correct * points[np.newaxis, :]
+    return scores, scores.sum(axis=1)
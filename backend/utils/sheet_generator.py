@@ -0,0 +1,290 @@
+# utils/sheet_generator.py - Synthetic answer sheets with ground truth
+#
+# Renders printable OMR sheets whose regions use the same omr_config format
+# the teacher tool saves ({image_width, image_height, regions: [...]}), fills
+# them like students do, optionally turns them into phone-photo-like images,
+# and writes a truth.json that benchmarks/bench_grading.py reads.
+#
+# Usage (from backend/):
+#   python -m utils.sheet_generator OUT_DIR [--count 1000] [--questions 50]
+#       [--options 5] [--written 2] [--columns N] [--region-per-column]
+#       [--workers N] [--clean] [--no-fiducials] [--seed 0]
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils.answer_sheet import (
+    BUBBLE_RADIUS, OPTION_LABELS, SHEET_SIZE, bubble_config, make_layout, render_template
+)
+from utils.fiducials import fiducial_centers
+
+WORDS = ["answer", "water", "river", "mountain", "city", "energy", "cell", "light",
+         "number", "history", "planet", "forest", "market", "school", "animal", "garden"]
+# Resolution of the lighting gain before it is upsampled to the photo (width, height)
+LIGHTING_GRID = (48, 64)
+# Noise windows are cut from a field this much wider and taller than the photo
+NOISE_PAD = 64
+
+# Per-worker state, see _init_worker and _noise_field
+_worker_layout: Optional[Dict] = None
+_worker_template: Optional[np.ndarray] = None
+_noise_fields: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+def random_answers(num_mcq: int, options: int, rng, blank_rate: float = 0.05, multiple_rate: float = 0.03) -> Dict:
+    """Ground-truth marks in OMR output form: 'A'.., 'BLANK' or 'MULTIPLE'"""
+    answers = {}
+    for q in range(num_mcq):
+        roll = rng.random()
+        if roll < blank_rate:
+            answers[str(q + 1)] = "BLANK"
+        elif roll < blank_rate + multiple_rate:
+            answers[str(q + 1)] = "MULTIPLE"
+        else:
+            answers[str(q + 1)] = OPTION_LABELS[int(rng.integers(options))]
+    return answers
+
+
+def render_sheet(
+    layout: Dict,
+    answers: Dict,
+    written: List[str],
+    rng,
+    darkness: Tuple[float, float] = (0.6, 0.95),
+    template: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Draw the printed sheet (utils/answer_sheet.py) and the student's marks.
+
+    Args:
+        darkness: range of pencil darkness (0 = paper, 1 = black) per mark
+        template: printed sheet to mark, e.g. with a QR (default: render_template(layout))
+    """
+    img = render_template(layout) if template is None else template.copy()
+
+    options = layout['options']
+    for q, centers in enumerate(layout['bubbles']):
+        answer = answers.get(str(q + 1), "BLANK")
+        if answer == "BLANK":
+            marked = []
+        elif answer == "MULTIPLE":
+            marked = list(rng.choice(options, size=2, replace=False))
+        else:
+            marked = [OPTION_LABELS.index(answer)]
+        for o in marked:
+            _pencil_mark(img, centers[o], rng.uniform(*darkness), rng)
+
+    for region, text in zip([r for r in layout['omr_config']['regions'] if r['type'] == 'written'], written):
+        x, y = region['x'], region['y']
+        for i, line in enumerate(_wrap(text, 40)[:3]):
+            cv2.putText(img, line, (x + 25, y + 55 + i * 50), cv2.FONT_HERSHEY_SCRIPT_SIMPLEX,
+                        1.3, (50, 45, 60), 2, cv2.LINE_AA)
+
+    return img
+
+
+def _pencil_mark(img: np.ndarray, center: Tuple[int, int], darkness: float, rng):
+    """Fill a bubble with grainy, slightly uneven graphite strokes"""
+    r = BUBBLE_RADIUS + 2
+    cx, cy = center
+    patch = img[cy - r:cy + r + 1, cx - r:cx + r + 1]
+    mask = np.zeros(patch.shape[:2], dtype=np.uint8)
+    cv2.circle(mask, (r, r), int(round(BUBBLE_RADIUS * rng.uniform(0.8, 1.0))), 255, -1)
+
+    # Parallel strokes at a random angle, each a little lighter or darker
+    angle = rng.uniform(0, np.pi)
+    yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+    stroke = np.sin((xx * np.cos(angle) + yy * np.sin(angle)) * rng.uniform(0.8, 1.4))
+    tone = darkness * (1 - 0.15 * stroke) + rng.normal(0, 0.08, mask.shape)
+    shade = np.clip(255 * (1 - tone), 0, 255)[..., None]
+    patch[mask > 0] = np.minimum(patch, shade.astype(np.uint8))[mask > 0]
+
+
+def _wrap(text: str, max_chars: int) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    return lines + ([current] if current else [])
+
+
+def photograph(
+    sheet: np.ndarray,
+    rng,
+    perspective: float = 0.06,
+    blur: float = 1.5,
+    lighting: float = 0.35,
+    photo_size: Tuple[int, int] = (1512, 2016)
+) -> Tuple[np.ndarray, List[List[float]]]:
+    """
+    Turn a clean sheet into something like a phone photo of it.
+
+    Args:
+        perspective: corner jitter as a fraction of the photo size
+        blur: maximum Gaussian blur sigma
+        lighting: strength of the uneven-lighting gradient and vignette
+
+    Returns:
+        (photo, sheet corners TL, TR, BR, BL in photo pixels)
+    """
+    sheet_h, sheet_w = sheet.shape[:2]
+    photo_w, photo_h = photo_size
+
+    # Sheet fills most of the frame with independently jittered corners
+    fill = rng.uniform(0.78, 0.9)
+    w, h = photo_w * fill, photo_w * fill * sheet_h / sheet_w
+    if h > photo_h * 0.92:
+        h = photo_h * 0.92
+        w = h * sheet_w / sheet_h
+    cx = photo_w / 2 + rng.uniform(-0.03, 0.03) * photo_w
+    cy = photo_h / 2 + rng.uniform(-0.03, 0.03) * photo_h
+    base = np.array([[cx - w / 2, cy - h / 2], [cx + w / 2, cy - h / 2],
+                     [cx + w / 2, cy + h / 2], [cx - w / 2, cy + h / 2]])
+    jitter = rng.uniform(-perspective, perspective, (4, 2)) * [photo_w, photo_h]
+    corners = (base + jitter).astype(np.float32)
+
+    # One resample of the sheet into the frame; everything after stays uint8
+    src = np.float32([[0, 0], [sheet_w - 1, 0], [sheet_w - 1, sheet_h - 1], [0, sheet_h - 1]])
+    matrix = cv2.getPerspectiveTransform(src, corners)
+    desk = np.array(rng.integers(40, 110, 3), dtype=np.uint8)
+    photo = cv2.warpPerspective(sheet, matrix, (photo_w, photo_h), flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=desk.tolist())
+
+    sigma = rng.uniform(0, blur)
+    if sigma > 0.3:
+        photo = cv2.GaussianBlur(photo, (0, 0), sigma)
+
+    # Uneven lighting: a random linear gradient plus a soft vignette. The gain
+    # is smooth, so it's computed on a coarse grid and upsampled
+    xx = np.linspace(-0.5, 0.5, LIGHTING_GRID[0], dtype=np.float32)[None, :]
+    yy = np.linspace(-0.5, 0.5, LIGHTING_GRID[1], dtype=np.float32)[:, None]
+    gx, gy = rng.uniform(-1, 1, 2)
+    gain = 1.0 - lighting * (0.5 * (gx * xx + gy * yy + 0.5) + 0.6 * (xx ** 2 + yy ** 2))
+    gain = cv2.resize(np.repeat(gain[..., None], 3, axis=2), photo_size, interpolation=cv2.INTER_LINEAR)
+    photo = cv2.multiply(photo, gain, dtype=cv2.CV_8U)
+
+    # Sensor noise: a random window of the worker's noise field
+    noise = _noise_field(photo_size)
+    ox, oy = rng.integers(0, NOISE_PAD, 2)
+    photo = cv2.add(photo, noise[oy:oy + photo_h, ox:ox + photo_w], dtype=cv2.CV_8U)
+    return photo, corners.tolist()
+
+
+def _noise_field(photo_size: Tuple[int, int]) -> np.ndarray:
+    """Gaussian pixel noise (sigma 3) a little larger than a photo, drawn once per process"""
+    if photo_size not in _noise_fields:
+        width, height = photo_size
+        noise = np.random.default_rng(photo_size).standard_normal((height + NOISE_PAD, width + NOISE_PAD, 3),
+                                                                 dtype=np.float32)
+        _noise_fields[photo_size] = np.round(noise * 3.0).astype(np.int16)
+    return _noise_fields[photo_size]
+
+
+def _init_worker(layout: Dict):
+    """Render the printed sheet once; every sheet the worker generates marks a copy"""
+    global _worker_layout, _worker_template
+    _worker_layout = layout
+    _worker_template = render_template(layout)
+
+
+def generate_sheet(task: Tuple) -> Tuple[str, Dict]:
+    """Render, distort and save one sheet (runs in a worker set up by _init_worker)"""
+    index, out_dir, seed, clean = task
+    layout = _worker_layout
+    rng = np.random.default_rng(seed)
+    answers = random_answers(layout['num_mcq'], layout['options'], rng)
+    written = [" ".join(rng.choice(WORDS, size=int(rng.integers(2, 7)))) for _ in range(layout['num_written'])]
+
+    img = render_sheet(layout, answers, written, rng, template=_worker_template)
+    truth = {'mcq': answers, 'written': written}
+    if not clean:
+        sheet_size = img.shape[1], img.shape[0]
+        img, truth['corners'] = photograph(img, rng)
+        if layout['omr_config'].get('fiducials'):
+            # Where the marker centers ended up in the photo
+            src = np.float32([[0, 0], [sheet_size[0] - 1, 0], [sheet_size[0] - 1, sheet_size[1] - 1],
+                              [0, sheet_size[1] - 1]])
+            matrix = cv2.getPerspectiveTransform(src, np.float32(truth['corners']))
+            centers = fiducial_centers(sheet_size).reshape(-1, 1, 2)
+            truth['fiducials'] = cv2.perspectiveTransform(centers, matrix).reshape(-1, 2).tolist()
+
+    name = f"sheet_{index:05d}.jpg"
+    cv2.imwrite(os.path.join(out_dir, name), img, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(80, 95))])
+    return name, truth
+
+
+def generate_dataset(
+    out_dir: str,
+    count: int,
+    layout: Dict,
+    workers: Optional[int] = None,
+    clean: bool = False,
+    seed: int = 0
+) -> Dict:
+    """
+    Generate ``count`` sheets into ``out_dir`` in parallel and write
+    truth.json next to them (format read by benchmarks/bench_grading.py).
+
+    Args:
+        clean: save the flat printed sheets instead of photos
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(i, out_dir, seed * 1_000_003 + i, clean) for i in range(count)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(layout,)) as pool:
+        sheets = dict(pool.map(generate_sheet, tasks, chunksize=max(1, count // (4 * (workers or os.cpu_count() or 1)))))
+
+    # Same omr_config the answer-sheet endpoint saves for a printed layout
+    omr_config = {**layout['omr_config'], 'options_per_question': layout['options']}
+    if omr_config.get('fiducials'):
+        omr_config['bubbles'] = bubble_config(layout)
+    truth = {
+        'regions': layout['omr_config']['regions'],
+        'omr_config': omr_config,
+        'num_mcq': layout['num_mcq'],
+        'options_per_question': layout['options'],
+        'target_size': list(SHEET_SIZE),
+        'detect_paper': not clean,
+        'bubbles': layout['bubbles'],
+        'sheets': dict(sorted(sheets.items()))
+    }
+    with open(os.path.join(out_dir, "truth.json"), "w") as f:
+        json.dump(truth, f)
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic answer sheets with ground truth")
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--options", type=int, default=5)
+    parser.add_argument("--written", type=int, default=2)
+    parser.add_argument("--columns", type=int, default=None)
+    parser.add_argument("--region-per-column", action="store_true", help="One MCQ region per bubble column")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--clean", action="store_true", help="Flat printed sheets, no photo distortion")
+    parser.add_argument("--no-fiducials", action="store_true", help="Leave out the corner markers")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    layout = make_layout(args.questions, args.options, args.written, args.columns,
+                         region_per_column=args.region_per_column, fiducials=not args.no_fiducials)
+    start = time.perf_counter()
+    generate_dataset(args.out_dir, args.count, layout, args.workers, args.clean, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"{args.count} sheets in {elapsed:.1f} s ({args.count / elapsed:.0f}/s), "
+          f"{layout['columns']} column(s) -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -137,6 +137,13 @@ export default function TakeExamPage() {
 
       const data = await response.json();
       console.log('Submission response:', data);
+
+      // The upload is stored in the background; wait for the receipt so a
+      // rejected (duplicate) or failed upload isn't shown as submitted
+      const receipt = await waitForReceipt(data.receipt_id, token);
+      if (receipt.status === 'duplicate' || receipt.status === 'failed') {
+        throw new Error(receipt.error || 'Your submission could not be stored');
+      }
       
       setSubmitted(true);
       
@@ -153,6 +160,22 @@ export default function TakeExamPage() {
     }
   };
 
+  const waitForReceipt = async (receiptId, token, attempts = 15) => {
+    let receipt = { status: 'queued' };
+    for (let i = 0; i < attempts && receipt.status === 'queued'; i++) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_API_URL}/api/submissions/receipts/${receiptId}`,
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      if (response.ok) {
+        receipt = await response.json();
+      }
+    }
+    // Still queued: the upload is safely spooled and will be stored
+    return receipt;
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center">
@@ -3,7 +3,7 @@
 import { useState, useEffect } from 'react';
 import { useRouter, useParams } from 'next/navigation';
 import { auth } from '@/lib/firebase';
-import { FileText, CheckCircle, Clock, Eye, Zap, Download, ArrowLeft, Loader2 } from 'lucide-react';
+import { FileText, CheckCircle, Clock, Eye, Zap, Download, ArrowLeft, Loader2, RefreshCw } from 'lucide-react';
 
 export default function ExamSubmissionsPage() {
   const router = useRouter();
@@ -14,6 +14,7 @@ export default function ExamSubmissionsPage() {
   const [submissions, setSubmissions] = useState([]);
   const [loading, setLoading] = useState(true);
   const [grading, setGrading] = useState(false);
+  const [gradingProgress, setGradingProgress] = useState(null);
 
   useEffect(() => {
     loadExamAndSubmissions();
@@ -70,56 +71,88 @@ export default function ExamSubmissionsPage() {
     }
   };
 
-  const handleAutoGradeAll = async () => {
-    const pendingSubmissions = submissions.filter(s => s.status === 'pending');
+  const handleAutoGradeAll = async (includeGraded = false) => {
+    const pendingSubmissions = includeGraded
+      ? submissions
+      : submissions.filter(s => s.status === 'pending');
     
     if (pendingSubmissions.length === 0) {
       alert('No pending submissions to grade');
       return;
     }
     
-    if (!confirm(`Auto-grade ${pendingSubmissions.length} pending submissions?`)) return;
+    const prompt = includeGraded
+      ? `Regrade all ${pendingSubmissions.length} submissions with the current answer key and regions?`
+      : `Auto-grade ${pendingSubmissions.length} pending submissions?`;
+    if (!confirm(prompt)) return;
 
     setGrading(true);
+    setGradingProgress({ completed: 0, total: pendingSubmissions.length });
     try {
       const user = auth.currentUser;
       const token = await user.getIdToken();
-      
-      let successCount = 0;
-      let errorCount = 0;
 
-      for (const submission of pendingSubmissions) {
-        try {
-          const formData = new FormData();
-          formData.append('submission_id', submission.id);
-          
-          const response = await fetch(
-            `${process.env.NEXT_PUBLIC_API_URL}/api/exams/grade-submission`,
-            {
-              method: 'POST',
-              headers: { 'Authorization': `Bearer ${token}` },
-              body: formData
+      // One request for the whole exam; the server streams a progress event per paper
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_API_URL}/api/exams/${examCode}/grade-all?include_graded=${includeGraded}`,
+        {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}` }
+        }
+      );
+
+      if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.detail || 'Failed to start grading');
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let summary = null;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const chunks = buffer.split('\n\n');
+        buffer = chunks.pop();
+
+        for (const chunk of chunks) {
+          const eventLine = chunk.split('\n').find(l => l.startsWith('event: '));
+          const dataLine = chunk.split('\n').find(l => l.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+
+          if (event === 'progress') {
+            setGradingProgress({ completed: data.completed, total: data.total });
+            if (data.status === 'graded') {
+              setSubmissions(prev => prev.map(s =>
+                s.id === data.submission_id
+                  ? { ...s, status: 'graded', score: data.score, percentage: data.percentage }
+                  : s
+              ));
+            } else {
+              console.error(`Failed to grade submission ${data.submission_id}:`, data.error);
             }
-          );
-          
-          if (response.ok) {
-            successCount++;
-          } else {
-            errorCount++;
-            console.error(`Failed to grade submission ${submission.id}`);
+          } else if (event === 'done') {
+            summary = data;
           }
-        } catch (error) {
-          errorCount++;
-          console.error(`Error grading submission ${submission.id}:`, error);
         }
       }
 
-      alert(`Grading complete!\nSuccess: ${successCount}\nErrors: ${errorCount}`);
+      if (summary) {
+        alert(`Grading complete!\nSuccess: ${summary.graded}\nErrors: ${summary.errors}`);
+      }
       loadExamAndSubmissions();
     } catch (error) {
       alert('Error grading submissions: ' + error.message);
     } finally {
       setGrading(false);
+      setGradingProgress(null);
     }
   };
 
@@ -206,12 +239,22 @@ export default function ExamSubmissionsPage() {
           {/* Actions */}
           <div className="flex gap-3">
             <button
-              onClick={handleAutoGradeAll}
+              onClick={() => handleAutoGradeAll(false)}
               disabled={pendingCount === 0 || grading}
               className="flex items-center gap-2 bg-indigo-600 text-white px-6 py-3 rounded-lg font-semibold hover:bg-indigo-700 disabled:bg-gray-400 disabled:cursor-not-allowed"
             >
               {grading ? <Loader2 className="w-5 h-5 animate-spin" /> : <Zap className="w-5 h-5" />}
-              {grading ? 'Grading...' : `Auto-Grade All (${pendingCount})`}
+              {grading
+                ? `Grading... ${gradingProgress ? `${gradingProgress.completed}/${gradingProgress.total}` : ''}`
+                : `Auto-Grade All (${pendingCount})`}
+            </button>
+            <button
+              onClick={() => handleAutoGradeAll(true)}
+              disabled={gradedCount === 0 || grading}
+              className="flex items-center gap-2 bg-white text-indigo-600 border border-indigo-600 px-6 py-3 rounded-lg font-semibold hover:bg-indigo-50 disabled:text-gray-400 disabled:border-gray-300 disabled:cursor-not-allowed"
+            >
+              <RefreshCw className="w-5 h-5" />
+              Regrade All
             </button>
             <button
               className="flex items-center gap-2 bg-green-600 text-white px-6 py-3 rounded-lg font-semibold hover:bg-green-700"
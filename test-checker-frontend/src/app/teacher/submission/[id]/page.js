@@ -51,7 +51,7 @@ export default function SubmissionReviewPage() {
 
     // --- Load submission image as blob ---
     const imgResponse = await fetch(
-      `${process.env.NEXT_PUBLIC_API_URL}/api/submissions/${submissionId}/image`,
+      `${process.env.NEXT_PUBLIC_API_URL}/api/submissions/${submissionId}/image?size=review`,
       {
         headers: { Authorization: `Bearer ${token}` }
       }
@@ -10,7 +10,6 @@ export default function RegionMarkerTool() {
   const [currentRegion, setCurrentRegion] = useState(null);
   const [isDrawing, setIsDrawing] = useState(false);
   const [regionType, setRegionType] = useState('mcq'); // 'mcq' or 'written'
-  const [mcqRegionMarked, setMcqRegionMarked] = useState(false);
   const canvasRef = useRef(null);
   const imageRef = useRef(null);
 
@@ -34,7 +33,6 @@ export default function RegionMarkerTool() {
           imageRef.current = img;
           setImage(e.target.result);
           setRegions([]);
-          setMcqRegionMarked(false);
         };
         img.src = e.target.result;
       };
@@ -53,6 +51,7 @@ export default function RegionMarkerTool() {
     ctx.drawImage(imageRef.current, 0, 0);
 
     // Draw existing regions
+    const mcqTotal = regions.filter(r => r.type === 'mcq').length;
     regions.forEach((region) => {
       ctx.strokeStyle = region.type === 'mcq' ? '#3b82f6' : '#10b981';
       ctx.lineWidth = 3;
@@ -64,7 +63,7 @@ export default function RegionMarkerTool() {
       ctx.fillStyle = 'white';
       ctx.font = 'bold 16px Arial';
       const label = region.type === 'mcq' 
-        ? 'MCQ Section (All)' 
+        ? (mcqTotal > 1 ? `MCQ Block ${region.block}` : 'MCQ Section (All)')
         : `Written Q${region.questionId}`;
       ctx.fillText(label, region.x + 5, region.y - 10);
     });
@@ -121,14 +120,6 @@ export default function RegionMarkerTool() {
     if (!isDrawing || !currentRegion) return;
 
     if (Math.abs(currentRegion.width) > 10 && Math.abs(currentRegion.height) > 10) {
-      // Check if trying to mark MCQ when already marked
-      if (currentRegion.type === 'mcq' && mcqRegionMarked) {
-        alert('MCQ region already marked! You can only mark ONE MCQ region for all multiple choice questions.');
-        setIsDrawing(false);
-        setCurrentRegion(null);
-        return;
-      }
-
       // Normalize negative dimensions
       const normalized = {
         x: currentRegion.width < 0 ? currentRegion.x + currentRegion.width : currentRegion.x,
@@ -139,12 +130,14 @@ export default function RegionMarkerTool() {
         questionId: currentRegion.type === 'mcq' ? 'all' : regions.filter(r => r.type === 'written').length + 1
       };
 
-      setRegions([...regions, normalized]);
-      
       if (normalized.type === 'mcq') {
-        setMcqRegionMarked(true);
-        setRegionType('written'); // Auto-switch to written after MCQ
+        // Each MCQ block can say which questions it holds (blank = split evenly)
+        normalized.block = mcqCount + 1;
+        normalized.questionStart = '';
+        normalized.numQuestions = '';
       }
+
+      setRegions([...regions, normalized]);
     }
 
     setIsDrawing(false);
@@ -152,11 +145,14 @@ export default function RegionMarkerTool() {
   };
 
   const deleteRegion = (index) => {
-    const region = regions[index];
-    if (region.type === 'mcq') {
-      setMcqRegionMarked(false);
-    }
-    setRegions(regions.filter((_, i) => i !== index));
+    let block = 0;
+    setRegions(regions
+      .filter((_, i) => i !== index)
+      .map(r => (r.type === 'mcq' ? { ...r, block: ++block } : r)));
+  };
+
+  const updateMcqRange = (index, field, value) => {
+    setRegions(regions.map((r, i) => (i === index ? { ...r, [field]: value } : r)));
   };
 
   const saveRegions = async () => {
@@ -165,8 +161,8 @@ export default function RegionMarkerTool() {
       return;
     }
 
-    if (!mcqRegionMarked) {
-      alert('Please mark the MCQ region first');
+    if (mcqCount === 0) {
+      alert('Please mark at least one MCQ region');
       return;
     }
 
@@ -174,12 +170,14 @@ export default function RegionMarkerTool() {
       image_width: imageRef.current.width,
       image_height: imageRef.current.height,
       regions: regions.map(r => ({
-        question_id: r.questionId,
+        question_id: r.type === 'mcq' && mcqCount > 1 ? `mcq-${r.block}` : r.questionId,
         type: r.type,
         x: Math.round(r.x),
         y: Math.round(r.y),
         width: Math.round(r.width),
-        height: Math.round(r.height)
+        height: Math.round(r.height),
+        ...(r.type === 'mcq' && r.questionStart !== '' && { question_start: parseInt(r.questionStart, 10) }),
+        ...(r.type === 'mcq' && r.numQuestions !== '' && { num_questions: parseInt(r.numQuestions, 10) })
       }))
     };
 
@@ -213,13 +211,14 @@ export default function RegionMarkerTool() {
   };
 
   const writtenCount = regions.filter(r => r.type === 'written').length;
+  const mcqCount = regions.filter(r => r.type === 'mcq').length;
 
   return (
     <div className="min-h-screen bg-gray-50 p-8">
       <div className="container mx-auto max-w-7xl">
         <div className="bg-white rounded-2xl shadow-lg p-8">
           <h1 className="text-3xl font-bold text-gray-800 mb-2">Answer Region Marker</h1>
-          <p className="text-gray-600 mb-6">Mark ONE region for all MCQ questions, then mark individual regions for written questions</p>
+          <p className="text-gray-600 mb-6">Mark the MCQ bubbles (one region, or one per column block), then mark individual regions for written questions</p>
           
           {!image ? (
             <div className="text-center py-12">
@@ -248,14 +247,13 @@ export default function RegionMarkerTool() {
                     <div className="flex gap-3 mb-3">
                       <button
                         onClick={() => setRegionType('mcq')}
-                        disabled={mcqRegionMarked}
                         className={`flex-1 py-2 px-4 rounded-lg font-semibold ${
-                          regionType === 'mcq' && !mcqRegionMarked
+                          regionType === 'mcq'
                             ? 'bg-blue-600 text-white'
-                            : 'bg-gray-200 text-gray-600'
-                        } ${mcqRegionMarked ? 'opacity-50 cursor-not-allowed' : 'hover:bg-blue-500 hover:text-white'}`}
+                            : 'bg-gray-200 text-gray-600 hover:bg-blue-500 hover:text-white'
+                        }`}
                       >
-                        📝 MCQ Region {mcqRegionMarked && '✓'}
+                        📝 MCQ Region {mcqCount > 0 && `✓ ${mcqCount}`}
                       </button>
                       <button
                         onClick={() => setRegionType('written')}
@@ -270,7 +268,7 @@ export default function RegionMarkerTool() {
                     </div>
                     <div className="flex items-center gap-2 text-sm text-gray-600">
                       <Eye className="w-4 h-4" />
-                      <p>Currently marking: <span className="font-bold">{regionType === 'mcq' ? 'MCQ Section' : `Written Question ${writtenCount + 1}`}</span></p>
+                      <p>Currently marking: <span className="font-bold">{regionType === 'mcq' ? `MCQ Block ${mcqCount + 1}` : `Written Question ${writtenCount + 1}`}</span></p>
                     </div>
                   </div>
                   <div className="overflow-auto max-h-[600px] border-2 border-gray-300 rounded">
@@ -291,7 +289,8 @@ export default function RegionMarkerTool() {
                 <div className="bg-blue-50 rounded-lg p-4">
                   <h3 className="font-bold text-blue-900 mb-2">📋 Instructions</h3>
                   <ol className="text-sm text-blue-800 space-y-2 list-decimal list-inside">
-                    <li><strong>First:</strong> Mark ONE large region covering ALL MCQ bubbles</li>
+                    <li><strong>First:</strong> Mark one region covering ALL MCQ bubbles, or one region per column block for long exams</li>
+                    <li>With several blocks, enter the first question and question count of each (blank = split evenly in order)</li>
                     <li><strong>Then:</strong> Mark each written answer space individually</li>
                     <li>Blue box = MCQ section, Green = Written</li>
                     <li>Click Save when done</li>
@@ -306,8 +305,30 @@ export default function RegionMarkerTool() {
                         region.type === 'mcq' ? 'bg-blue-50' : 'bg-green-50'
                       }`}>
                         <span className="flex-1 font-semibold text-gray-700">
-                          {region.type === 'mcq' ? '📝 MCQ Section' : `✍️ Written Q${region.questionId}`}
+                          {region.type === 'mcq'
+                            ? (mcqCount > 1 ? `📝 MCQ Block ${region.block}` : '📝 MCQ Section')
+                            : `✍️ Written Q${region.questionId}`}
                         </span>
+                        {region.type === 'mcq' && mcqCount > 1 && (
+                          <>
+                            <input
+                              type="number"
+                              min="1"
+                              placeholder="From"
+                              value={region.questionStart}
+                              onChange={(e) => updateMcqRange(idx, 'questionStart', e.target.value)}
+                              className="w-16 px-1 py-0.5 text-sm border rounded"
+                            />
+                            <input
+                              type="number"
+                              min="1"
+                              placeholder="Count"
+                              value={region.numQuestions}
+                              onChange={(e) => updateMcqRange(idx, 'numQuestions', e.target.value)}
+                              className="w-16 px-1 py-0.5 text-sm border rounded"
+                            />
+                          </>
+                        )}
                         <button
                           onClick={() => deleteRegion(idx)}
                           className="p-1 text-red-600 hover:bg-red-100 rounded"
@@ -334,7 +355,6 @@ export default function RegionMarkerTool() {
                   onClick={() => {
                     setImage(null);
                     setRegions([]);
-                    setMcqRegionMarked(false);
                     setRegionType('mcq');
                   }}
                   className="w-full bg-gray-200 text-gray-800 px-6 py-3 rounded-lg font-semibold hover:bg-gray-300"
@@ -25,7 +25,7 @@ export default function PaperScanner({ image, onConfirm, onCancel }) {
     }
   }, [corners]);
 
-  const detectCorners = (img) => {
+  const setDefaultCorners = (img) => {
     const margin = 50;
     const width = img.width;
     const height = img.height;
@@ -38,6 +38,31 @@ export default function PaperScanner({ image, onConfirm, onCancel }) {
     ]);
   };
 
+  const detectCorners = async (img) => {
+    // Start from margin guesses, then snap to the detected paper if the server finds it
+    setDefaultCorners(img);
+
+    try {
+      const blob = await (await fetch(img.src)).blob();
+      const formData = new FormData();
+      formData.append('file', blob, 'scan.jpg');
+
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_API_URL}/api/detect-corners`,
+        { method: 'POST', body: formData }
+      );
+      if (!response.ok) return;
+
+      const data = await response.json();
+      if (!data.detected || imageRef.current !== img) return;
+
+      const labels = ['TL', 'TR', 'BR', 'BL'];
+      setCorners(data.corners.map((c, i) => ({ x: c.x, y: c.y, label: labels[i] })));
+    } catch (error) {
+      console.error('Corner detection failed:', error);
+    }
+  };
+
   const drawCanvas = () => {
     const canvas = canvasRef.current;
     const ctx = canvas.getContext('2d');
@@ -195,7 +220,7 @@ export default function PaperScanner({ image, onConfirm, onCancel }) {
 
   const resetCorners = () => {
     if (imageRef.current) {
-      detectCorners(imageRef.current);
+      setDefaultCorners(imageRef.current);
     }
   };
 